@@ -1,7 +1,21 @@
 # game/__init__.py
-from .game_manager import GameManager
-from .scene_manager import SceneManager
-from .input_manager import InputManager
-from .render_manager import RenderManager
+# 各Managerは使われたときに読み込む(import gameだけではpygameも読み込まない)
+import importlib
+
+_MODULES = {
+    'GameManager': '.game_manager',
+    'SceneManager': '.scene_manager',
+    'InputManager': '.input_manager',
+    'RenderManager': '.render_manager',
+}
 #import constants
-# ... 他のManagerのインポート
\ No newline at end of file
+# ... 他のManagerのインポート
+
+__all__ = list(_MODULES)
+
+def __getattr__(name):
+    if name in _MODULES:
+        value = getattr(importlib.import_module(_MODULES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,207 @@
+"""
+audio_manager.py - 効果音と音楽の管理
+
+- SoundBank: 効果音は名前ごとに1回だけデコードして持っておく(インスタンスごとにSoundを作らない)
+- AudioManager: 決まった数のチャンネルを使い回す
+  - 空いているチャンネルがなければ、優先度が低い(同じなら古い)音を止めて鳴らす(voice stealing)
+  - 音ごとに最短間隔(min_interval)と同時に鳴らせる数(max_instances)を決めて、鳴らしすぎを防ぐ
+- 音楽はpygame.mixer.musicでファイルから少しずつ読む(全部をメモリにデコードしない)
+- memory_report(): アセットごとのメモリ(効果音はデコード後のバイト数、音楽はファイルのサイズ)
+"""
+
+import os
+import time
+import pygame
+from typing import Callable, Dict, List, Optional, Tuple
+from .resource_manager import ASSET_DIR
+
+class SoundEntry():
+    def __init__(self, name: str, sound: pygame.mixer.Sound, volume: float, priority: int,
+                 min_interval: float, max_instances: int) -> None:
+        self.name = name
+        self.sound = sound
+        self.volume = volume
+        self.priority = priority          # 大きいほど止められにくい
+        self.min_interval = min_interval  # この秒数以内に続けて鳴らさない
+        self.max_instances = max_instances
+        self.last_played = -float('inf')
+        self.bytes = decoded_size(sound)
+
+def decoded_size(sound: pygame.mixer.Sound) -> int:
+    """デコードされたPCMのバイト数(ミキサーの形式で持っている)"""
+    frequency, size, channels = pygame.mixer.get_init()
+    return int(round(sound.get_length() * frequency)) * channels * (abs(size) // 8)
+
+class SoundBank():
+    def __init__(self, asset_dir: str = ASSET_DIR) -> None:
+        self.asset_dir = asset_dir
+        self.entries: Dict[str, SoundEntry] = {}
+
+    def path(self, name: str) -> str:
+        return name if os.path.isabs(name) else os.path.join(self.asset_dir, name)
+
+    def load(self, name: str, path: Optional[str] = None, volume: float = 1.0, priority: int = 0,
+             min_interval: float = 0.0, max_instances: int = 4) -> SoundEntry:
+        """pathの音をnameで登録する。同じnameは2回目からデコードしない"""
+        entry = self.entries.get(name)
+        if entry is None:
+            entry = self.add(name, pygame.mixer.Sound(self.path(path or name)), volume, priority,
+                             min_interval, max_instances)
+        return entry
+
+    def add(self, name: str, sound: pygame.mixer.Sound, volume: float = 1.0, priority: int = 0,
+            min_interval: float = 0.0, max_instances: int = 4) -> SoundEntry:
+        entry = SoundEntry(name, sound, volume, priority, min_interval, max_instances)
+        self.entries[name] = entry
+        return entry
+
+    def get(self, name: str) -> SoundEntry:
+        return self.entries[name]
+
+    def unload(self, name: str) -> None:
+        self.entries.pop(name, None)
+
+    def total_bytes(self) -> int:
+        return sum(entry.bytes for entry in self.entries.values())
+
+class AudioManager():
+    def __init__(self, channels: int = 16, asset_dir: str = ASSET_DIR,
+                 clock: Callable[[], float] = time.perf_counter) -> None:
+        self.clock = clock  # 間隔の判定に使う時刻(シミュレーション時間を渡してもいい)
+        self.bank = SoundBank(asset_dir)
+        self.music_path: Optional[str] = None
+        self.stats = {'played': 0, 'limited': 0, 'stolen': 0, 'dropped': 0}
+        # ミキサーは呼び出し側がメインスレッドで初期化しておく(warmupスレッドで作られることがあるため)
+        # 初期化されていない・音が出せない環境では何もしない
+        self.enabled = pygame.mixer.get_init() is not None
+        self.channels: List[pygame.mixer.Channel] = []
+        # チャンネルごとに今鳴っている音 (名前, 優先度, 鳴らした時刻)
+        self.voices: List[Optional[Tuple[str, int, float]]] = []
+        if self.enabled:
+            pygame.mixer.set_num_channels(channels)
+            self.channels = [pygame.mixer.Channel(i) for i in range(channels)]
+            self.voices = [None] * channels
+
+    def load(self, name: str, path: Optional[str] = None, **options) -> Optional[SoundEntry]:
+        if not self.enabled:
+            return None
+        return self.bank.load(name, path, **options)
+
+    def pick_channel(self, entry: SoundEntry, priority: int) -> Optional[int]:
+        """鳴らすチャンネルの番号。止める音があれば止める。鳴らせなければNone"""
+        free = None
+        same = []
+        for index, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                self.voices[index] = None
+                if free is None:
+                    free = index
+            elif self.voices[index] is not None and self.voices[index][0] == entry.name:
+                same.append(index)
+        # 同じ音が多すぎるときは一番古いものを止めて鳴らし直す
+        if len(same) >= entry.max_instances:
+            index = min(same, key=lambda i: self.voices[i][2])
+        elif free is not None:
+            return free
+        else:
+            index = min(range(len(self.channels)),
+                        key=lambda i: (self.voices[i][1], self.voices[i][2]) if self.voices[i] else (-1, 0.0))
+            if self.voices[index] is not None and self.voices[index][1] > priority:
+                return None
+        self.channels[index].stop()
+        self.stats['stolen'] += 1
+        return index
+
+    def play(self, name: str, volume: Optional[float] = None, priority: Optional[int] = None,
+             loops: int = 0) -> Optional[pygame.mixer.Channel]:
+        if not self.enabled:
+            return None
+        entry = self.bank.get(name)
+        now = self.clock()
+        if now - entry.last_played < entry.min_interval:
+            self.stats['limited'] += 1
+            return None
+        priority = entry.priority if priority is None else priority
+        index = self.pick_channel(entry, priority)
+        if index is None:
+            self.stats['dropped'] += 1
+            return None
+        channel = self.channels[index]
+        channel.set_volume(entry.volume if volume is None else volume)
+        channel.play(entry.sound, loops=loops)
+        self.voices[index] = (name, priority, now)
+        entry.last_played = now
+        self.stats['played'] += 1
+        return channel
+
+    def stop_all(self) -> None:
+        for index, channel in enumerate(self.channels):
+            channel.stop()
+            self.voices[index] = None
+
+    def play_music(self, path: str, volume: float = 1.0, loops: int = -1, fade_ms: int = 0) -> None:
+        """音楽はファイルから流す(デコード済みの全体はメモリに持たない)"""
+        if not self.enabled:
+            return
+        path = self.bank.path(path)
+        if path != self.music_path:
+            pygame.mixer.music.load(path)
+            self.music_path = path
+        pygame.mixer.music.set_volume(volume)
+        pygame.mixer.music.play(loops, fade_ms=fade_ms)
+
+    def stop_music(self, fade_ms: int = 0) -> None:
+        if not self.enabled:
+            return
+        if fade_ms:
+            pygame.mixer.music.fadeout(fade_ms)
+        else:
+            pygame.mixer.music.stop()
+
+    def memory_report(self) -> Dict[str, Dict]:
+        report = {name: {'kind': 'sound', 'bytes': entry.bytes, 'seconds': entry.sound.get_length()}
+                  for name, entry in self.bank.entries.items()}
+        if self.music_path is not None:
+            report[os.path.basename(self.music_path)] = {
+                'kind': 'music (streamed)', 'bytes': os.path.getsize(self.music_path), 'seconds': None}
+        return report
+
+def test():
+    import struct
+    import tempfile
+    import wave
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    pygame.mixer.init(44100, -16, 2)
+    now = [0.0]
+    audio = AudioManager(channels=4, clock=lambda: now[0])
+    if not audio.enabled:
+        print('no audio device')
+        return
+    # 0.5秒の音を2つ作る
+    samples = b''.join(struct.pack('<hh', (i * 50) % 3000, (i * 50) % 3000) for i in range(22050))
+    audio.bank.add('jump', pygame.mixer.Sound(buffer=samples), volume=0.5, min_interval=0.25, max_instances=1)
+    audio.bank.add('hit', pygame.mixer.Sound(buffer=samples), priority=1, max_instances=8)
+    audio.bank.add('ui', pygame.mixer.Sound(buffer=samples), priority=5)
+    for frame in range(60):  # キーを押しっぱなしで毎フレーム鳴らしても0.25秒に1回
+        now[0] = frame / 60
+        audio.play('jump')
+    for _ in range(6):
+        audio.play('hit')
+    audio.play('ui')
+    print(audio.stats, [voice[0] if voice else None for voice in audio.voices])
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'music.wav')
+        with wave.open(path, 'wb') as file:
+            file.setnchannels(2)
+            file.setsampwidth(2)
+            file.setframerate(44100)
+            file.writeframes(samples * 4)
+        audio.play_music(path, volume=0.3)
+        for name, info in audio.memory_report().items():
+            print(f"{name:<10} {info['kind']:<17} {info['bytes'] / 1024:8.1f} KB")
+        audio.stop_music()
+        pygame.mixer.music.unload()
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,235 @@
+"""
+auto_battle.py - バックパックバトル用のイベント駆動オートバトル
+
+キャラクターの通常攻撃とアイテムはそれぞれ独立したクールダウンで発動する。
+(時刻, 連番, 陣営, スロット)をヒープに積み、一番早いイベントを取り出して処理し、
+次の発動を積み直す。tickごとのポーリングはしないので、数百回の発動でも
+resolve()1回で決着まで進む。
+結果はログ(時刻順)に残るので、描画側はrun_until()で任意の時刻まで進めたり
+(一時停止・早送り)、events_between()で過去の区間を再生したりできる。
+"""
+
+import heapq
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Tuple
+
+BASE_ATTACK_INTERVAL = 10.0  # 通常攻撃の間隔 = BASE_ATTACK_INTERVAL / speed 秒
+LEFT = 0
+RIGHT = 1
+
+class Character():
+    __slots__ = ('name', 'max_hp', 'hp', 'attack', 'defense', 'speed', 'block')
+
+    def __init__(self, name, hp, attack, defense, speed):
+        self.name = name
+        self.max_hp = hp
+        self.hp = hp
+        self.attack = attack
+        self.defense = defense
+        self.speed = speed
+        self.block = 0
+
+    def take_damage(self, amount):
+        amount = max(amount - self.defense, 0)
+        absorbed = min(self.block, amount)
+        self.block -= absorbed
+        amount -= absorbed
+        self.hp = max(self.hp - amount, 0)
+        return amount
+
+    def is_alive(self):
+        return self.hp > 0
+
+class Trigger():
+    """アイテムの発動効果。cooldown秒ごとにdamage/heal/blockを行う(複数あれば全部)"""
+    __slots__ = ('cooldown', 'damage', 'heal', 'block', 'start')
+
+    def __init__(self, cooldown: float, damage: int = 0, heal: int = 0, block: int = 0, start: Optional[float] = None):
+        if cooldown <= 0:
+            # 同じ時刻に積み直し続けてrun_untilが終わらなくなる
+            raise ValueError(f'cooldown must be positive, got {cooldown}')
+        self.cooldown = cooldown
+        self.damage = damage
+        self.heal = heal
+        self.block = block
+        self.start = cooldown if start is None else start  # 最初の発動時刻
+
+class BattleRecord():
+    __slots__ = ('time', 'side', 'actor', 'source', 'action', 'amount', 'target_hp')
+
+    def __init__(self, time, side, actor, source, action, amount, target_hp):
+        self.time = time
+        self.side = side
+        self.actor = actor
+        self.source = source
+        self.action = action
+        self.amount = amount
+        self.target_hp = target_hp
+
+    def __repr__(self):
+        return f"{self.time:6.2f} {self.actor}:{self.source} {self.action} {self.amount} -> {self.target_hp}"
+
+class AutoBattle():
+    def __init__(self, left: Character, right: Character, left_items=(), right_items=(), max_time: float = 120.0):
+        self.sides = (left, right)
+        # スロット0は通常攻撃、それ以降は発動効果を持つアイテム
+        self.slots: Tuple[List, List] = ([], [])
+        self.queue: List[Tuple[float, int, int, int]] = []
+        self.seq = 0
+        self.time = 0.0
+        self.max_time = max_time
+        self.log: List[BattleRecord] = []
+        self.log_times: List[float] = []
+        for side, (character, items) in enumerate(((left, left_items), (right, right_items))):
+            interval = BASE_ATTACK_INTERVAL / max(character.speed, 1)
+            self.add_slot(side, 'Attack', Trigger(interval))
+            for item in items:
+                if item.trigger is not None:
+                    self.add_slot(side, item.name, item.trigger)
+
+    def add_slot(self, side: int, name: str, trigger: Trigger) -> None:
+        slot = len(self.slots[side])
+        self.slots[side].append((name, trigger))
+        self.push(trigger.start, side, slot)
+
+    def push(self, time: float, side: int, slot: int) -> None:
+        # 同時刻は積んだ順(連番)で処理するので結果は決定的
+        heapq.heappush(self.queue, (time, self.seq, side, slot))
+        self.seq += 1
+
+    def is_over(self) -> bool:
+        return not all(character.is_alive() for character in self.sides) or self.time >= self.max_time \
+            or not self.queue
+
+    def next_time(self) -> Optional[float]:
+        return self.queue[0][0] if self.queue else None
+
+    def step(self) -> Optional[List[BattleRecord]]:
+        """次のイベントを1つ処理する(効果ごとに1件の記録)"""
+        if self.is_over():
+            return None
+        time, _, side, slot = heapq.heappop(self.queue)
+        if time > self.max_time:
+            self.time = self.max_time
+            return None
+        self.time = time
+        actor = self.sides[side]
+        target = self.sides[1 - side]
+        name, trigger = self.slots[side][slot]
+        records = self.apply(side, actor, target, name, trigger, slot)
+        self.log.extend(records)
+        self.log_times.extend([time] * len(records))
+        self.push(time + trigger.cooldown, side, slot)
+        return records
+
+    def apply(self, side: int, actor: Character, target: Character, name: str, trigger: Trigger,
+              slot: int) -> List[BattleRecord]:
+        if slot == 0:
+            amount = target.take_damage(actor.attack)
+            return [BattleRecord(self.time, side, actor.name, name, 'damage', amount, target.hp)]
+        records = []
+        if trigger.damage:
+            amount = target.take_damage(trigger.damage + actor.attack // 2)
+            records.append(BattleRecord(self.time, side, actor.name, name, 'damage', amount, target.hp))
+        if trigger.heal:
+            before = actor.hp
+            actor.hp = min(actor.max_hp, actor.hp + trigger.heal)
+            records.append(BattleRecord(self.time, side, actor.name, name, 'heal', actor.hp - before, actor.hp))
+        if trigger.block or not records:
+            actor.block += trigger.block
+            records.append(BattleRecord(self.time, side, actor.name, name, 'block', trigger.block, actor.hp))
+        return records
+
+    def run_until(self, time: float) -> List[BattleRecord]:
+        """timeまでのイベントを全部処理して、その間に起きたものを返す(描画側の時計に合わせる)"""
+        records = []
+        while not self.is_over() and self.queue[0][0] <= time:
+            step = self.step()
+            if step is None:
+                break
+            records.extend(step)
+        if not self.is_over():
+            self.time = max(self.time, min(time, self.max_time))
+        return records
+
+    def resolve(self) -> Optional[str]:
+        """決着まで一気に進める"""
+        while self.step() is not None:
+            pass
+        return self.result()
+
+    def result(self) -> Optional[str]:
+        left, right = self.sides
+        if not right.is_alive() and left.is_alive():
+            return 'left'
+        if not left.is_alive() and right.is_alive():
+            return 'right'
+        if self.is_over():
+            return 'draw'
+        return None
+
+    def events_between(self, start: float, end: float) -> List[BattleRecord]:
+        """ログから[start, end)の区間を取り出す(リプレイ・巻き戻し用)"""
+        return self.log[bisect_left(self.log_times, start):bisect_left(self.log_times, end)]
+
+    def state_at(self, time: float) -> List[int]:
+        """ログから時刻timeの時点の各陣営のHPを復元する"""
+        hp = [character.max_hp for character in self.sides]
+        for record in self.log[:bisect_right(self.log_times, time)]:
+            if record.action == 'damage':
+                hp[1 - record.side] = record.target_hp
+            elif record.action == 'heal':
+                hp[record.side] = record.target_hp
+        return hp
+
+class BattlePlayback():
+    """描画用の時計。一時停止・早送りしながらAutoBattleを進める"""
+    def __init__(self, battle: AutoBattle, speed: float = 1.0):
+        self.battle = battle
+        self.speed = speed
+        self.paused = False
+        self.clock = 0.0
+
+    def update(self, dt: float) -> List[BattleRecord]:
+        if self.paused:
+            return []
+        self.clock += dt * self.speed
+        return self.battle.run_until(self.clock)
+
+def test():
+    import time
+    from .inventory import Item
+    from .constants import RED, GREEN, BLUE
+
+    dagger = Item("Dagger", (1, 2), RED, {'attack': 2}, trigger=Trigger(0.7, damage=3))
+    potion = Item("Potion", (1, 1), GREEN, {}, trigger=Trigger(4.0, heal=10))
+    shield = Item("Shield", (2, 2), BLUE, {'defense': 3}, trigger=Trigger(2.5, block=6))
+    battle = AutoBattle(Character("Player", 100, 10, 5, 10), Character("Enemy", 80, 15, 3, 8),
+                        [dagger, potion], [shield])
+    playback = BattlePlayback(battle, speed=4.0)
+    for _ in range(30):
+        playback.update(1 / 60)
+    print(f'after 0.5s x4: t={battle.time:.2f}, {len(battle.log)} events')
+    print(f'result: {battle.resolve()} at {battle.time:.2f}s, {len(battle.log)} events')
+    print(battle.events_between(0.0, 2.0))
+    print(battle.state_at(5.0))
+
+    # 複数の効果を持つ発動は全部適用して、効果ごとに記録する
+    vampire = Item("Vampire", (1, 1), RED, {}, trigger=Trigger(1.0, damage=4, heal=4, block=2))
+    battle = AutoBattle(Character("Player", 100, 0, 0, 1), Character("Enemy", 100, 0, 0, 1), [vampire])
+    print(battle.run_until(1.0))
+    try:
+        Trigger(0)
+    except ValueError as error:
+        print(error)
+
+    many = []
+    for i in range(200):
+        many.append(Item(f"Spike{i}", (1, 1), RED, {}, trigger=Trigger(1.0 + i * 0.01, damage=1)))
+    start = time.perf_counter()
+    battle = AutoBattle(Character("Player", 5000, 1, 0, 5), Character("Enemy", 5000, 1, 0, 5), many, many)
+    result = battle.resolve()
+    print(f'{len(battle.log)} triggers resolved in {(time.perf_counter() - start) * 1000:.1f}ms: {result}')
+
+if __name__ == '__main__':
+    test()
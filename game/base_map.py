@@ -0,0 +1,270 @@
+"""
+base_map.py - 基地防衛のマップ
+
+タイルの上に施設(壁・タレット・コア)を置く。施設は1つずつのオブジェクトではなく
+位置・HP・損傷状態などの配列(struct of arrays)で持つ。
+範囲検索用の空間ハッシュはセル番号でソートした配列(CSR形式)で、
+施設が増減したときだけ作り直す。弾が毎秒数千発あっても、
+apply_projectiles()で「弾ごとに近くのセルの施設を候補にする → 距離で絞る →
+np.add.atでまとめてダメージ」をベクトル演算で一括処理する。
+"""
+
+import numpy as np
+import pygame
+from typing import List, Optional, Tuple
+from .constants import GRAY, RED, BLUE, YELLOW, DARK_GRAY
+
+EMPTY = -1
+WALL = 0
+TURRET = 1
+CORE = 2
+
+INTACT = 0
+DAMAGED = 1
+DESTROYED = 2
+
+FACILITY_HP = {WALL: 200.0, TURRET: 120.0, CORE: 500.0}
+FACILITY_COLORS = {WALL: GRAY, TURRET: BLUE, CORE: YELLOW}
+
+# 変更の記録に残す最大数(これより古い変更を聞かれたら全体を作り直してもらう)
+MAX_CHANGES = 1024
+
+# 弾の候補セルを調べるときのずらし方(3x3)。半径がセルより大きいときはneighbour_offsets()で広げる
+NEIGHBOUR_OFFSETS = [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+
+def neighbour_offsets(rings: int) -> List[Tuple[int, int]]:
+    """周りringsセル分((2 * rings + 1)四方)のずらし方"""
+    if rings <= 1:
+        return NEIGHBOUR_OFFSETS
+    return [(dx, dy) for dy in range(-rings, rings + 1) for dx in range(-rings, rings + 1)]
+
+class BaseMap():
+    def __init__(self, width: int, height: int, tile_size: int = 32, capacity: int = 256) -> None:
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.cell_size = float(tile_size * 2)  # 空間ハッシュのセル(半径がこれより大きいと調べるセルが増える)
+        self.tiles = np.full((height, width), EMPTY, dtype=np.int32)  # 施設の番号
+        # 施設の配列
+        self.count = 0
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.tile_x = np.zeros(capacity, dtype=np.int32)
+        self.tile_y = np.zeros(capacity, dtype=np.int32)
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.hp = np.zeros(capacity, dtype=np.float32)
+        self.max_hp = np.zeros(capacity, dtype=np.float32)
+        self.state = np.zeros(capacity, dtype=np.int8)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.free: List[int] = []
+        self.core_index = EMPTY
+        self.core_lost = False
+        # 変更の記録(流れ場などが差分だけ直すため)
+        self.version = 0
+        self.changed_tiles: List[Tuple[int, int]] = []  # version - len(changed_tiles) 以降の変更
+        self.hash_dirty = True
+
+    #---- 施設の追加・削除 ----
+    def grow(self) -> None:
+        capacity = len(self.x) * 2
+        for name in ('x', 'y', 'tile_x', 'tile_y', 'kind', 'hp', 'max_hp', 'state', 'alive'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add_facility(self, kind: int, tile_x: int, tile_y: int, hp: Optional[float] = None) -> int:
+        if self.tiles[tile_y, tile_x] != EMPTY:
+            raise ValueError(f'tile ({tile_x}, {tile_y}) is already used')
+        if self.free:
+            index = self.free.pop()
+        else:
+            if self.count == len(self.x):
+                self.grow()
+            index = self.count
+            self.count += 1
+        hp = FACILITY_HP[kind] if hp is None else hp
+        self.x[index] = (tile_x + 0.5) * self.tile_size
+        self.y[index] = (tile_y + 0.5) * self.tile_size
+        self.tile_x[index] = tile_x
+        self.tile_y[index] = tile_y
+        self.kind[index] = kind
+        self.hp[index] = hp
+        self.max_hp[index] = hp
+        self.state[index] = INTACT
+        self.alive[index] = True
+        self.tiles[tile_y, tile_x] = index
+        if kind == CORE:
+            self.core_index = index
+            self.core_lost = False
+        self.mark_changed(tile_x, tile_y)
+        return index
+
+    def remove_facility(self, index: int) -> None:
+        if not self.alive[index]:
+            return
+        self.alive[index] = False
+        if index == self.core_index:
+            # 番号は再利用されるのでコアが壊れたことは別に覚えておく
+            self.core_index = EMPTY
+            self.core_lost = True
+        self.tiles[self.tile_y[index], self.tile_x[index]] = EMPTY
+        self.free.append(index)
+        self.mark_changed(int(self.tile_x[index]), int(self.tile_y[index]))
+
+    def mark_changed(self, tile_x: int, tile_y: int) -> None:
+        self.version += 1
+        self.changed_tiles.append((tile_x, tile_y))
+        if len(self.changed_tiles) > MAX_CHANGES:
+            del self.changed_tiles[:MAX_CHANGES // 2]
+        self.hash_dirty = True
+
+    def changes_since(self, version: int) -> Optional[List[Tuple[int, int]]]:
+        """versionの後に変わったタイル(1回の変更でversionが1増える)。記録が残っていなければNone"""
+        start = len(self.changed_tiles) - (self.version - version)
+        if start < 0:
+            return None
+        return self.changed_tiles[start:]
+
+    def passable(self) -> np.ndarray:
+        """通れるタイル(施設のないタイル)"""
+        return self.tiles == EMPTY
+
+    #---- 空間ハッシュ ----
+    def cell_key(self, cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+        columns = int(np.ceil(self.width * self.tile_size / self.cell_size)) + 2
+        return (cy.astype(np.int64) + 1) * columns + (cx.astype(np.int64) + 1)
+
+    def rebuild_hash(self) -> None:
+        indices = np.nonzero(self.alive[:self.count])[0]
+        keys = self.cell_key(np.floor(self.x[indices] / self.cell_size), np.floor(self.y[indices] / self.cell_size))
+        order = np.argsort(keys, kind='stable')
+        self.hash_keys = keys[order]
+        self.hash_indices = indices[order]
+        self.hash_dirty = False
+
+    def rings(self, radius: float) -> int:
+        """半径radiusを漏れなく調べるのに必要な、周りのセルの数"""
+        return max(1, int(np.ceil(radius / self.cell_size)))
+
+    def candidates(self, xs: np.ndarray, ys: np.ndarray, rings: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """各点の周りringsセル(既定は3x3)にある施設の(点の番号, 施設の番号)の組"""
+        if self.hash_dirty:
+            self.rebuild_hash()
+        cx = np.floor(xs / self.cell_size)
+        cy = np.floor(ys / self.cell_size)
+        columns = int(np.ceil(self.width * self.tile_size / self.cell_size))
+        rows = int(np.ceil(self.height * self.tile_size / self.cell_size))
+        points = []
+        facilities = []
+        for dx, dy in neighbour_offsets(rings):
+            nx = cx + dx
+            ny = cy + dy
+            # マップの外のセルに施設はない。キーが隣の行に回り込んで同じ施設を2回拾わないように外す
+            inside = (nx >= 0) & (nx < columns) & (ny >= 0) & (ny < rows)
+            keys = np.where(inside, self.cell_key(nx, ny), -1)
+            start = np.searchsorted(self.hash_keys, keys, side='left')
+            end = np.searchsorted(self.hash_keys, keys, side='right')
+            counts = end - start
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # 点ごとの[start, end)を1本の配列に展開する
+            point_index = np.repeat(np.arange(len(xs)), counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            points.append(point_index)
+            facilities.append(self.hash_indices[np.repeat(start, counts) + offsets])
+        if not points:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        return np.concatenate(points), np.concatenate(facilities)
+
+    def query_radius(self, x: float, y: float, radius: float) -> np.ndarray:
+        """(x, y)から半径radius以内の施設の番号"""
+        points, facilities = self.candidates(np.array([x], dtype=np.float32), np.array([y], dtype=np.float32),
+                                             self.rings(radius))
+        dx = self.x[facilities] - x
+        dy = self.y[facilities] - y
+        return facilities[dx * dx + dy * dy <= radius * radius]
+
+    #---- ダメージ ----
+    def apply_damage(self, indices: np.ndarray, amounts: np.ndarray) -> None:
+        np.add.at(self.hp, indices, -np.asarray(amounts, dtype=np.float32))
+        self.update_states(np.unique(indices))
+
+    def update_states(self, indices: np.ndarray) -> None:
+        hp = self.hp[indices]
+        self.state[indices] = np.where(hp <= 0, DESTROYED, np.where(hp < self.max_hp[indices], DAMAGED, INTACT))
+        destroyed = indices[(hp <= 0) & self.alive[indices]]
+        for index in destroyed:
+            self.hp[index] = 0
+            self.remove_facility(int(index))
+
+    def apply_projectiles(self, xs: np.ndarray, ys: np.ndarray, damage, radius: float) -> int:
+        """弾(座標の配列)が半径radius以内の施設すべてにダメージを与える。当たった数を返す"""
+        points, facilities = self.candidates(xs, ys, self.rings(radius))
+        if len(points) == 0:
+            return 0
+        dx = self.x[facilities] - xs[points]
+        dy = self.y[facilities] - ys[points]
+        hit = dx * dx + dy * dy <= radius * radius
+        points = points[hit]
+        facilities = facilities[hit]
+        amounts = np.broadcast_to(np.asarray(damage, dtype=np.float32), xs.shape)[points]
+        self.apply_damage(facilities, amounts)
+        return len(facilities)
+
+    def core_destroyed(self) -> bool:
+        return self.core_lost
+
+    def draw(self, surface: pygame.Surface, x_offset: int = 0, y_offset: int = 0) -> None:
+        size = self.tile_size
+        for index in np.nonzero(self.alive[:self.count])[0]:
+            rect = pygame.Rect(x_offset + self.tile_x[index] * size, y_offset + self.tile_y[index] * size, size, size)
+            pygame.draw.rect(surface, FACILITY_COLORS[int(self.kind[index])], rect)
+            if self.state[index] == DAMAGED:
+                pygame.draw.rect(surface, RED, rect, 2)
+            pygame.draw.rect(surface, DARK_GRAY, rect, 1)
+
+def test():
+    import time
+    rng = np.random.default_rng(0)
+    base_map = BaseMap(60, 40)
+    base_map.add_facility(CORE, 30, 20)
+    for tile_x, tile_y in rng.integers(0, (60, 40), size=(1500, 2)):
+        if base_map.tiles[tile_y, tile_x] == EMPTY:
+            base_map.add_facility(int(rng.integers(0, 2)), int(tile_x), int(tile_y))
+    print(f'{int(base_map.alive.sum())} facilities, near core: {len(base_map.query_radius(976, 656, 48))}')
+    # セルより大きい半径も総当たりと同じ結果になる
+    alive = np.nonzero(base_map.alive[:base_map.count])[0]
+    for radius in (48, 150, 400):
+        near = (base_map.x[alive] - 976) ** 2 + (base_map.y[alive] - 656) ** 2 <= radius * radius
+        print(f'radius {radius}: {len(base_map.query_radius(976, 656, radius))} found, brute force {int(near.sum())}')
+    # 半径がマップより大きくても同じ施設を2回数えない
+    small = BaseMap(16, 12)
+    wall = small.add_facility(WALL, 15, 0)
+    before = float(small.hp[wall])
+    hits = small.apply_projectiles(np.array([10], dtype=np.float32), np.array([10], dtype=np.float32), 1.0, 600.0)
+    print(f'radius 600 on a 16x12 map: {small.query_radius(10, 10, 600)}, {hits} hit, hp {before:.0f} -> {small.hp[wall]:.0f}')
+
+    width = base_map.width * base_map.tile_size
+    height = base_map.height * base_map.tile_size
+    start = time.perf_counter()
+    hits = 0
+    for _ in range(60):
+        # 1秒あたり6000発 = 1フレーム100発
+        xs = rng.uniform(0, width, 100).astype(np.float32)
+        ys = rng.uniform(0, height, 100).astype(np.float32)
+        hits += base_map.apply_projectiles(xs, ys, 15.0, 24.0)
+    elapsed = time.perf_counter() - start
+    print(f'60 frames x 100 projectiles: {elapsed * 1000:.1f}ms ({elapsed / 60 * 1000:.3f}ms/frame), {hits} hits')
+    print(f'damaged {int((base_map.state == DAMAGED).sum())}, destroyed {int((base_map.state == DESTROYED).sum())}')
+
+    start = time.perf_counter()
+    xs = rng.uniform(0, width, 10000).astype(np.float32)
+    ys = rng.uniform(0, height, 10000).astype(np.float32)
+    hits = base_map.apply_projectiles(xs, ys, 5.0, 24.0)
+    print(f'10000 projectiles in one batch: {(time.perf_counter() - start) * 1000:.1f}ms, {hits} hits')
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,208 @@
+"""
+base_state.py - ラウンドをまたぐ基地の状態(損傷は次の対戦に持ち越す)
+
+BaseStateは変更しない(イミュータブルな)スナップショット。マップをBLOCK x BLOCKタイルの
+ブロックに分け、ブロックごとに施設(kind, hp, max_hp)のタプルを持つ(施設のないタイルはNone)。
+ラウンドの間に変わらなかったブロックは前のラウンドと同じオブジェクトを共有するので、
+全ラウンドを残しても増えるのは損傷したブロックの分だけ(攻撃は場所が固まるので少なく済む)。
+
+- capture():  BaseMap(対戦中の配列)からスナップショットを作る。前のラウンドと同じブロックは使い回す
+- restore():  スナップショットからBaseMapを作る(次の対戦の開始状態・リプレイ)
+- diff():     2つのスナップショットの差分(タイル -> 新しい値 / 壊れたらNone)。
+              共有しているブロックは`is`で飛ばすので、変わったブロックだけ比べる
+- BaseHistory: ラウンドごとのスナップショットの列。どのラウンドでも取り出せる
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from .base_map import BaseMap, CORE, DAMAGED, EMPTY, INTACT
+
+BLOCK = 8
+Facility = Tuple[int, float, float]  # (kind, hp, max_hp)
+Block = Tuple[Optional[Facility], ...]
+Delta = Dict[Tuple[int, int], Optional[Facility]]  # (tile_x, tile_y) -> 施設
+
+EMPTY_BLOCK: Block = (None,) * (BLOCK * BLOCK)
+
+class BaseState():
+    def __init__(self, width: int, height: int, blocks: Tuple[Block, ...], round_number: int = 0) -> None:
+        self.width = width
+        self.height = height
+        self.columns = -(-width // BLOCK)  # 横のブロック数
+        self.blocks = blocks
+        self.round_number = round_number
+
+    @classmethod
+    def empty(cls, width: int, height: int) -> 'BaseState':
+        return cls(width, height, (EMPTY_BLOCK,) * (-(-width // BLOCK) * -(-height // BLOCK)))
+
+    def locate(self, tile_x: int, tile_y: int) -> Tuple[int, int]:
+        """タイルの(ブロック番号, ブロック内の位置)"""
+        return (tile_y // BLOCK) * self.columns + tile_x // BLOCK, (tile_y % BLOCK) * BLOCK + tile_x % BLOCK
+
+    def tile_of(self, block_index: int, offset: int) -> Tuple[int, int]:
+        block_y, block_x = divmod(block_index, self.columns)
+        return block_x * BLOCK + offset % BLOCK, block_y * BLOCK + offset // BLOCK
+
+    def get(self, tile_x: int, tile_y: int) -> Optional[Facility]:
+        block_index, offset = self.locate(tile_x, tile_y)
+        return self.blocks[block_index][offset]
+
+    def facilities(self) -> List[Tuple[Tuple[int, int], Facility]]:
+        """((tile_x, tile_y), 施設)の一覧。壊れた施設は含まない"""
+        result = []
+        for block_index, block in enumerate(self.blocks):
+            if block is EMPTY_BLOCK:
+                continue
+            for offset, facility in enumerate(block):
+                if facility is not None:
+                    result.append((self.tile_of(block_index, offset), facility))
+        return result
+
+    def apply(self, delta: Delta, round_number: Optional[int] = None) -> 'BaseState':
+        """差分を当てた新しいスナップショット。触らなかったブロックは共有する"""
+        blocks = list(self.blocks)
+        changed: Dict[int, List[Optional[Facility]]] = {}
+        for (tile_x, tile_y), facility in delta.items():
+            block_index, offset = self.locate(tile_x, tile_y)
+            if block_index not in changed:
+                changed[block_index] = list(blocks[block_index])
+            changed[block_index][offset] = facility
+        for block_index, block in changed.items():
+            blocks[block_index] = tuple(block)
+        number = self.round_number + 1 if round_number is None else round_number
+        return BaseState(self.width, self.height, tuple(blocks), number)
+
+def capture(base_map: BaseMap, previous: Optional[BaseState] = None, round_number: Optional[int] = None) -> BaseState:
+    """BaseMapの今の状態をスナップショットにする。previousと同じブロックはそのまま共有する"""
+    if previous is None:
+        previous = BaseState.empty(base_map.width, base_map.height)
+        number = 0
+    else:
+        number = previous.round_number + 1
+    indices = np.nonzero(base_map.alive[:base_map.count])[0]
+    tile_x = base_map.tile_x[indices]
+    tile_y = base_map.tile_y[indices]
+    block_ids = ((tile_y // BLOCK) * previous.columns + tile_x // BLOCK).tolist()
+    offsets = ((tile_y % BLOCK) * BLOCK + tile_x % BLOCK).tolist()
+    # 配列からまとめてPythonの値にする(施設ごとにnumpyの要素を読むより速い)
+    records = zip(base_map.kind[indices].tolist(), base_map.hp[indices].tolist(), base_map.max_hp[indices].tolist())
+    filled: Dict[int, List[Optional[Facility]]] = {}
+    for block_index, offset, record in zip(block_ids, offsets, records):
+        if block_index not in filled:
+            filled[block_index] = list(EMPTY_BLOCK)
+        filled[block_index][offset] = record
+    blocks = []
+    for block_index, old in enumerate(previous.blocks):
+        block = tuple(filled[block_index]) if block_index in filled else EMPTY_BLOCK
+        blocks.append(old if old == block else block)
+    return BaseState(base_map.width, base_map.height, tuple(blocks), number if round_number is None else round_number)
+
+def restore(state: BaseState, tile_size: int = 32) -> BaseMap:
+    """スナップショットからBaseMapを作る(損傷したHPもそのまま)"""
+    facilities = state.facilities()
+    base_map = BaseMap(state.width, state.height, tile_size, max(len(facilities), 1))
+    if not facilities:
+        return base_map
+    count = len(facilities)
+    tiles, records = zip(*facilities)
+    tile_x, tile_y = (np.array(column, dtype=np.int32) for column in zip(*tiles))
+    kind, hp, max_hp = (np.array(column) for column in zip(*records))
+    indices = np.arange(count)
+    base_map.count = count
+    base_map.kind[:count] = kind
+    base_map.tile_x[:count] = tile_x
+    base_map.tile_y[:count] = tile_y
+    base_map.x[:count] = (tile_x + 0.5) * tile_size
+    base_map.y[:count] = (tile_y + 0.5) * tile_size
+    base_map.hp[:count] = hp
+    base_map.max_hp[:count] = max_hp
+    base_map.state[:count] = np.where(hp < max_hp, DAMAGED, INTACT)
+    base_map.alive[:count] = True
+    base_map.tiles[tile_y, tile_x] = indices
+    cores = indices[kind == CORE]
+    if len(cores):
+        base_map.core_index = int(cores[0])
+    base_map.core_lost = base_map.core_index == EMPTY
+    return base_map
+
+def diff(old: BaseState, new: BaseState) -> Delta:
+    """oldからnewへの差分。old.apply(diff(old, new))はnewと同じ中身になる"""
+    delta: Delta = {}
+    for block_index, (old_block, new_block) in enumerate(zip(old.blocks, new.blocks)):
+        if old_block is new_block:
+            continue
+        for offset in range(BLOCK * BLOCK):
+            if old_block[offset] != new_block[offset]:
+                delta[new.tile_of(block_index, offset)] = new_block[offset]
+    return delta
+
+class BaseHistory():
+    """ラウンドごとのスナップショット。ブロックを共有しているので全部残しても軽い"""
+    def __init__(self, initial: BaseState) -> None:
+        self.rounds: List[BaseState] = [initial]
+
+    def latest(self) -> BaseState:
+        return self.rounds[-1]
+
+    def start_match(self, tile_size: int = 32) -> BaseMap:
+        """最新の状態(損傷したまま)から次の対戦用のBaseMapを作る"""
+        return restore(self.latest(), tile_size)
+
+    def end_match(self, base_map: BaseMap) -> Delta:
+        """対戦後の状態を新しいラウンドとして記録し、前のラウンドとの差分を返す"""
+        previous = self.latest()
+        state = capture(base_map, previous)
+        self.rounds.append(state)
+        return diff(previous, state)
+
+    def state(self, round_number: int) -> BaseState:
+        return self.rounds[round_number]
+
+    def delta(self, round_number: int) -> Delta:
+        """round_number - 1 からround_numberへの差分(リプレイ・送信用)"""
+        return diff(self.rounds[round_number - 1], self.rounds[round_number])
+
+    def block_stats(self) -> Tuple[int, int]:
+        """(実際に持っているブロック数, ラウンドごとに全部コピーした場合のブロック数)"""
+        unique = {id(block) for state in self.rounds for block in state.blocks}
+        return len(unique), sum(len(state.blocks) for state in self.rounds)
+
+def test():
+    import time
+    from .base_map import WALL
+
+    rng = np.random.default_rng(0)
+    base_map = BaseMap(60, 40)
+    base_map.add_facility(CORE, 30, 20)
+    for tile_x, tile_y in rng.integers(0, (60, 40), size=(1500, 2)):
+        if base_map.tiles[tile_y, tile_x] == EMPTY:
+            base_map.add_facility(int(rng.integers(WALL, CORE)), int(tile_x), int(tile_y))
+    history = BaseHistory(capture(base_map))
+
+    delta_sizes = []
+    start = time.perf_counter()
+    for _ in range(20):
+        base_map = history.start_match()
+        # 対戦ごとに基地の一部が攻撃される
+        center = rng.uniform((0, 0), (60 * 32, 40 * 32))
+        xs = (center[0] + rng.normal(0, 64, 300)).astype(np.float32)
+        ys = (center[1] + rng.normal(0, 64, 300)).astype(np.float32)
+        base_map.apply_projectiles(xs, ys, 20.0, 24.0)
+        delta_sizes.append(len(history.end_match(base_map)))
+    elapsed = time.perf_counter() - start
+    unique, copies = history.block_stats()
+    print(f'{len(history.state(0).facilities())} facilities, 20 rounds in {elapsed * 1000:.1f}ms '
+          f'({elapsed / 20 * 1000:.2f}ms per restore + capture)')
+    print(f'blocks stored {unique} / {copies} for full copies, changed facilities per round: {delta_sizes}')
+
+    # 途中のラウンドを差分から復元して比べる
+    rebuilt = history.state(0)
+    for round_number in range(1, 11):
+        rebuilt = rebuilt.apply(history.delta(round_number))
+    print(f'round 10 rebuilt from deltas matches: {rebuilt.facilities() == history.state(10).facilities()}')
+    replay = restore(history.state(10))
+    print(f'round 10 replay: {int(replay.alive.sum())} alive, {int((replay.state == DAMAGED).sum())} damaged')
+
+if __name__ == '__main__':
+    test()
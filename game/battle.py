@@ -0,0 +1,131 @@
+import random
+from .card import create_starter_deck
+
+class GameEntity():
+    #戦闘中に変わる状態だけを持つ(カードは共有の定義card.Cardを参照する)
+    __slots__ = ('name', 'max_hp', 'hp', 'max_energy', 'energy', 'block', 'deck', 'hand', 'discard_pile', 'rng')
+
+    def __init__(self, name, max_hp, max_energy, base_block=0, rng=None):
+        self.name = name
+        self.max_hp = max_hp
+        self.hp = max_hp
+        self.max_energy = max_energy
+        self.energy = max_energy
+        self.block = base_block
+        self.deck = []
+        self.hand = []
+        self.discard_pile = []
+        self.rng = rng if rng is not None else random
+
+    def draw_card(self, num=1):
+        for _ in range(num):
+            if not self.deck:
+                self.deck = self.discard_pile
+                self.discard_pile = []
+                self.rng.shuffle(self.deck)
+            if self.deck:
+                self.hand.append(self.deck.pop())
+
+    def start_turn(self):
+        self.energy = self.max_energy
+        self.draw_card(5)
+        self.block = 0
+
+    def end_turn(self):
+        self.discard_pile.extend(self.hand)
+        self.hand = []
+
+def create_player(rng=None):
+    player = GameEntity('Player', 100, 3, rng=rng)
+    player.deck = create_starter_deck()
+    player.rng.shuffle(player.deck)
+    return player
+
+class Enemy(GameEntity):
+    __slots__ = ('actions', 'current_action', 'ai')
+
+    def __init__(self, name, hp, actions, ai=None, rng=None):
+        super().__init__(name, hp, 0, rng=rng)  # エネルギーは使用しないので0
+        self.actions = actions
+        self.current_action = None
+        self.ai = ai  # BattleAIを渡すと行動選択が探索になる
+        self.choose_action()
+
+    def choose_action(self, player=None):
+        if self.ai is not None and player is not None:
+            self.current_action = self.ai.choose_enemy_action(self, player)
+        else:
+            self.current_action = self.rng.choice(self.actions)
+
+    def act(self, player):
+        damage = self.current_action['damage']
+        player.hp -= max(0, damage - player.block)
+        player.block = max(0, player.block - damage)
+        self.choose_action(player)
+
+class Battle():
+    def __init__(self, player, enemy):
+        self.player = player
+        self.enemy = enemy
+        self.turn = 1
+        self.message = ""
+        self.message_timer = 0
+
+    def start_battle(self):
+        self.player.start_turn()
+
+    def play_card(self, card_index):
+        if card_index < len(self.player.hand):
+            card = self.player.hand[card_index]
+            if self.player.energy >= card.cost:
+                card.use(self.player, self.enemy)
+                self.player.hand.pop(card_index)
+                self.player.discard_pile.append(card)
+                self.set_message(f"Player used {card.name}")
+
+    def end_player_turn(self):
+        used_action = self.enemy.current_action
+        self.player.end_turn()
+        self.enemy.act(self.player)
+        self.set_message(f"{self.enemy.name} used {used_action['name']}")
+        self.turn += 1
+        self.player.start_turn()
+
+    def is_battle_over(self):
+        return self.player.hp <= 0 or self.enemy.hp <= 0
+
+    def get_result(self):
+        if self.player.hp <= 0:
+            return "defeat"
+        elif self.enemy.hp <= 0:
+            return "victory"
+        else:
+            return None
+
+    def set_message(self, message):
+        self.message = message
+        self.message_timer = 120  # 2 seconds at 60 FPS
+
+    def update(self):
+        if self.message_timer > 0:
+            self.message_timer -= 1
+        else:
+            self.message = ""
+
+SLIME_ACTIONS = [
+    {"name": "Attack", "damage": 10},
+    {"name": "Defend", "damage": 5},
+    {"name": "Strong Attack", "damage": 15}
+]
+
+def test():
+    rng = random.Random(0)
+    battle = Battle(create_player(rng), Enemy("Slime", 50, SLIME_ACTIONS, rng=rng))
+    battle.start_battle()
+    while not battle.is_battle_over() and battle.turn < 50:
+        battle.play_card(0)
+        battle.end_player_turn()
+    print(battle.turn, battle.get_result())
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,311 @@
+"""
+battle_ai.py - カードバトル用の探索AI
+
+Battleの状態(手札, エネルギー, ブロック, 敵の予告行動current_action)から
+プレイ順を探索して次の一手を選ぶ。
+
+- 自分のターン内は全プレイ順を深さ優先で探索(max node)
+- ターン終了後は敵の予告行動を適用し、次ターンのドローと敵の行動を
+  山札の分布からサンプリングして期待値を取る(chance node = expectimax)
+- 状態は小さいタプルにエンコードし、上限付きのトランスポジションテーブル(LRU)で
+  同じ局面の再探索を省く(プレイ順違いで同じ局面になることが多い)
+- 1回の判断に時間予算(デフォルト5ms)があり、反復深化で間に合った深さの結果を使う
+
+プレイヤー側のbot(ヘッドレスのバランス検証)にも、Enemy(ai=...)として賢い敵にも使える。
+"""
+
+import random
+import time
+from bisect import insort
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+WIN_SCORE = 10000.0
+ENEMY_HP_WEIGHT = 1.0
+HAND_SIZE = 5
+DEADLINE_MARGIN = 0.0003  # 探索を打ち切ってから手を返すまでにかかる分(秒)。予算からこれを引いて打ち切る
+
+class SearchTimeout(Exception):
+    """時間予算を使い切ったときに探索を打ち切るための例外"""
+    pass
+
+class TranspositionTable():
+    def __init__(self, max_entries: int = 50000) -> None:
+        self.entries: 'OrderedDict[Tuple, Tuple[float, Optional[int]]]' = OrderedDict()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[Tuple[float, Optional[int]]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: Tuple, value: Tuple[float, Optional[int]]) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)  # 一番古く使われたものから捨てる
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+class BattleAI():
+    def __init__(self, time_budget: float = 0.005, max_depth: int = 2, samples: int = 6,
+                 max_table_entries: int = 50000, seed: Optional[int] = None) -> None:
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.samples = samples
+        self.table = TranspositionTable(max_table_entries)
+        self.rng = random.Random(seed)
+        # カードは性能ごとに小さいintのidへ変換して状態に入れる
+        self.card_ids: Dict[Tuple, int] = {}
+        self.card_stats: List[Tuple[int, int, int]] = []  # id -> (cost, damage, block)
+        self.context: Optional[Tuple] = None
+        self.deadline = float('inf')
+        self.nodes = 0
+
+    def card_id(self, card: Any) -> int:
+        key = card.key()
+        cid = self.card_ids.get(key)
+        if cid is None:
+            cid = len(self.card_stats)
+            self.card_ids[key] = cid
+            self.card_stats.append((card.cost, card.damage, card.block))
+        return cid
+
+    def pile(self, cards: List[Any]) -> Tuple[int, ...]:
+        return tuple(sorted(self.card_id(card) for card in cards))
+
+    def set_context(self, player: Any, enemy: Any) -> None:
+        # 最大エネルギーや敵の行動候補が変わったらテーブルの値は使えない
+        context = (player.max_energy, tuple(action['damage'] for action in enemy.actions))
+        if context != self.context:
+            self.context = context
+            self.table.clear()
+        self.max_energy = context[0]
+        self.intents = context[1]
+
+    def encode_state(self, battle: Any) -> Tuple:
+        player = battle.player
+        enemy = battle.enemy
+        self.set_context(player, enemy)
+        return (player.hp, player.energy, player.block, enemy.hp,
+                self.pile(player.hand), self.pile(player.deck), self.pile(player.discard_pile),
+                enemy.current_action['damage'])
+
+    #---- 公開API ----
+    def choose_play(self, battle: Any) -> Optional[int]:
+        """次に使う手札のindexを返す。Noneならターン終了"""
+        start = time.perf_counter()
+        state = self.encode_state(battle)
+        best = self.search(state, start)
+        if best is None:
+            return None
+        for i, card in enumerate(battle.player.hand):
+            if self.card_id(card) == best:
+                return i
+        return None
+
+    def play_turn(self, battle: Any) -> int:
+        """1ターン分カードを使い切る(ターン終了はしない)。使った枚数を返す"""
+        plays = 0
+        while not battle.is_battle_over():
+            index = self.choose_play(battle)
+            if index is None:
+                break
+            battle.play_card(index)
+            plays += 1
+        return plays
+
+    def autoplay(self, battle: Any, max_turns: int = 100) -> Optional[str]:
+        """ヘッドレスで戦闘を最後まで進める(バランス検証用)"""
+        battle.start_battle()
+        while not battle.is_battle_over() and battle.turn <= max_turns:
+            self.play_turn(battle)
+            if battle.is_battle_over():
+                break
+            battle.end_player_turn()
+        return battle.get_result()
+
+    def choose_enemy_action(self, enemy: Any, player: Any) -> Dict[str, Any]:
+        """プレイヤーの最善応答の期待値が一番低くなる行動を選ぶ"""
+        start = time.perf_counter()
+        self.set_context(player, enemy)
+        draw = self.pile(player.deck)
+        discard = self.pile(player.discard_pile + player.hand)
+        self.deadline = start + self.time_budget - DEADLINE_MARGIN
+        best_action = None
+        best_value = float('inf')
+        try:
+            for action in enemy.actions:
+                value = self.next_turn_value(player.hp, enemy.hp, draw, discard, (action['damage'],), 0)
+                if value < best_value:
+                    best_value = value
+                    best_action = action
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = float('inf')
+        if best_action is None:
+            return self.rng.choice(enemy.actions)
+        return best_action
+
+    #---- 探索 ----
+    def search(self, state: Tuple, start: float) -> Optional[int]:
+        # 時間予算は深さ0(今のターンだけ)にもかける。深さ0も終わらなければ貪欲な1手を使う
+        best = self.greedy(*state)
+        self.deadline = start + self.time_budget - DEADLINE_MARGIN
+        try:
+            for depth in range(self.max_depth + 1):
+                _, best = self.turn_value(*state, depth)
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = float('inf')
+        return best
+
+    def greedy(self, player_hp: int, energy: int, block: int, enemy_hp: int,
+               hand: Tuple[int, ...], draw: Tuple[int, ...], discard: Tuple[int, ...], intent: int) -> Optional[int]:
+        """1枚使ってすぐターンを終えたときに一番よいカードid(探索が間に合わないとき用)"""
+        best_value = self.end_turn_value(player_hp, block, enemy_hp, hand, draw, discard, intent, 0)
+        best_card = None
+        for cid in sorted(set(hand)):
+            cost, damage, card_block = self.card_stats[cid]
+            if cost > energy:
+                continue
+            if enemy_hp - damage <= 0:
+                value = self.evaluate(player_hp, enemy_hp - damage)
+            else:
+                value = self.end_turn_value(player_hp, block + card_block, enemy_hp - damage, (), (), (), intent, 0)
+            if value > best_value:
+                best_value = value
+                best_card = cid
+        return best_card
+
+    def evaluate(self, player_hp: int, enemy_hp: int) -> float:
+        if enemy_hp <= 0:
+            return WIN_SCORE + player_hp
+        if player_hp <= 0:
+            return -WIN_SCORE - enemy_hp
+        return player_hp - ENEMY_HP_WEIGHT * enemy_hp
+
+    def turn_value(self, player_hp: int, energy: int, block: int, enemy_hp: int,
+                   hand: Tuple[int, ...], draw: Tuple[int, ...], discard: Tuple[int, ...],
+                   intent: int, depth: int) -> Tuple[float, Optional[int]]:
+        """自分のターン中の局面の価値と最善のカードid(Noneはターン終了)"""
+        key = (player_hp, energy, block, enemy_hp, hand, draw, discard, intent, depth)
+        entry = self.table.get(key)
+        if entry is not None:
+            return entry
+        self.nodes += 1
+        if time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+        best_value = self.end_turn_value(player_hp, block, enemy_hp, hand, draw, discard, intent, depth)
+        best_card = None
+        previous = None
+        for i, cid in enumerate(hand):
+            if cid == previous:
+                continue  # 同じカードは1回だけ試す
+            previous = cid
+            cost, damage, card_block = self.card_stats[cid]
+            if cost > energy:
+                continue
+            next_hand = hand[:i] + hand[i + 1:]
+            next_discard = list(discard)
+            insort(next_discard, cid)
+            next_enemy_hp = enemy_hp - damage
+            if next_enemy_hp <= 0:
+                value = self.evaluate(player_hp, next_enemy_hp)
+            else:
+                value, _ = self.turn_value(player_hp, energy - cost, block + card_block, next_enemy_hp,
+                                           next_hand, draw, tuple(next_discard), intent, depth)
+            if value > best_value:
+                best_value = value
+                best_card = cid
+
+        self.table.put(key, (best_value, best_card))
+        return best_value, best_card
+
+    def end_turn_value(self, player_hp: int, block: int, enemy_hp: int,
+                       hand: Tuple[int, ...], draw: Tuple[int, ...], discard: Tuple[int, ...],
+                       intent: int, depth: int) -> float:
+        player_hp -= max(0, intent - block)
+        if player_hp <= 0 or depth == 0:
+            return self.evaluate(player_hp, enemy_hp)
+        discard = tuple(sorted(discard + hand))
+        return self.next_turn_value(player_hp, enemy_hp, draw, discard, self.intents, depth - 1)
+
+    def next_turn_value(self, player_hp: int, enemy_hp: int, draw: Tuple[int, ...],
+                        discard: Tuple[int, ...], intents: Tuple[int, ...], depth: int) -> float:
+        """次ターンのドローと敵の行動をサンプリングした期待値"""
+        total = 0.0
+        for n in range(self.samples):
+            hand, next_draw, next_discard = self.sample_draw(draw, discard)
+            intent = intents[n % len(intents)]
+            value, _ = self.turn_value(player_hp, self.max_energy, 0, enemy_hp,
+                                       hand, next_draw, next_discard, intent, depth)
+            total += value
+        return total / self.samples
+
+    def sample_draw(self, draw: Tuple[int, ...], discard: Tuple[int, ...]) -> Tuple[Tuple[int, ...], ...]:
+        # GameEntity.draw_cardと同じく、山札が尽きたら捨て札を混ぜて山札にする
+        draw_list = list(draw)
+        discard_list = list(discard)
+        hand = []
+        for _ in range(HAND_SIZE):
+            if not draw_list:
+                draw_list = discard_list
+                discard_list = []
+            if draw_list:
+                hand.append(draw_list.pop(self.rng.randrange(len(draw_list))))
+        return tuple(sorted(hand)), tuple(draw_list), tuple(discard_list)
+
+def test():
+    from .battle import Battle, Enemy, create_player, SLIME_ACTIONS
+
+    ai = BattleAI(seed=0)
+    results = {'victory': 0, 'defeat': 0, None: 0}
+    start = time.perf_counter()
+    for i in range(20):
+        rng = random.Random(i)
+        battle = Battle(create_player(rng), Enemy("Slime", 50, SLIME_ACTIONS, rng=rng))
+        results[ai.autoplay(battle)] += 1
+    print(f"bot results: {results} ({time.perf_counter() - start:.3f}s)")
+    print(f"table: {len(ai.table)} entries, hits {ai.table.hits}, misses {ai.table.misses}")
+
+    rng = random.Random(0)
+    smart_enemy = Enemy("Slime", 50, SLIME_ACTIONS, ai=BattleAI(seed=1), rng=rng)
+    battle = Battle(create_player(rng), smart_enemy)
+    print(f"vs smart enemy: {BattleAI(seed=2).autoplay(battle)} turn {battle.turn} hp {battle.player.hp}")
+
+    # 1回の判断は時間予算の中で返す(深さ0の探索も打ち切って、間に合わなければ貪欲な1手)
+    ai = BattleAI(seed=3)
+    times = []
+    for i in range(10):
+        rng = random.Random(100 + i)
+        battle = Battle(create_player(rng), Enemy("Slime", 80, SLIME_ACTIONS, rng=rng))
+        battle.start_battle()
+        while not battle.is_battle_over() and battle.turn <= 100:
+            start = time.perf_counter()
+            index = ai.choose_play(battle)
+            times.append((time.perf_counter() - start) * 1000)
+            if index is None:
+                battle.end_player_turn()
+            else:
+                battle.play_card(index)
+    times.sort()
+    over = sum(1 for elapsed in times if elapsed > ai.time_budget * 1000)
+    print(f"{len(times)} decisions, budget {ai.time_budget * 1000:.0f}ms: p50 {times[len(times) // 2]:.2f}ms, "
+          f"p99 {times[int(len(times) * 0.99)]:.2f}ms, max {times[-1]:.2f}ms, over budget {over}")
+
+if __name__ == '__main__':
+    test()
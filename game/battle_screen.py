@@ -0,0 +1,106 @@
+import pygame
+from .constants import SCREEN_WIDTH, SCREEN_HEIGHT, WHITE, GRAY, DARK_GRAY, RED, GREEN, BLUE, YELLOW
+from .text_cache import Label
+from .card_renderer import CardRenderer, NORMAL, HOVER, SELECTED, UNPLAYABLE
+from .ui import UIManager, Widget, Button
+
+class CardWidget(Widget):
+    def __init__(self, rect, card, index, screen):
+        super().__init__(rect, on_click=lambda widget: screen.battle.play_card(widget.index))
+        self.card = card
+        self.index = index
+        self.screen = screen
+
+    def draw_self(self, surface):
+        state = SELECTED if self.pressed else HOVER if self.hovered else NORMAL
+        modifiers = (UNPLAYABLE,) if self.card.cost > self.screen.battle.player.energy else ()
+        self.screen.card_renderer.draw(surface, self.card, self.rect.topleft, state, modifiers)
+
+class BattleScreen():
+    def __init__(self, battle):
+        self.battle = battle
+        self.font = pygame.font.Font(None, 36)
+        self.small_font = pygame.font.Font(None, 24)
+        self.card_renderer = CardRenderer(self.small_font)
+        #ボタンや手札は毎フレーム作らずにUIツリーに保持する
+        self.ui = UIManager((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.hand_panel = self.ui.root.add(Widget((50, 450, 0, 140)))
+        self.hand_cards = None
+        self.end_turn_button = self.ui.root.add(
+            Button((650, 500, 120, 50), "End Turn", self.font, GRAY, WHITE,
+                   on_click=lambda widget: battle.end_player_turn()))
+        player = battle.player
+        enemy = battle.enemy
+        #文字は値が変わったときだけ描画し直す
+        self.labels = [
+            Label(self.font, lambda: (player.hp, player.max_hp), WHITE, (20, 20), fmt='HP: {}/{}'),
+            Label(self.font, lambda: (player.energy, player.max_energy), WHITE, (20, 60), fmt='Energy: {}/{}'),
+            Label(self.small_font, lambda: player.block, WHITE, (20, 100), fmt='Block: {}'),
+            Label(self.font, lambda: enemy.name, WHITE, (500, 20)),
+            Label(self.font, lambda: (enemy.hp, enemy.max_hp), WHITE, (500, 100), fmt='{}/{}'),
+            Label(self.small_font, lambda: enemy.current_action['name'], WHITE, (500, 130), fmt='Next: {}'),
+            Label(self.font, lambda: battle.message, YELLOW, (SCREEN_WIDTH // 2, 200), anchor='midtop'),
+        ]
+
+    def card_rect(self, index):
+        return pygame.Rect(50 + index * 120, 450, 100, 140)
+
+    def sync_hand(self):
+        # 手札が変わったときだけカードのウィジェットを作り直す
+        hand = self.battle.player.hand
+        if self.hand_cards == [id(card) for card in hand]:
+            return
+        self.hand_cards = [id(card) for card in hand]
+        self.hand_panel.clear()
+        for i, card in enumerate(hand):
+            self.hand_panel.add(CardWidget((i * 120, 0, 100, 140), card, i, self))
+
+    def draw(self, screen):
+        battle = self.battle
+        screen.fill(DARK_GRAY)
+
+        # プレイヤーと敵の枠
+        pygame.draw.rect(screen, BLUE, (10, 10, 300, 100))
+        pygame.draw.rect(screen, RED, (490, 10, 300, 100))
+        enemy_hp_bar = pygame.Rect(500, 60, 280 * max(0, battle.enemy.hp) / battle.enemy.max_hp, 30)
+        pygame.draw.rect(screen, GREEN, enemy_hp_bar)
+        pygame.draw.rect(screen, WHITE, (500, 60, 280, 30), 2)
+
+        for label in self.labels:
+            label.draw(screen)
+
+        self.sync_hand()
+        self.ui.draw(screen)
+
+    def handle_event(self, event):
+        self.sync_hand()
+        return self.ui.handle_event(event)
+
+def test():
+    import random
+    import time
+    from .battle import Battle, Enemy, create_player, SLIME_ACTIONS
+    from .text_cache import TEXT_CACHE
+    from .ui import click
+
+    pygame.init()
+    screen = pygame.Surface((800, 600))
+    rng = random.Random(0)
+    battle = Battle(create_player(rng), Enemy("Slime", 50, SLIME_ACTIONS, rng=rng))
+    battle.start_battle()
+    battle_screen = BattleScreen(battle)
+    start = time.perf_counter()
+    for frame in range(600):
+        battle.update()
+        battle_screen.draw(screen)
+        if frame % 60 == 0:
+            click(battle_screen.ui, battle_screen.card_rect(0).center)
+        if frame % 60 == 30:
+            battle_screen.handle_event(pygame.event.Event(pygame.MOUSEMOTION, pos=battle_screen.card_rect(1).center))
+    print(f'600 frames: {(time.perf_counter() - start) * 1000:.1f}ms')
+    print(f'cache: {len(TEXT_CACHE)} entries, hits {TEXT_CACHE.hits}, misses {TEXT_CACHE.misses}')
+    print(f'card compositions: {battle_screen.card_renderer.compositions}')
+    print(f'turn {battle.turn}, enemy hp {battle.enemy.hp}')
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,51 @@
+import json
+import os
+from dataclasses import dataclass
+
+#カードのデータ(空なら初期デッキのカードだけ)
+CARD_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'card_data.json')
+
+#カードの性能は変わらないので不変の定義レコードにする(デッキの中の同じカードは同じ定義を指す)
+#eq=Falseなので比較・ハッシュは今までどおりオブジェクトごと
+@dataclass(frozen=True, slots=True, eq=False)
+class Card():
+    name: str
+    cost: int
+    damage: int
+    block: int
+
+    def use(self, user, target):
+        user.energy -= self.cost
+        target.hp -= self.damage
+        user.block += self.block
+
+    def key(self) -> tuple:
+        #同じ性能のカードは同じキーになる(AIの状態エンコードやキャッシュで使う)
+        return (self.name, self.cost, self.damage, self.block)
+
+
+#初期デッキ(各カード3枚ずつ)
+STARTER_CARDS = [
+    ('Strike', 1, 6, 0),
+    ('Defend', 1, 0, 5),
+    ('Bash', 2, 8, 0),
+]
+
+def create_starter_deck(copies=3):
+    cards = [Card(*data) for data in STARTER_CARDS]
+    return [card for card in cards for _ in range(copies)]
+
+def load_cards(path=CARD_DATA):
+    #名前 -> Card。ファイルは[[name, cost, damage, block], ...]のJSON
+    rows = list(STARTER_CARDS)
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, encoding='utf-8') as file:
+            rows += [tuple(row) for row in json.load(file)]
+    return {row[0]: Card(*row) for row in rows}
+
+def test():
+    deck = create_starter_deck()
+    print(len(deck), deck[0].key(), sorted(load_cards()))
+
+if __name__ == '__main__':
+    test()
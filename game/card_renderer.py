@@ -0,0 +1,93 @@
+"""
+card_renderer.py - カードの絵柄を1枚のSurfaceに合成してキャッシュする
+
+カードの見た目は(カードのキー, 修飾状態)で決まるので、一度合成したSurfaceを
+フレーム間・同じカード同士で使い回す。hover/selectedの見た目も初回に1回だけ
+作って保持するので、描画はカード1枚につきblit1回になる。
+"""
+
+import pygame
+from typing import Any, Dict, Tuple
+from .constants import WHITE, BLACK, RED, BLUE, YELLOW, GRAY
+from .text_cache import render_text
+
+CARD_SIZE = (100, 140)
+NORMAL = 'normal'
+HOVER = 'hover'
+SELECTED = 'selected'
+UNPLAYABLE = 'unplayable'  # 修飾状態: エネルギー不足
+
+class CardRenderer():
+    def __init__(self, font: pygame.font.Font, size: Tuple[int, int] = CARD_SIZE) -> None:
+        self.font = font
+        self.size = size
+        self.faces: Dict[Tuple, pygame.Surface] = {}
+        self.variants: Dict[Tuple, pygame.Surface] = {}
+        self.compositions = 0
+
+    def get_face(self, card: Any, modifiers: Tuple[str, ...] = ()) -> pygame.Surface:
+        key = (card.key(), modifiers)
+        face = self.faces.get(key)
+        if face is None:
+            face = self.compose_face(card, modifiers)
+            self.faces[key] = face
+        return face
+
+    def compose_face(self, card: Any, modifiers: Tuple[str, ...]) -> pygame.Surface:
+        self.compositions += 1
+        face = pygame.Surface(self.size)
+        face.fill(WHITE)
+        face.blit(render_text(self.font, card.name, BLACK), (5, 5))
+        face.blit(render_text(self.font, f"Cost: {card.cost}", BLACK), (5, 25))
+        if card.damage > 0:
+            face.blit(render_text(self.font, f"Damage: {card.damage}", RED), (5, 45))
+        if card.block > 0:
+            face.blit(render_text(self.font, f"Block: {card.block}", BLUE), (5, 65))
+        if UNPLAYABLE in modifiers:
+            shade = pygame.Surface(self.size)
+            shade.fill(GRAY)
+            shade.set_alpha(120)
+            face.blit(shade, (0, 0))
+        return face
+
+    def get_surface(self, card: Any, state: str = NORMAL, modifiers: Tuple[str, ...] = ()) -> pygame.Surface:
+        """表示用のSurfaceを返す。stateはNORMAL/HOVER/SELECTED"""
+        face = self.get_face(card, modifiers)
+        if state == NORMAL:
+            return face
+        key = (card.key(), modifiers, state)
+        surface = self.variants.get(key)
+        if surface is None:
+            # 合成済みの絵柄に枠を足すだけ(文字は描き直さない)
+            surface = face.copy()
+            color = YELLOW if state == HOVER else BLUE
+            pygame.draw.rect(surface, color, surface.get_rect(), 4)
+            self.variants[key] = surface
+        return surface
+
+    def draw(self, screen: pygame.Surface, card: Any, pos: Tuple[int, int], state: str = NORMAL,
+             modifiers: Tuple[str, ...] = ()) -> None:
+        screen.blit(self.get_surface(card, state, modifiers), pos)
+
+    def clear(self) -> None:
+        self.faces.clear()
+        self.variants.clear()
+
+def test():
+    import time
+    from .card import create_starter_deck
+
+    pygame.init()
+    screen = pygame.Surface((1400, 600))
+    renderer = CardRenderer(pygame.font.Font(None, 24))
+    hand = create_starter_deck()[:10]
+    start = time.perf_counter()
+    for frame in range(600):
+        for i, card in enumerate(hand):
+            state = HOVER if i == frame % 10 else NORMAL
+            renderer.draw(screen, card, (50 + i * 120, 450), state)
+    elapsed = time.perf_counter() - start
+    print(f'600 frames x 10 cards: {elapsed * 1000:.1f}ms, compositions {renderer.compositions}')
+
+if __name__ == '__main__':
+    test()
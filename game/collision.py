@@ -0,0 +1,213 @@
+"""
+collision.py - スプライトの当たり判定(broad phase + narrow phase)
+
+pygame.sprite.spritecollideは1回の問い合わせで全スプライトを調べるので、
+敵同士の当たり判定までやると毎フレームO(n^2)になる。
+
+- broad phase:
+  - グループ内(pairs): 一様グリッド。矩形が重なるセルごとに(セル, 番号)を作ってソートし、
+    同じセルの組だけを調べる。同じ組が複数のセルに出るのは、重なりの左上の角があるセルの分だけ残す
+  - グループ間(collide): sweep and prune。bを左端でソートし、aと横に重なりうる範囲だけを
+    searchsortedで取り出す(プレイヤー1体 vs 敵全体のような問い合わせ向き)
+  - どちらも候補の展開と判定をNumPyでまとめて行う(O(n log n + 候補数))
+- narrow phase: 矩形が重なった組だけマスクで調べる。マスクは画像(Surface)ごとに1回だけ作り、
+  同じ画像の組は(マスク, マスク, ずれ)ごとに結果を覚えておく(敵や弾は同じ画像を共有するので当たりやすい)
+- CollisionSystem.pairs()でグループ内の当たっている組を、collide()で2つのグループ間の組をまとめて返す
+"""
+
+import weakref
+import numpy as np
+import pygame
+from typing import Dict, Iterable, List, Tuple
+
+Pair = Tuple[pygame.sprite.Sprite, pygame.sprite.Sprite]
+
+def rect_array(sprites: List[pygame.sprite.Sprite]) -> np.ndarray:
+    """(n, 4)の配列 [left, top, right, bottom]"""
+    if not sprites:
+        return np.zeros((0, 4), dtype=np.int64)
+    rects = np.array([sprite.rect for sprite in sprites], dtype=np.int64)
+    rects[:, 2] += rects[:, 0]
+    rects[:, 3] += rects[:, 1]
+    return rects
+
+def expand_ranges(start: np.ndarray, end: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """各iの[start[i], end[i])を1本に展開して(i, j)の組にする"""
+    counts = np.maximum(end - start, 0)
+    total = int(counts.sum())
+    owner = np.repeat(np.arange(len(start)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, np.repeat(start, counts) + offsets
+
+def grid_pairs(rects: np.ndarray, cell_size: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """rectsの中で矩形が重なっている組(同じ組は1回だけ)。cell_sizeを省くと一番大きい矩形の辺"""
+    if len(rects) < 2:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    if cell_size <= 0:
+        cell_size = max(int((rects[:, 2:] - rects[:, :2]).max()), 1)
+    x0 = rects[:, 0] // cell_size
+    y0 = rects[:, 1] // cell_size
+    spans_x = (rects[:, 2] - 1) // cell_size - x0 + 1
+    spans_y = (rects[:, 3] - 1) // cell_size - y0 + 1
+    # 矩形ごとに重なるセルを全部並べる
+    body, k = expand_ranges(np.zeros(len(rects), dtype=np.int64), spans_x * spans_y)
+    cell_x = x0[body] + k % spans_x[body]
+    cell_y = y0[body] + k // spans_x[body]
+    columns = int(cell_x.max() - cell_x.min()) + 1
+    keys = (cell_y - cell_y.min()) * columns + (cell_x - cell_x.min())
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    body = body[order]
+    cell_x = cell_x[order]
+    cell_y = cell_y[order]
+    end = np.searchsorted(keys, keys, side='right')
+    i, j = expand_ranges(np.arange(1, len(keys) + 1), end)
+    a = body[i]
+    b = body[j]
+    ra = rects[a]
+    rb = rects[b]
+    overlap = (ra[:, 0] < rb[:, 2]) & (rb[:, 0] < ra[:, 2]) & (ra[:, 1] < rb[:, 3]) & (rb[:, 1] < ra[:, 3])
+    # 重なりの左上の角があるセルでだけ数える(2つ以上のセルで同じ組が出るため)
+    owner = (np.maximum(ra[:, 0], rb[:, 0]) // cell_size == cell_x[i]) & \
+            (np.maximum(ra[:, 1], rb[:, 1]) // cell_size == cell_y[i])
+    keep = overlap & owner
+    return a[keep], b[keep]
+
+def sweep_between(rects_a: np.ndarray, rects_b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """rects_aとrects_bの間で矩形が重なっている組(aの番号, bの番号)"""
+    if len(rects_a) == 0 or len(rects_b) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    order = np.argsort(rects_b[:, 0], kind='stable')
+    sorted_b = rects_b[order]
+    lefts = sorted_b[:, 0]
+    widest = int((sorted_b[:, 2] - sorted_b[:, 0]).max())
+    # bの右端 > aの左端 となるのは、bの左端 > aの左端 - 一番広い幅 のときだけ
+    start = np.searchsorted(lefts, rects_a[:, 0] - widest, side='right')
+    end = np.searchsorted(lefts, rects_a[:, 2], side='left')
+    a, b = expand_ranges(start, end)
+    overlap = (rects_a[a, 0] < sorted_b[b, 2]) & (sorted_b[b, 0] < rects_a[a, 2]) & \
+              (rects_a[a, 1] < sorted_b[b, 3]) & (sorted_b[b, 1] < rects_a[a, 3])
+    return a[overlap], order[b[overlap]]
+
+class CollisionSystem():
+    def __init__(self, use_masks: bool = True, cell_size: int = 0) -> None:
+        self.use_masks = use_masks
+        self.cell_size = cell_size  # 0なら毎回一番大きい矩形に合わせる
+        # 画像ごとのマスク。画像が捨てられたら一緒に消える
+        self.masks: 'weakref.WeakKeyDictionary[pygame.Surface, pygame.mask.Mask]' = weakref.WeakKeyDictionary()
+        self.overlaps: Dict[Tuple, bool] = {}
+        self.max_overlaps = 65536
+        self.candidates = 0  # 直前の問い合わせで矩形が重なった組の数
+        self.hits = 0
+
+    def mask_of(self, sprite: pygame.sprite.Sprite) -> pygame.mask.Mask:
+        mask = getattr(sprite, 'mask', None)
+        if mask is not None:
+            return mask
+        mask = self.masks.get(sprite.image)
+        if mask is None:
+            mask = pygame.mask.from_surface(sprite.image)
+            self.masks[sprite.image] = mask
+        return mask
+
+    def overlap(self, mask_a: pygame.mask.Mask, mask_b: pygame.mask.Mask, dx: int, dy: int) -> bool:
+        key = (mask_a, mask_b, dx, dy)
+        hit = self.overlaps.get(key)
+        if hit is None:
+            if len(self.overlaps) >= self.max_overlaps:
+                self.overlaps.clear()
+            hit = mask_a.overlap(mask_b, (dx, dy)) is not None
+            self.overlaps[key] = hit
+        return hit
+
+    def filter(self, sprites_a: List, sprites_b: List, rects_a: np.ndarray, rects_b: np.ndarray,
+               a: np.ndarray, b: np.ndarray) -> List[Pair]:
+        self.candidates = len(a)
+        if not self.use_masks:
+            pairs = [(sprites_a[i], sprites_b[j]) for i, j in zip(a.tolist(), b.tolist())]
+        else:
+            # マスクは候補に出てきたスプライトの分だけ引く。ずれはまとめて計算する
+            if sprites_b is sprites_a:
+                masks_a = masks_b = {i: self.mask_of(sprites_a[i]) for i in np.unique(np.concatenate([a, b])).tolist()}
+            else:
+                masks_a = {i: self.mask_of(sprites_a[i]) for i in np.unique(a).tolist()}
+                masks_b = {j: self.mask_of(sprites_b[j]) for j in np.unique(b).tolist()}
+            dx = (rects_b[b, 0] - rects_a[a, 0]).tolist()
+            dy = (rects_b[b, 1] - rects_a[a, 1]).tolist()
+            overlap = self.overlap
+            pairs = [(sprites_a[i], sprites_b[j]) for i, j, x, y in zip(a.tolist(), b.tolist(), dx, dy)
+                     if overlap(masks_a[i], masks_b[j], x, y)]
+        self.hits = len(pairs)
+        return pairs
+
+    def pairs(self, sprites: Iterable[pygame.sprite.Sprite]) -> List[Pair]:
+        """同じグループの中で当たっている組をすべて返す(敵同士など)"""
+        sprites = list(sprites)
+        rects = rect_array(sprites)
+        a, b = grid_pairs(rects, self.cell_size)
+        return self.filter(sprites, sprites, rects, rects, a, b)
+
+    def collide(self, group_a: Iterable[pygame.sprite.Sprite], group_b: Iterable[pygame.sprite.Sprite]) -> List[Pair]:
+        """group_aとgroup_bの間で当たっている組をすべて返す(弾と敵など)"""
+        sprites_a = list(group_a)
+        sprites_b = list(group_b)
+        rects_a = rect_array(sprites_a)
+        rects_b = rect_array(sprites_b)
+        a, b = sweep_between(rects_a, rects_b)
+        return self.filter(sprites_a, sprites_b, rects_a, rects_b, a, b)
+
+    def collide_sprite(self, sprite: pygame.sprite.Sprite, group: Iterable[pygame.sprite.Sprite]) -> List:
+        """spritecollideの代わり。spriteに当たっているgroupのスプライト"""
+        return [other for _, other in self.collide([sprite], group)]
+
+def benchmark(sizes=(10, 100, 1000, 10000), world=(1600, 1200)) -> None:
+    import random
+    import time
+    rng = random.Random(0)
+    image = pygame.Surface((16, 16), pygame.SRCALPHA)
+    pygame.draw.circle(image, (255, 255, 255), (8, 8), 8)
+    system = CollisionSystem()
+    print(f"{'bodies':>7} {'pairs ms':>9} {'candidates':>11} {'hits':>6} {'groupcollide ms':>16} {'player query ms':>16}")
+    for size in sizes:
+        group = pygame.sprite.Group()
+        for _ in range(size):
+            sprite = pygame.sprite.Sprite()
+            sprite.image = image
+            sprite.rect = image.get_rect(topleft=(rng.randrange(world[0]), rng.randrange(world[1])))
+            group.add(sprite)
+        start = time.perf_counter()
+        system.pairs(group)
+        elapsed = time.perf_counter() - start
+        candidates, hits = system.candidates, system.hits
+        naive = '-'
+        if size <= 1000:
+            # 矩形だけの総当たり(マスクまで付けると1000体で数秒かかる)
+            start = time.perf_counter()
+            pygame.sprite.groupcollide(group, group, False, False)
+            naive = f'{(time.perf_counter() - start) * 1000:.2f}'
+        player = group.sprites()[0]
+        start = time.perf_counter()
+        system.collide_sprite(player, group)
+        query = time.perf_counter() - start
+        print(f'{size:>7} {elapsed * 1000:>9.2f} {candidates:>11} {hits:>6} {naive:>16} {query * 1000:>16.3f}')
+
+def test():
+    pygame.init()
+    image = pygame.Surface((20, 20), pygame.SRCALPHA)
+    pygame.draw.circle(image, (255, 255, 255), (10, 10), 10)
+    sprites = []
+    for pos in ((0, 0), (18, 18), (15, 0), (100, 100)):
+        sprite = pygame.sprite.Sprite()
+        sprite.image = image
+        sprite.rect = image.get_rect(topleft=pos)
+        sprites.append(sprite)
+    system = CollisionSystem()
+    # (0,0)と(18,18)は矩形は重なるが円は離れている
+    print([(sprites.index(a), sprites.index(b)) for a, b in system.pairs(sprites)], system.candidates)
+    print([sprites.index(s) for s in system.collide_sprite(sprites[0], sprites[1:])])
+    benchmark()
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,382 @@
+"""
+ecs.py - アーキタイプ方式のECS(エンティティ・コンポーネント・システム)
+
+Player/Enemy/Character/GameEntityのようにクラスごとに属性を持つ代わりに、
+- Component: 名前とフィールドの型だけの定義(Position(x, y)など)。フィールドのないものはタグ
+- Archetype: 同じコンポーネントの組み合わせを持つエンティティの集まり。
+  コンポーネントごとにNumPyの構造化配列を1本持ち、行が詰まって並ぶ(消すときは最後の行で埋める)
+- World: エンティティの番号(世代つき)と、どのアーキタイプの何行目にいるかを持つ
+  コンポーネントを足す・外すとエンティティは別のアーキタイプに行ごと移る
+- Query: 指定したコンポーネントを全部持つアーキタイプの一覧。Worldに1回だけ作ってキャッシュし、
+  新しいアーキタイプができたときだけ追加する
+- System: Queryにマッチしたアーキタイプごとに配列をまとめて処理する
+  システムの中での作成・削除はworld.defer_*で積んでおき、システムが終わってから反映する
+"""
+
+import numpy as np
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+INDEX_BITS = 32
+INDEX_MASK = (1 << INDEX_BITS) - 1
+
+class Component():
+    def __init__(self, name: str, **fields) -> None:
+        self.name = name
+        self.fields = tuple(fields)
+        # タグ(フィールドなし)は配列を持たない
+        self.dtype = np.dtype([(field, kind) for field, kind in fields.items()]) if fields else None
+
+    def __repr__(self) -> str:
+        return f'Component({self.name})'
+
+# 戦闘・ランナー・拠点防衛で共通に使うコンポーネント
+Position = Component('position', x=np.float32, y=np.float32)
+Velocity = Component('velocity', x=np.float32, y=np.float32)
+Gravity = Component('gravity', value=np.float32, floor=np.float32)
+Health = Component('health', hp=np.int32, max_hp=np.int32)
+Energy = Component('energy', value=np.int32, max_value=np.int32)
+Block = Component('block', value=np.int32)
+Attack = Component('attack', damage=np.int32, defense=np.int32, speed=np.int32)
+Sprite = Component('sprite', frame_set=np.int32, phase=np.float32, phase_speed=np.float32)
+PlayerTag = Component('player')
+EnemyTag = Component('enemy')
+
+class Archetype():
+    def __init__(self, components: FrozenSet[Component], capacity: int = 64) -> None:
+        self.components = components
+        self.count = 0
+        self.entities = np.zeros(capacity, dtype=np.int64)
+        self.columns: Dict[Component, np.ndarray] = {
+            component: np.zeros(capacity, dtype=component.dtype) for component in components
+            if component.dtype is not None}
+
+    def grow(self) -> None:
+        capacity = len(self.entities) * 2
+        entities = np.zeros(capacity, dtype=np.int64)
+        entities[:self.count] = self.entities[:self.count]
+        self.entities = entities
+        for component, old in self.columns.items():
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            self.columns[component] = new
+
+    def append(self, entity: int) -> int:
+        if self.count == len(self.entities):
+            self.grow()
+        row = self.count
+        self.entities[row] = entity
+        for column in self.columns.values():
+            column[row] = 0
+        self.count += 1
+        return row
+
+    def extend(self, entities: np.ndarray) -> int:
+        """まとめて行を足す。最初の行番号を返す"""
+        while self.count + len(entities) > len(self.entities):
+            self.grow()
+        first = self.count
+        self.entities[first:first + len(entities)] = entities
+        for column in self.columns.values():
+            column[first:first + len(entities)] = 0
+        self.count += len(entities)
+        return first
+
+    def remove(self, row: int) -> Optional[int]:
+        """rowを最後の行で埋める。動いたエンティティを返す"""
+        last = self.count - 1
+        self.count = last
+        if row == last:
+            return None
+        moved = int(self.entities[last])
+        self.entities[row] = moved
+        for column in self.columns.values():
+            column[row] = column[last]
+        return moved
+
+    def view(self, component: Component) -> np.ndarray:
+        """使っている行だけの配列(コピーではないので書き込める)"""
+        return self.columns[component][:self.count]
+
+class Query():
+    def __init__(self, include: FrozenSet[Component], exclude: FrozenSet[Component]) -> None:
+        self.include = include
+        self.exclude = exclude
+        self.archetypes: List[Archetype] = []
+
+    def matches(self, archetype: Archetype) -> bool:
+        return self.include <= archetype.components and not (self.exclude & archetype.components)
+
+    def __iter__(self) -> Iterator[Archetype]:
+        return (archetype for archetype in self.archetypes if archetype.count)
+
+    def count(self) -> int:
+        return sum(archetype.count for archetype in self.archetypes)
+
+    def entities(self) -> np.ndarray:
+        parts = [archetype.entities[:archetype.count] for archetype in self]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+class World():
+    def __init__(self) -> None:
+        self.archetypes: Dict[FrozenSet[Component], Archetype] = {}
+        self.queries: Dict[Tuple[FrozenSet[Component], FrozenSet[Component]], Query] = {}
+        self.systems: List[Callable[['World', float], None]] = []
+        # エンティティ番号 = 世代 << 32 | 添字。消した添字は世代を進めて使い回す
+        self.generations: List[int] = []
+        self.locations: List[Optional[Tuple[Archetype, int]]] = []
+        self.free: List[int] = []
+        self.pending: List[Callable[[], None]] = []
+
+    def archetype(self, components: Iterable[Component]) -> Archetype:
+        key = frozenset(components)
+        archetype = self.archetypes.get(key)
+        if archetype is None:
+            archetype = self.archetypes[key] = Archetype(key)
+            for query in self.queries.values():
+                if query.matches(archetype):
+                    query.archetypes.append(archetype)
+        return archetype
+
+    def query(self, *include: Component, exclude: Sequence[Component] = ()) -> Query:
+        key = (frozenset(include), frozenset(exclude))
+        query = self.queries.get(key)
+        if query is None:
+            query = self.queries[key] = Query(*key)
+            query.archetypes = [archetype for archetype in self.archetypes.values() if query.matches(archetype)]
+        return query
+
+    def create(self, *components: Component, **values: Dict[str, float]) -> int:
+        """componentsを持つエンティティを作る。values={'health': {'hp': 10, ...}}で初期値"""
+        if self.free:
+            index = self.free.pop()
+        else:
+            index = len(self.generations)
+            self.generations.append(0)
+            self.locations.append(None)
+        entity = self.generations[index] << INDEX_BITS | index
+        archetype = self.archetype(components)
+        row = archetype.append(entity)
+        self.locations[index] = (archetype, row)
+        for component in components:
+            fields = values.get(component.name)
+            if fields:
+                self.set(entity, component, **fields)
+        return entity
+
+    def create_many(self, count: int, *components: Component) -> np.ndarray:
+        """同じアーキタイプにまとめて作る。値はarchetype.view()で配列ごと書く"""
+        reused = [self.free.pop() for _ in range(min(count, len(self.free)))]
+        first = len(self.generations)
+        added = count - len(reused)
+        self.generations.extend([0] * added)
+        self.locations.extend([None] * added)
+        indices = reused + list(range(first, first + added))
+        entities = np.array([self.generations[index] << INDEX_BITS | index for index in indices], dtype=np.int64)
+        archetype = self.archetype(components)
+        row = archetype.extend(entities)
+        for offset, index in enumerate(indices):
+            self.locations[index] = (archetype, row + offset)
+        return entities
+
+    def is_alive(self, entity: int) -> bool:
+        index = entity & INDEX_MASK
+        return (index < len(self.generations) and self.generations[index] == entity >> INDEX_BITS
+                and self.locations[index] is not None)
+
+    def location(self, entity: int) -> Tuple[Archetype, int]:
+        if not self.is_alive(entity):
+            raise KeyError(f'entity {entity} is not alive')
+        return self.locations[entity & INDEX_MASK]
+
+    def destroy(self, entity: int) -> None:
+        archetype, row = self.location(entity)
+        self.relocate(archetype.remove(row), archetype, row)
+        index = entity & INDEX_MASK
+        self.locations[index] = None
+        self.generations[index] += 1
+        self.free.append(index)
+
+    def relocate(self, moved: Optional[int], archetype: Archetype, row: int) -> None:
+        if moved is not None:
+            self.locations[moved & INDEX_MASK] = (archetype, row)
+
+    def move(self, entity: int, components: FrozenSet[Component]) -> None:
+        """エンティティを別のアーキタイプに移す。共通のコンポーネントの値は引き継ぐ"""
+        archetype, row = self.location(entity)
+        target = self.archetype(components)
+        new_row = target.append(entity)
+        for component, column in target.columns.items():
+            if component in archetype.columns:
+                column[new_row] = archetype.columns[component][row]
+        self.relocate(archetype.remove(row), archetype, row)
+        self.locations[entity & INDEX_MASK] = (target, new_row)
+
+    def add_component(self, entity: int, component: Component, **fields) -> None:
+        archetype, _ = self.location(entity)
+        if component not in archetype.components:
+            self.move(entity, archetype.components | {component})
+        if fields:
+            self.set(entity, component, **fields)
+
+    def remove_component(self, entity: int, component: Component) -> None:
+        archetype, _ = self.location(entity)
+        if component in archetype.components:
+            self.move(entity, archetype.components - {component})
+
+    def has(self, entity: int, component: Component) -> bool:
+        return component in self.location(entity)[0].components
+
+    def get(self, entity: int, component: Component) -> np.void:
+        """1体分の値(構造化配列の1行。書き込むと配列に反映される)"""
+        archetype, row = self.location(entity)
+        return archetype.columns[component][row]
+
+    def set(self, entity: int, component: Component, **fields) -> None:
+        record = self.get(entity, component)
+        for field, value in fields.items():
+            record[field] = value
+
+    def __len__(self) -> int:
+        return len(self.generations) - len(self.free)
+
+    def defer(self, function: Callable, *args) -> None:
+        """システムの途中では構造を変えず、終わってから実行する"""
+        self.pending.append(lambda: function(*args))
+
+    def defer_destroy(self, entity: int) -> None:
+        self.defer(self.destroy, entity)
+
+    def flush(self) -> None:
+        pending, self.pending = self.pending, []
+        for function in pending:
+            function()
+
+    def add_system(self, system: Callable[['World', float], None]) -> None:
+        self.systems.append(system)
+
+    def update(self, dt: float = 1.0) -> None:
+        for system in self.systems:
+            system(self, dt)
+            self.flush()
+
+class System():
+    """queryにマッチしたアーキタイプごとにprocess(archetype, dt)を呼ぶ"""
+    include: Tuple[Component, ...] = ()
+    exclude: Tuple[Component, ...] = ()
+
+    def __call__(self, world: World, dt: float) -> None:
+        for archetype in world.query(*self.include, exclude=self.exclude):
+            self.process(world, archetype, dt)
+
+    def process(self, world: World, archetype: Archetype, dt: float) -> None:
+        # サブクラスで上書きする(既定では何もしない)
+        pass
+
+class MovementSystem(System):
+    include = (Position, Velocity)
+
+    def process(self, world: World, archetype: Archetype, dt: float) -> None:
+        position = archetype.view(Position)
+        velocity = archetype.view(Velocity)
+        position['x'] += velocity['x'] * dt
+        position['y'] += velocity['y'] * dt
+
+class GravitySystem(System):
+    include = (Position, Velocity, Gravity)
+
+    def process(self, world: World, archetype: Archetype, dt: float) -> None:
+        position = archetype.view(Position)
+        velocity = archetype.view(Velocity)
+        gravity = archetype.view(Gravity)
+        velocity['y'] += gravity['value'] * dt
+        landed = position['y'] >= gravity['floor']
+        position['y'][landed] = gravity['floor'][landed]
+        velocity['y'][landed] = np.minimum(velocity['y'][landed], 0)
+
+class AnimationSystem(System):
+    include = (Sprite,)
+
+    def process(self, world: World, archetype: Archetype, dt: float) -> None:
+        sprite = archetype.view(Sprite)
+        sprite['phase'] += sprite['phase_speed'] * dt
+
+class DeathSystem(System):
+    """HPが0になったエンティティを消す"""
+    include = (Health,)
+
+    def process(self, world: World, archetype: Archetype, dt: float) -> None:
+        health = archetype.view(Health)
+        for entity in archetype.entities[:archetype.count][health['hp'] <= 0]:
+            world.defer_destroy(int(entity))
+
+def apply_damage(world: World, entity: int, damage: int) -> int:
+    """Blockで受けてから残りをHPに。実際に減ったHPを返す(battle.Enemy.actと同じ計算)"""
+    health = world.get(entity, Health)
+    taken = damage
+    if world.has(entity, Block):
+        block = world.get(entity, Block)
+        taken = max(0, damage - int(block['value']))
+        block['value'] = max(0, int(block['value']) - damage)
+    health['hp'] = max(0, int(health['hp']) - taken)
+    return taken
+
+def test():
+    import time
+
+    world = World()
+    world.add_system(GravitySystem())
+    world.add_system(MovementSystem())
+    world.add_system(AnimationSystem())
+    world.add_system(DeathSystem())
+
+    player = world.create(PlayerTag, Health, Energy, Block, health={'hp': 100, 'max_hp': 100},
+                          energy={'value': 3, 'max_value': 3}, block={'value': 5})
+    enemy = world.create(EnemyTag, Health, Attack, health={'hp': 40, 'max_hp': 40}, attack={'damage': 12})
+    print(apply_damage(world, player, int(world.get(enemy, Attack)['damage'])), world.get(player, Health),
+          world.get(player, Block))
+
+    runner = world.create(PlayerTag, Position, Velocity, Gravity, Sprite,
+                          position={'x': 80, 'y': 200}, gravity={'value': 1, 'floor': 300})
+    world.add_component(runner, Health, hp=1, max_hp=1)
+    for _ in range(30):
+        world.update()
+    print(world.get(runner, Position), world.query(PlayerTag).count(), len(world.archetypes))
+    apply_damage(world, enemy, 50)
+    world.update()
+    print(world.is_alive(enemy), world.is_alive(player), len(world))
+
+    # 10万体の移動: ECSと、オブジェクトの属性を1体ずつ書き換える場合
+    count = 100000
+    entities = world.create_many(count, Position, Velocity, Sprite)
+    for archetype in world.query(Position, Velocity, exclude=(Gravity,)):
+        archetype.view(Velocity)['x'] = -6
+        archetype.view(Sprite)['phase_speed'] = 0.1
+    movement = MovementSystem()
+    start = time.perf_counter()
+    for _ in range(10):
+        movement(world, 1.0)
+    ecs = (time.perf_counter() - start) / 10
+
+    class Mover():
+        def __init__(self):
+            self.x = 0.0
+            self.y = 0.0
+            self.vx = -6.0
+            self.vy = 0.0
+    movers = [Mover() for _ in range(count)]
+    start = time.perf_counter()
+    for _ in range(10):
+        for mover in movers:
+            mover.x += mover.vx
+            mover.y += mover.vy
+    objects = (time.perf_counter() - start) / 10
+    print(f'{count} movers: ecs {ecs * 1000:.2f}ms, objects {objects * 1000:.2f}ms')
+
+    start = time.perf_counter()
+    for entity in entities[::2]:
+        world.destroy(int(entity))
+    print(f'destroy {count // 2}: {(time.perf_counter() - start) * 1000:.1f}ms, '
+          f'{world.query(Position, Velocity).count()} left, stale alive: {world.is_alive(int(entities[0]))}')
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,225 @@
+"""
+entity_store.py - 大量のスプライトの移動とアニメーションを配列でまとめて更新する
+
+Group.update()はスプライトごとにPythonでrect.xやアニメーションの番号を進めるので、
+数千体になると更新だけでフレームの時間を使い切る。
+EntityStoreは位置・速度・重力・地面の高さ・アニメーションの位相をNumPyの配列で持ち、
+update()1回で全員を進める。
+
+- EntitySprite: 配列の1行を指すスプライト。imageとrectは配列から読むので、
+  当たり判定(collision.py)などは今までどおりsprite.rectで使える
+- EntityGroup: draw()でまとめてblits()する(スプライトごとのrectを作らない)
+- フレームのリストはregister_frames()で登録し、番号(frame_set)で参照する
+"""
+
+import numpy as np
+import pygame
+from typing import List, Optional, Sequence
+from .sprite_pool import PooledSprite
+
+class EntityStore():
+    def __init__(self, capacity: int = 1024) -> None:
+        self.count = 0
+        self.free: List[int] = []
+        self.x = np.zeros(capacity, dtype=np.float32)        # 左上
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.vx = np.zeros(capacity, dtype=np.float32)       # 1tickあたり
+        self.vy = np.zeros(capacity, dtype=np.float32)
+        self.gravity = np.zeros(capacity, dtype=np.float32)
+        self.floor = np.full(capacity, np.inf, dtype=np.float32)  # 下端がこれより下に行かない
+        self.width = np.zeros(capacity, dtype=np.int32)
+        self.height = np.zeros(capacity, dtype=np.int32)
+        self.phase = np.zeros(capacity, dtype=np.float32)    # アニメーションの位相(フレーム番号の小数)
+        self.phase_speed = np.zeros(capacity, dtype=np.float32)
+        self.frame_set = np.zeros(capacity, dtype=np.int32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.owners: List[Optional[object]] = [None] * capacity  # 行を使っているスプライト
+        # 登録されたフレームは1本のリストに並べ、frame_setごとの先頭位置と枚数を持つ
+        self.frames: List[pygame.Surface] = []
+        self.set_start = np.zeros(0, dtype=np.int32)
+        self.set_length = np.zeros(0, dtype=np.int32)
+
+    def register_frames(self, frames: Sequence[pygame.Surface]) -> int:
+        """フレームのリストを登録して番号を返す"""
+        self.set_start = np.append(self.set_start, len(self.frames)).astype(np.int32)
+        self.set_length = np.append(self.set_length, len(frames)).astype(np.int32)
+        self.frames.extend(frames)
+        return len(self.set_start) - 1
+
+    def grow(self) -> None:
+        capacity = len(self.x) * 2
+        for name in ('x', 'y', 'vx', 'vy', 'gravity', 'floor', 'width', 'height', 'phase', 'phase_speed',
+                     'frame_set', 'alive'):
+            old = getattr(self, name)
+            new = np.full(capacity, np.inf, dtype=old.dtype) if name == 'floor' else np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        self.owners.extend([None] * (capacity - len(self.owners)))
+
+    def add(self, frame_set: int, x: float, y: float, vx: float = 0.0, vy: float = 0.0, gravity: float = 0.0,
+            floor: float = np.inf, phase_speed: float = 0.0, owner: Optional[object] = None) -> int:
+        if self.free:
+            index = self.free.pop()
+        else:
+            if self.count == len(self.x):
+                self.grow()
+            index = self.count
+            self.count += 1
+        width, height = self.frames[self.set_start[frame_set]].get_size()
+        self.x[index] = x
+        self.y[index] = y
+        self.vx[index] = vx
+        self.vy[index] = vy
+        self.gravity[index] = gravity
+        self.floor[index] = floor
+        self.width[index] = width
+        self.height[index] = height
+        self.phase[index] = 0.0
+        self.phase_speed[index] = phase_speed
+        self.frame_set[index] = frame_set
+        self.alive[index] = True
+        self.owners[index] = owner
+        return index
+
+    def remove(self, index: int) -> None:
+        if self.alive[index]:
+            self.alive[index] = False
+            self.vx[index] = self.vy[index] = self.gravity[index] = self.phase_speed[index] = 0.0
+            self.owners[index] = None
+            self.free.append(index)
+
+    def update(self, dt: float = 1.0) -> None:
+        """全員を1tick進める(生きていない行も計算するが、速度0なので動かない)"""
+        n = self.count
+        vy = self.vy[:n]
+        y = self.y[:n]
+        vy += self.gravity[:n] * dt
+        self.x[:n] += self.vx[:n] * dt
+        y += vy * dt
+        # 地面より下に行ったら地面に立たせる
+        ground = self.floor[:n] - self.height[:n]
+        landed = y > ground
+        y[landed] = ground[landed]
+        vy[landed] = 0.0
+        phase = self.phase[:n]
+        phase += self.phase_speed[:n] * dt
+        np.fmod(phase, self.set_length[self.frame_set[:n]], out=phase)
+
+    def frame_indices(self, indices: np.ndarray) -> np.ndarray:
+        """各エンティティが今表示するフレームのself.framesでの番号"""
+        return self.set_start[self.frame_set[indices]] + self.phase[indices].astype(np.int32)
+
+    def image(self, index: int) -> pygame.Surface:
+        return self.frames[int(self.set_start[self.frame_set[index]]) + int(self.phase[index])]
+
+    def rect(self, index: int) -> pygame.Rect:
+        return pygame.Rect(int(self.x[index]), int(self.y[index]), int(self.width[index]), int(self.height[index]))
+
+    def landed(self, index: int) -> bool:
+        return bool(self.y[index] + self.height[index] >= self.floor[index])
+
+    def outside(self, left: float, right: float) -> np.ndarray:
+        """x方向で[left, right)から完全に出た生きているエンティティ"""
+        n = self.count
+        out = (self.x[:n] + self.width[:n] <= left) | (self.x[:n] >= right)
+        return np.nonzero(out & self.alive[:n])[0]
+
+    def owners_of(self, indices: np.ndarray) -> List[object]:
+        return [self.owners[index] for index in indices.tolist()]
+
+class EntitySprite(PooledSprite):
+    """EntityStoreの1行を指すスプライト。kill()すると行も空く"""
+    def __init__(self) -> None:
+        super().__init__()
+        self.store: Optional[EntityStore] = None
+        self.entity = -1
+
+    def reset(self, store: EntityStore, frame_set: int, x: float, y: float, **motion) -> None:
+        self.store = store
+        self.entity = store.add(frame_set, x, y, owner=self, **motion)
+
+    @property
+    def image(self) -> pygame.Surface:
+        return self.store.image(self.entity)
+
+    @property
+    def rect(self) -> pygame.Rect:
+        return self.store.rect(self.entity)
+
+    def kill(self) -> None:
+        if self.store is not None and self.entity >= 0:
+            self.store.remove(self.entity)
+            self.entity = -1
+        super().kill()
+
+class EntityGroup(pygame.sprite.Group):
+    """storeのEntitySpriteを入れるグループ(storeごとに1つ)。描画はstoreの生きている行を配列からまとめて作る"""
+    def __init__(self, store: EntityStore, *sprites) -> None:
+        super().__init__(*sprites)
+        self.store = store
+
+    def draw(self, surface: pygame.Surface) -> None:
+        store = self.store
+        indices = np.nonzero(store.alive[:store.count])[0]
+        frames = store.frames
+        images = [frames[k] for k in store.frame_indices(indices).tolist()]
+        positions = np.stack([store.x[indices], store.y[indices]], axis=1).astype(np.int32).tolist()
+        surface.blits(list(zip(images, positions)), doreturn=False)
+
+def test():
+    import time
+    pygame.init()
+    surface = pygame.Surface((800, 400))
+    store = EntityStore()
+    fly = store.register_frames([pygame.Surface((24, 16)) for _ in range(2)])
+    snail = store.register_frames([pygame.Surface((32, 24)) for _ in range(2)])
+    group = EntityGroup(store)
+    rng = np.random.default_rng(0)
+    for i in range(5000):
+        sprite = EntitySprite()
+        frame_set = fly if i % 4 == 0 else snail
+        sprite.reset(store, frame_set, float(rng.uniform(0, 800)), float(rng.uniform(0, 300)),
+                     vx=-8.0 if frame_set == fly else -6.0, gravity=0.0 if frame_set == fly else 1.0,
+                     floor=300.0, phase_speed=0.1)
+        group.add(sprite)
+
+    start = time.perf_counter()
+    for _ in range(100):
+        store.update()
+    update = (time.perf_counter() - start) / 100
+    start = time.perf_counter()
+    for _ in range(10):
+        group.draw(surface)
+    draw = (time.perf_counter() - start) / 10
+
+    # 比べる: 同じことをスプライトごとにPythonで行う(pixel_runのObstacleと同じ書き方)
+    class Plain(pygame.sprite.Sprite):
+        def __init__(self, frames):
+            super().__init__()
+            self.frames = frames
+            self.index = 0
+            self.image = frames[0]
+            self.rect = self.image.get_rect(topleft=(400, 200))
+
+        def update(self):
+            self.index += 0.1
+            if self.index >= len(self.frames): self.index = 0
+            self.image = self.frames[int(self.index)]
+            self.rect.x -= 6
+
+    plain = pygame.sprite.Group(*(Plain(store.frames[2:4]) for _ in range(5000)))
+    start = time.perf_counter()
+    for _ in range(10):
+        plain.update()
+    plain_update = (time.perf_counter() - start) / 10
+    print(f'5000 entities: update {update * 1000:.3f}ms (Group.update {plain_update * 1000:.2f}ms), '
+          f'draw {draw * 1000:.2f}ms')
+    sprite = group.sprites()[1]
+    print(sprite.rect, store.landed(sprite.entity), len(store.outside(0, 800)))
+    for offscreen in store.owners_of(store.outside(0, 800)):
+        offscreen.kill()
+    sprite.kill()
+    print(len(group), len(store.free))
+
+if __name__ == '__main__':
+    test()
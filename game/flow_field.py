@@ -0,0 +1,265 @@
+"""
+flow_field.py - コアへ向かう流れ場(Dijkstraマップ)
+
+攻撃側のユニットは全員同じコアを目指すので、ユニットごとにA*をせずに
+「各タイルからコアまでの距離」と「次に進む方向」をマップ全体で1回だけ求める。
+ユニットは自分のタイルの方向を配列から引くだけでよい(direction_at)。
+
+- 最初の計算はNumPyのシフト演算による幅優先探索(距離1ずつ波を広げる)
+- 施設が建った/壊れたときはBaseMapの変更記録を見て、影響する範囲だけ直す
+  - 通れるようになったタイル: 周りから距離が縮む所だけ広げる
+  - 通れなくなったタイル: そこを経由していたタイルを無効にして、境界から埋め直す
+  - 直す範囲がマップのrepair_limit(既定3%)を超えたら、全体をNumPyで計算し直すほうが速いので切り替える
+"""
+
+import heapq
+import numpy as np
+from typing import Iterable, List, Optional, Tuple
+from .base_map import BaseMap
+
+UNREACHABLE = np.iinfo(np.int32).max
+# 上下左右(方向の番号 0〜3)
+STEPS = np.array([(0, -1), (0, 1), (-1, 0), (1, 0)], dtype=np.int8)
+
+class FlowField():
+    # 修復は1タイル20us前後、120x80の全体計算は6ms前後なので、マップの3%(約300タイル)あたりが分かれ目
+    def __init__(self, base_map: BaseMap, targets: Optional[List[Tuple[int, int]]] = None,
+                 repair_limit: float = 0.03) -> None:
+        self.base_map = base_map
+        self.fixed_targets = targets
+        self.repair_limit = max(int(base_map.width * base_map.height * repair_limit), 1)
+        self.version = -1
+        self.repaired = 0
+        self.update()
+
+    def target_tiles(self) -> List[Tuple[int, int]]:
+        if self.fixed_targets is not None:
+            return self.fixed_targets
+        base_map = self.base_map
+        if base_map.core_index < 0:
+            return []
+        index = base_map.core_index
+        return [(int(base_map.tile_x[index]), int(base_map.tile_y[index]))]
+
+    def update(self) -> None:
+        """マップが変わっていたら直す。変わっていなければ何もしない"""
+        base_map = self.base_map
+        if self.version == base_map.version:
+            return
+        targets = self.target_tiles()
+        changes = base_map.changes_since(self.version) if self.version >= 0 else None
+        if changes is None or targets != self.targets or not self.repair(changes):
+            self.compute(targets)
+        self.version = base_map.version
+
+    #---- 全体の計算 ----
+    def compute(self, targets: List[Tuple[int, int]]) -> None:
+        self.targets = targets
+        passable = self.base_map.passable()
+        self.passable = passable
+        height, width = passable.shape
+        distance = np.full((height, width), UNREACHABLE, dtype=np.int32)
+        frontier = np.zeros((height, width), dtype=bool)
+        for x, y in targets:
+            distance[y, x] = 0
+            frontier[y, x] = True
+        step = 0
+        while frontier.any():
+            step += 1
+            grown = np.zeros_like(frontier)
+            grown[1:, :] |= frontier[:-1, :]
+            grown[:-1, :] |= frontier[1:, :]
+            grown[:, 1:] |= frontier[:, :-1]
+            grown[:, :-1] |= frontier[:, 1:]
+            grown &= passable & (distance == UNREACHABLE)
+            distance[grown] = step
+            frontier = grown
+        self.distance = distance
+        self.direction = np.zeros((height, width, 2), dtype=np.int8)
+        self.update_directions(0, 0, width, height)
+
+    def update_directions(self, x0: int, y0: int, x1: int, y1: int) -> None:
+        """[x0, x1) x [y0, y1) の範囲で、一番距離の小さい隣へ向く方向を求める"""
+        height, width = self.distance.shape
+        x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, width), min(y1, height)
+        padded = np.pad(self.distance, 1, constant_values=UNREACHABLE)
+        neighbours = np.stack([padded[y0 + 1 + dy:y1 + 1 + dy, x0 + 1 + dx:x1 + 1 + dx] for dx, dy in STEPS])
+        best = np.argmin(neighbours, axis=0)
+        best_distance = np.take_along_axis(neighbours, best[None], axis=0)[0]
+        own = self.distance[y0:y1, x0:x1]
+        moving = (own != UNREACHABLE) & (own > 0) & (best_distance < own)
+        direction = STEPS[best]
+        direction[~moving] = 0
+        self.direction[y0:y1, x0:x1] = direction
+
+    #---- 差分の修復 ----
+    def neighbours(self, x: int, y: int) -> Iterable[Tuple[int, int]]:
+        height, width = self.distance.shape
+        for dx, dy in STEPS:
+            nx, ny = x + int(dx), y + int(dy)
+            if 0 <= nx < width and 0 <= ny < height:
+                yield nx, ny
+
+    def repair(self, changes: List[Tuple[int, int]]) -> bool:
+        """変わったタイルの周りだけ直す。範囲が広すぎたらFalse(全体を計算し直す)"""
+        distance = self.distance
+        passable = self.base_map.passable()
+        targets = set(self.targets)
+        repaired = 0
+        for x, y in dict.fromkeys(changes):
+            was = self.passable[y, x]
+            now = passable[y, x]
+            self.passable[y, x] = now
+            if was == now or (x, y) in targets:
+                continue
+            if now:
+                seeds = [(x, y)]
+                distance[y, x] = UNREACHABLE
+            else:
+                # invalidateは方向をたどるので、前の変更の分の方向は直してから呼ぶ
+                seeds = self.invalidate(x, y, self.repair_limit - repaired)
+                if seeds is None:
+                    return False
+            changed = self.refill(seeds, self.repair_limit - repaired - len(seeds))
+            if changed is None:
+                return False
+            touched = seeds + changed
+            xs = [tx for tx, _ in touched]
+            ys = [ty for _, ty in touched]
+            self.update_directions(min(xs) - 1, min(ys) - 1, max(xs) + 2, max(ys) + 2)
+            repaired += len(touched)
+        self.repaired += repaired
+        return True
+
+    def invalidate(self, x: int, y: int, limit: int) -> Optional[List[Tuple[int, int]]]:
+        """(x, y)を経由してコアへ向かっていたタイルを全部無効にする"""
+        distance = self.distance
+        direction = self.direction
+        distance[y, x] = UNREACHABLE
+        invalid = [(x, y)]
+        stack = [(x, y)]
+        while stack:
+            cx, cy = stack.pop()
+            for nx, ny in self.neighbours(cx, cy):
+                if distance[ny, nx] == UNREACHABLE:
+                    continue
+                dx, dy = direction[ny, nx]
+                if nx + dx == cx and ny + dy == cy:
+                    distance[ny, nx] = UNREACHABLE
+                    invalid.append((nx, ny))
+                    stack.append((nx, ny))
+            if len(invalid) > limit:
+                return None
+        return invalid
+
+    def refill(self, seeds: List[Tuple[int, int]], limit: int) -> Optional[List[Tuple[int, int]]]:
+        """seedsの周りの有効な距離から埋め直し、縮んだ所を広げていく"""
+        distance = self.distance
+        passable = self.passable
+        queue = []
+        for x, y in seeds:
+            if not passable[y, x]:
+                continue
+            best = min((distance[ny, nx] for nx, ny in self.neighbours(x, y)), default=UNREACHABLE)
+            if best != UNREACHABLE:
+                heapq.heappush(queue, (int(best) + 1, x, y))
+        changed = []
+        while queue:
+            d, x, y = heapq.heappop(queue)
+            if d >= distance[y, x]:
+                continue
+            distance[y, x] = d
+            changed.append((x, y))
+            if len(changed) > limit:
+                return None
+            for nx, ny in self.neighbours(x, y):
+                if passable[ny, nx] and d + 1 < distance[ny, nx]:
+                    heapq.heappush(queue, (d + 1, nx, ny))
+        return changed
+
+    #---- ユニットからの参照 ----
+    def direction_at(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """ワールド座標の配列から進む方向(dx, dy)の配列を引く"""
+        size = self.base_map.tile_size
+        height, width = self.distance.shape
+        tx = np.clip((xs // size).astype(np.int64), 0, width - 1)
+        ty = np.clip((ys // size).astype(np.int64), 0, height - 1)
+        return self.direction[ty, tx]
+
+def test():
+    import time
+    from .base_map import CORE, MAX_CHANGES, TURRET, WALL
+
+    base_map = BaseMap(120, 80)
+    base_map.add_facility(CORE, 100, 40)
+    for y in range(10, 70):
+        base_map.add_facility(WALL, 60, y)
+    start = time.perf_counter()
+    field = FlowField(base_map)
+    print(f'full compute 120x80: {(time.perf_counter() - start) * 1000:.2f}ms, '
+          f'distance from (0, 40): {field.distance[40, 0]}')
+
+    # 道の脇・離れた所にタレットを置く(局所的) → 壁の端をふさぐ(大きく遠回り) → 真ん中が壊れる(近道ができる)
+    # 既定の流れ場の時間と、repair_limit=1.0で必ず修復したときの時間、全体を計算し直す時間を比べる
+    repairing = FlowField(base_map, repair_limit=1.0)
+    for name, change in (('turret by the path', lambda: base_map.add_facility(TURRET, 90, 45)),
+                         ('turret far away', lambda: base_map.add_facility(TURRET, 30, 5)),
+                         ('block the wall end', lambda: base_map.add_facility(WALL, 60, 9)),
+                         ('destroy the wall', lambda: base_map.remove_facility(int(base_map.tiles[40, 60])))):
+        change()
+        before = field.repaired, repairing.repaired
+        start = time.perf_counter()
+        field.update()
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        repairing.update()
+        forced = time.perf_counter() - start
+        start = time.perf_counter()
+        check = FlowField(base_map)
+        full = time.perf_counter() - start
+        repaired = field.repaired - before[0]
+        print(f'{name}: {elapsed * 1000:.2f}ms ({f"repaired {repaired} tiles" if repaired else "recomputed"}), '
+              f'repair {repairing.repaired - before[1]} tiles {forced * 1000:.2f}ms vs recompute {full * 1000:.2f}ms, '
+              f'matches: {np.array_equal(field.distance, check.distance) and np.array_equal(repairing.distance, check.distance)}')
+
+    # 1回のupdateで複数の変更: 壁に穴を開けて、すぐ隣をふさぐ
+    mismatches = 0
+    repaired = 0
+    rng = np.random.default_rng(1)
+    for trial in range(42):
+        small = BaseMap(40, 30)
+        small.add_facility(CORE, 35, 15)
+        for y in range(2, 28):
+            small.add_facility(WALL, 20, y)
+        batched = FlowField(small, repair_limit=1.0)
+        gap = int(rng.integers(3, 27))
+        small.remove_facility(int(small.tiles[gap, 20]))
+        small.add_facility(TURRET, 19 if trial % 2 else 21, gap)
+        before = batched.repaired
+        batched.update()
+        repaired += batched.repaired - before
+        mismatches += not np.array_equal(batched.distance, FlowField(small).distance)
+    print(f'batched gap + block: {mismatches}/42 differ from full recompute, repaired {repaired} tiles')
+
+    # 変更の記録は上限までしか残らない。古すぎるversionからは全体の計算になる
+    log = BaseMap(40, 30)
+    stale = FlowField(log)
+    for i in range(MAX_CHANGES + 10):
+        log.add_facility(WALL, i % 40, 29)
+        log.remove_facility(int(log.tiles[29, i % 40]))
+    stale.update()
+    print(f'change log: {len(log.changed_tiles)} entries kept, since 0: {log.changes_since(0)}, '
+          f'stale field matches: {np.array_equal(stale.distance, FlowField(log).distance)}')
+
+    rng = np.random.default_rng(0)
+    xs = rng.uniform(0, 120 * 32, 500)
+    ys = rng.uniform(0, 80 * 32, 500)
+    start = time.perf_counter()
+    for _ in range(60):
+        step = field.direction_at(xs, ys)
+        xs += step[:, 0] * 2.0
+        ys += step[:, 1] * 2.0
+    print(f'500 units x 60 frames: {(time.perf_counter() - start) * 1000:.2f}ms')
+
+if __name__ == '__main__':
+    test()
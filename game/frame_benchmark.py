@@ -0,0 +1,181 @@
+"""
+frame_benchmark.py - ゲームループ全体のベンチマーク(ヘッドレス)
+
+SDLのdummyドライバでGameManagerを起動し、SCENE_LISTの全シーンを順番に回す。
+各シーンでは決まった入力(マウス移動・クリック・キー)をイベントキューに積みながら
+handle_event → update → draw → present を指定フレーム数だけ実行し、
+- シーンごとのフレーム時間の分布(p50/p95/p99/平均/最大)
+- tracemallocで測ったシーンごとの確保量とピーク(時間の計測とは別の周回で測る)
+- プロセスのピークRSS
+をJSONで出す。--baselineに前のコミットのJSONを渡すと、しきい値を超えて遅く/重くなった項目を
+表示して終了コード1を返す(CIやコミットごとの比較用)。
+
+    python -m game.frame_benchmark --frames 300 --output bench.json
+    python -m game.frame_benchmark --baseline bench.json --threshold 0.25
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pygame
+from typing import Dict, List, Optional
+from .constants import SCREEN_WIDTH, SCREEN_HEIGHT, SCENE_LIST
+
+# シーン番号 -> 切り替えキー(InputManager.handle_event_sceneと同じ割り当て)
+SCENE_KEYS = [pygame.K_a, pygame.K_b, pygame.K_c, pygame.K_d, pygame.K_e, pygame.K_f]
+# 比べる項目と、どちらが悪いか(大きいほど悪い)
+COMPARED = ('p50_ms', 'p95_ms', 'p99_ms', 'alloc_peak_kb')
+
+def scripted_events(frame: int) -> List[pygame.event.Event]:
+    """フレーム番号から決まる入力。毎回同じなので結果を比べられる"""
+    x = (frame * 37) % SCREEN_WIDTH
+    y = (frame * 23) % SCREEN_HEIGHT
+    events = [pygame.event.Event(pygame.MOUSEMOTION, pos=(x, y), rel=(37, 23), buttons=(0, 0, 0))]
+    if frame % 30 == 10:
+        events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(x, y), button=1))
+    if frame % 30 == 12:
+        events.append(pygame.event.Event(pygame.MOUSEBUTTONUP, pos=(x, y), button=1))
+    if frame % 45 == 20:
+        events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_SPACE, mod=0, unicode=' ', scancode=0))
+    return events
+
+def peak_rss_kb() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:  # Windowsにはresourceがない
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss  # macOSはバイト、Linuxはキロバイト
+
+class FrameBenchmark():
+    def __init__(self, frames: int = 120, warmup: int = 10) -> None:
+        self.frames = frames
+        self.warmup = warmup
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+        pygame.init()
+        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        # GameManagerは毎フレームprintするので、計測中は出力を捨てる
+        with contextlib.redirect_stdout(io.StringIO()):
+            from . import GameManager
+            self.game_manager = GameManager(self.screen, SCENE_LIST)
+
+    def enter_scene(self, index: int) -> None:
+        scene_manager = self.game_manager.scene_manager
+        if index < len(SCENE_KEYS):
+            pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=SCENE_KEYS[index], mod=0, unicode='', scancode=0))
+            self.frame(0)
+        else:
+            scene_manager.change_scene(scene_manager.scenes[index])  # キーの割り当てがないシーン
+        if scene_manager.get_current_scene() is not scene_manager.scenes[index]:
+            raise RuntimeError(f'could not switch to scene {scene_manager.scenes[index].name}')
+
+    def frame(self, number: int) -> float:
+        for event in scripted_events(number):
+            pygame.event.post(event)
+        game_manager = self.game_manager
+        start = time.perf_counter()
+        game_manager.handle_event()
+        game_manager.update()
+        self.screen.fill((0, 0, 0))
+        game_manager.draw()
+        game_manager.present()
+        return time.perf_counter() - start
+
+    def run_scene(self, index: int) -> np.ndarray:
+        self.enter_scene(index)
+        for number in range(self.warmup):
+            self.frame(number)
+        return np.array([self.frame(number) for number in range(self.frames)])
+
+    def run(self) -> Dict:
+        scenes = self.game_manager.scene_manager.scenes
+        report = {'scenes': {}}
+        with contextlib.redirect_stdout(io.StringIO()):
+            # 1周目: 時間だけ測る(tracemallocは遅くなるので止めておく)
+            for index, scene in enumerate(scenes):
+                times = self.run_scene(index) * 1000
+                report['scenes'][scene.name] = {
+                    'frames': len(times),
+                    'p50_ms': float(np.percentile(times, 50)), 'p95_ms': float(np.percentile(times, 95)),
+                    'p99_ms': float(np.percentile(times, 99)), 'mean_ms': float(times.mean()),
+                    'max_ms': float(times.max()),
+                }
+            # 2周目: シーンごとの確保量
+            tracemalloc.start()
+            for index, scene in enumerate(scenes):
+                before, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                self.run_scene(index)
+                current, peak = tracemalloc.get_traced_memory()
+                report['scenes'][scene.name]['alloc_retained_kb'] = (current - before) / 1024
+                report['scenes'][scene.name]['alloc_peak_kb'] = (peak - before) / 1024
+            tracemalloc.stop()
+        report['peak_rss_kb'] = peak_rss_kb()
+        report['meta'] = {
+            'frames_per_scene': self.frames, 'warmup': self.warmup, 'python': platform.python_version(),
+            'pygame': pygame.version.ver, 'platform': platform.platform(),
+            'commit': os.environ.get('GIT_COMMIT', ''),
+        }
+        return report
+
+def compare(report: Dict, baseline: Dict, threshold: float = 0.2) -> List[str]:
+    """baselineよりthresholdの割合以上悪くなった項目の一覧(空なら合格)"""
+    failures = []
+    for name, metrics in report['scenes'].items():
+        old = baseline.get('scenes', {}).get(name)
+        if old is None:
+            continue
+        for key in COMPARED:
+            if key in metrics and key in old and old[key] > 0 and metrics[key] > old[key] * (1 + threshold):
+                failures.append(f'{name}.{key}: {old[key]:.3f} -> {metrics[key]:.3f} '
+                                f'(+{(metrics[key] / old[key] - 1) * 100:.0f}%)')
+    old_rss = baseline.get('peak_rss_kb')
+    if old_rss and report.get('peak_rss_kb') and report['peak_rss_kb'] > old_rss * (1 + threshold):
+        failures.append(f'peak_rss_kb: {old_rss} -> {report["peak_rss_kb"]}')
+    return failures
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='headless end-to-end frame benchmark')
+    parser.add_argument('--frames', type=int, default=120, help='measured frames per scene')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--output', help='write the report JSON here')
+    parser.add_argument('--baseline', help='report JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed regression ratio (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    report = FrameBenchmark(args.frames, args.warmup).run()
+    print(f"{'scene':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'alloc peak KB':>14}")
+    for name, metrics in report['scenes'].items():
+        print(f"{name:<10} {metrics['p50_ms']:>8.3f} {metrics['p95_ms']:>8.3f} {metrics['p99_ms']:>8.3f} "
+              f"{metrics['max_ms']:>8.3f} {metrics['alloc_peak_kb']:>14.1f}")
+    print(f"peak RSS: {report['peak_rss_kb']} KB")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            failures = compare(report, json.load(file), args.threshold)
+        for failure in failures:
+            print(f'REGRESSION {failure}')
+        print('FAIL' if failures else 'PASS')
+        return 1 if failures else 0
+    return 0
+
+def test():
+    report = FrameBenchmark(frames=30, warmup=5).run()
+    print({name: round(metrics['p50_ms'], 3) for name, metrics in report['scenes'].items()}, report['peak_rss_kb'])
+    slower = json.loads(json.dumps(report))
+    for metrics in slower['scenes'].values():
+        metrics['p95_ms'] *= 2
+    print(compare(report, report), compare(slower, report)[:2])
+
+if __name__ == '__main__':
+    sys.exit(main())
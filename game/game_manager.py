@@ -2,17 +2,31 @@ import pygame
 from .scene_manager import SceneManager
 from .input_manager import InputManager
 from .render_manager import RenderManager
-from .save_load_manager import SaveLoadManager
+from .lazy import Deferred, warmup
 
 class GameManager():
+    #最初のフレームに要らないものは、最初に使われたとき(かwarmup)に作る
+    save_load_manager = Deferred('.save_load_manager', 'SaveLoadManager')
+    resources = Deferred('.resource_manager', 'resources', construct=False)
+    cards = Deferred('.card', 'load_cards')
+    audio = Deferred('.audio_manager', 'AudioManager')
+    game_state = Deferred('.game_state', 'GameState')
+    DEFERRED = ('save_load_manager', 'resources', 'cards', 'audio', 'game_state')
+
     def __init__(self, screen, scene_list):
         self.running = True
         self.screen = screen
         self.scene_list = scene_list
+        #最初のフレームを描くのに必要なものだけ作る
         self.scene_manager = SceneManager(scene_list)
         self.input_manager = InputManager(self.scene_manager.scenes)
         self.render_manager = RenderManager(screen)
-        self.save_load_manager = SaveLoadManager()
+        #今の戦闘とインベントリ(snapshot/restoreの対象)
+        self.battle = None
+        self.inventory = None
+
+    def warmup(self):#後で使うサブシステムを別スレッドで先に作っておく
+        return warmup(self, self.DEFERRED)
 
     def handle_event(self):#self.events_happenedで受け取る
         self.events_happened = self.input_manager.handle_event()
@@ -30,11 +44,36 @@ class GameManager():
         print('update')
 
     def draw(self):
-        self.render_manager.clear
+        self.render_manager.clear()
         self.render_manager.draw()
-        self.render_manager.present()
         print('draw')
 
+    def present(self):#描いた画面を表示する(計測で描画と分けるためdrawとは別)
+        self.render_manager.present()
+
+    def start_battle(self, battle):#戦闘の状態をgame_stateの配列に移して巻き戻しの対象にする(以後はself.battleを使う)
+        battle.player.rng = battle.enemy.rng = self.game_state.rng
+        self.battle = self.game_state.bind_battle(battle)
+
+    def set_inventory(self, inventory):#インベントリもgame_stateの配列に移す(以後はself.inventoryを使う)
+        self.inventory = self.game_state.bind_inventory(inventory)
+
+    def snapshot(self):#戦闘とインベントリ, 乱数はもともとgame_stateの配列にあるので、シーンを書いてコピーするだけ
+        state = self.game_state
+        scene_manager = self.scene_manager
+        state.scene = scene_manager.scenes.index(scene_manager.get_current_scene())
+        return state.snapshot()
+
+    def restore(self, snapshot):#snapshot()の時点に戻す(undo, リプレイ, ロールバック)
+        state = self.game_state
+        state.restore(snapshot)
+        scene = self.scene_manager.scenes[state.scene]
+        if scene is not self.scene_manager.get_current_scene():
+            self.scene_manager.change_scene(scene)
+        #戦闘を始める前の状態に戻したら戦闘はなくなる(配列の中の0の値を戦闘として使わない)
+        self.battle = state.battle if state.has_battle else None
+        self.inventory = state.inventory if state.has_inventory else None
+
     def save(self):
         self.save_load_manager.save()
 
@@ -45,7 +84,47 @@ class GameManager():
 #単体テストで実行するときは
 #python -m game.game_manager
 def test():
-    print('a')
+    import os
+    from .battle import Battle, Enemy, create_player
+    from .constants import GREEN, RED, SCENE_LIST
+    from .inventory import Inventory, Item
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    game_manager = GameManager(pygame.display.set_mode((80, 60)), SCENE_LIST)
+    before_battle = game_manager.snapshot()
+    game_manager.start_battle(Battle(create_player(), Enemy('Slime', 40, [{'name': 'Tackle', 'damage': 6},
+                                                                         {'name': 'Slam', 'damage': 11}])))
+    game_manager.battle.start_battle()
+    inventory = Inventory(4, 4)
+    sword = Item('Sword', (1, 2), RED, {'attack': 5})
+    inventory.add_item(sword, (0, 0))
+    inventory.add_item(Item('Shield', (2, 2), GREEN, {'defense': 3}), (1, 0))
+    game_manager.set_inventory(inventory)
+    inventory = game_manager.inventory
+
+    def state():
+        battle = game_manager.battle
+        return (game_manager.scene_manager.get_current_scene().name, battle.turn, battle.player.hp, battle.enemy.hp,
+                [card.name for card in battle.player.hand], len(battle.player.deck),
+                battle.enemy.current_action['name'], dict(inventory.placements), game_manager.game_state.rng.next())
+
+    saved = game_manager.snapshot()
+    before = state()
+    game_manager.restore(saved)
+    # 1ターン進めて、アイテムを動かし、シーンも変えてから戻す
+    game_manager.battle.play_card(0)
+    game_manager.battle.end_player_turn()
+    inventory.move_item(sword, (3, 2))
+    game_manager.scene_manager.change_scene(game_manager.scene_manager.scenes[3])
+    print('changed :', state()[:4])
+    game_manager.restore(saved)
+    after = state()
+    print('restored:', after[:4], 'same as snapshot:', before == after)
+    # 戦闘を始める前のスナップショットに戻すと戦闘もインベントリもなくなり、後のスナップショットでまた戻る
+    game_manager.restore(before_battle)
+    print('before battle:', game_manager.battle, game_manager.inventory, end=', ')
+    game_manager.restore(saved)
+    print('battle again:', state() == before)
 
 if __name__ == '__main__':
     test()
\ No newline at end of file
@@ -0,0 +1,537 @@
+"""
+game_state.py - 巻き戻しできるゲームの状態
+
+ショップのundo・リプレイ・ネット対戦のロールバックのために、状態を1秒に何度も保存・復元したい。
+オブジェクト(Battle, GameEntity, Inventory)をdeepcopyすると数百マイクロ秒かかるので、
+状態はすべて1本のNumPy配列(int64)の中に決まった配置で並べる。
+- スカラー(シーン, ターン, HP, エネルギー, ブロック, 敵の行動...)
+- 山札・手札・捨て札: カードの定義番号の配列 + 枚数
+- インベントリ: マス目ごとのスロット番号と、スロットごとの(x, y, 回転, アイテム番号)
+  スロットは今置かれている順に振るので、今までに何種類のアイテムを置いたかには関係ない
+- 乱数: splitmix64の内部状態(これも配列の中なので一緒に巻き戻る)
+snapshot()は配列のコピー、restore()はnp.copytoで書き戻すだけ(どちらも数マイクロ秒)。
+戦闘中のBattleとInventoryもこの配列を直接読み書きするので、保存の前に写す・復元の後に戻す処理はない。
+RollbackBufferは確保済みの2次元配列にフレームごとに保存するので、保存でメモリを確保しない。
+
+カードとアイテムは番号で持ち、定義(card.Card, inventory.Item)はcards/itemsの表に1回だけ登録する。
+bind_battle/bind_inventoryで今までのBattleやInventoryの状態を配列に移し、配列を読み書きする
+StateBattle(StatePlayer, StateEnemy)とStateInventoryを返す。
+"""
+
+import numpy as np
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Sequence, Tuple
+from .battle import Battle, Enemy, GameEntity
+from .card import Card
+from .inventory import Inventory, Item
+
+MASK64 = (1 << 64) - 1
+EMPTY = -1
+MAX_PILE = 64    # 山札・手札・捨て札それぞれの最大枚数
+MAX_ITEMS = 64   # インベントリに同時に置けるアイテムの数
+MAX_CELLS = 100  # マス目の数(rows * cols)の上限
+
+# スカラーの並び
+SCALARS = ('scene', 'turn', 'gold', 'player_hp', 'player_max_hp', 'player_energy', 'player_max_energy',
+           'player_block', 'enemy_hp', 'enemy_max_hp', 'enemy_block', 'enemy_action', 'rows', 'cols',
+           'has_battle', 'has_inventory')
+
+class Field():
+    """配列の1要素をintの属性として見せる"""
+    def __init__(self, index: int) -> None:
+        self.index = index
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return int(instance.scalars[self.index])
+
+    def __set__(self, instance, value: int) -> None:
+        instance.scalars[self.index] = value
+
+class Pile():
+    """カード番号の配列の先頭length枚。配列はGameStateのバッファの一部"""
+    def __init__(self, cards: np.ndarray, length: np.ndarray) -> None:
+        self.cards = cards
+        self.length = length  # 1要素の配列(枚数)
+
+    def __len__(self) -> int:
+        return int(self.length[0])
+
+    def ids(self) -> np.ndarray:
+        return self.cards[:len(self)]
+
+    def push(self, card_id: int) -> None:
+        count = len(self)
+        if count == len(self.cards):
+            raise IndexError('pile is full')
+        self.cards[count] = card_id
+        self.length[0] = count + 1
+
+    def pop(self, index: int = -1) -> int:
+        count = len(self)
+        if count == 0:
+            raise IndexError('pop from empty pile')
+        index %= count
+        card_id = int(self.cards[index])
+        self.cards[index:count - 1] = self.cards[index + 1:count]
+        self.cards[count - 1] = EMPTY
+        self.length[0] = count - 1
+        return card_id
+
+    def set(self, ids: Sequence[int]) -> None:
+        if len(ids) > len(self.cards):
+            raise IndexError('pile is full')
+        self.cards[:len(ids)] = ids
+        self.cards[len(ids):] = EMPTY
+        self.length[0] = len(ids)
+
+    def move_all(self, other: 'Pile') -> None:
+        """全部otherの後ろに移す(捨て札を山札に戻すときなど)"""
+        other.set(np.concatenate([other.ids(), self.ids()]))
+        self.set(())
+
+class StateRandom():
+    """バッファの中の1要素を状態に使う乱数(splitmix64)。random.Randomの代わりにshuffle/choiceで使える"""
+    def __init__(self, state: np.ndarray) -> None:
+        self.state = state  # uint64の1要素の配列
+
+    def seed(self, seed: int) -> None:
+        self.state[0] = seed & MASK64
+
+    def next(self) -> int:
+        value = (int(self.state[0]) + 0x9E3779B97F4A7C15) & MASK64
+        self.state[0] = value
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+        return value ^ (value >> 31)
+
+    def random(self) -> float:
+        return (self.next() >> 11) / (1 << 53)
+
+    def randrange(self, stop: int) -> int:
+        return self.next() % stop
+
+    def randint(self, a: int, b: int) -> int:
+        return a + self.randrange(b - a + 1)
+
+    def choice(self, sequence):
+        return sequence[self.randrange(len(sequence))]
+
+    def shuffle(self, items) -> None:
+        """リストでもnp.ndarrayでもその場で混ぜる(Fisher-Yates)"""
+        for i in range(len(items) - 1, 0, -1):
+            j = self.randrange(i + 1)
+            items[i], items[j] = items[j], items[i]
+
+class GameState():
+    # 使い方: state.player_hp -= 5 のように普通の属性として読み書きする
+    scene = Field(SCALARS.index('scene'))
+    turn = Field(SCALARS.index('turn'))
+    gold = Field(SCALARS.index('gold'))
+    player_hp = Field(SCALARS.index('player_hp'))
+    player_max_hp = Field(SCALARS.index('player_max_hp'))
+    player_energy = Field(SCALARS.index('player_energy'))
+    player_max_energy = Field(SCALARS.index('player_max_energy'))
+    player_block = Field(SCALARS.index('player_block'))
+    enemy_hp = Field(SCALARS.index('enemy_hp'))
+    enemy_max_hp = Field(SCALARS.index('enemy_max_hp'))
+    enemy_block = Field(SCALARS.index('enemy_block'))
+    enemy_action = Field(SCALARS.index('enemy_action'))
+    rows = Field(SCALARS.index('rows'))
+    cols = Field(SCALARS.index('cols'))
+    has_battle = Field(SCALARS.index('has_battle'))        # 戦闘中なら1(bind_battleの後)
+    has_inventory = Field(SCALARS.index('has_inventory'))  # インベントリがあれば1(bind_inventoryの後)
+
+    def __init__(self, seed: int = 0) -> None:
+        layout = [('scalars', len(SCALARS)), ('rng', 1), ('pile_lengths', 3),
+                  ('deck', MAX_PILE), ('hand', MAX_PILE), ('discard', MAX_PILE),
+                  ('grid', MAX_CELLS), ('placements', MAX_ITEMS * 4)]
+        self.offsets: Dict[str, Tuple[int, int]] = {}
+        offset = 0
+        for name, length in layout:
+            self.offsets[name] = (offset, offset + length)
+            offset += length
+        self.data = np.full(offset, EMPTY, dtype=np.int64)
+        # ここから下は全部self.dataのビュー(restoreで中身を書き戻してもそのまま使える)
+        self.scalars = self.view('scalars')
+        self.scalars[:] = 0
+        self.rng = StateRandom(self.view('rng').view(np.uint64))
+        self.rng.seed(seed)
+        lengths = self.view('pile_lengths')
+        lengths[:] = 0
+        self.deck = Pile(self.view('deck'), lengths[0:1])
+        self.hand = Pile(self.view('hand'), lengths[1:2])
+        self.discard = Pile(self.view('discard'), lengths[2:3])
+        self.grid = self.view('grid')
+        self.placements = self.view('placements').reshape(MAX_ITEMS, 4)  # スロットごとの(x, y, 回転, アイテム番号)
+        # 定義の表(状態ではないので巻き戻さない)
+        self.cards: List[Card] = []
+        self.card_ids: Dict[tuple, int] = {}
+        self.items: List[Item] = []
+        self.item_numbers: Dict[Item, int] = {}  # アイテム(オブジェクトそのもの) -> 番号。古いスナップショットのために消さない
+        # 配列を読み書きする今の戦闘とインベントリ(bind_*で作る)
+        self.battle: Optional[StateBattle] = None
+        self.inventory: Optional[StateInventory] = None
+
+    def view(self, name: str) -> np.ndarray:
+        start, end = self.offsets[name]
+        return self.data[start:end]
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def snapshot(self) -> np.ndarray:
+        return self.data.copy()
+
+    def restore(self, snapshot: np.ndarray) -> None:
+        np.copyto(self.data, snapshot)
+
+    def card_id(self, card: Card) -> int:
+        key = card.key()
+        card_id = self.card_ids.get(key)
+        if card_id is None:
+            card_id = self.card_ids[key] = len(self.cards)
+            self.cards.append(card)
+        return card_id
+
+    def item_number(self, item: Item) -> int:
+        number = self.item_numbers.get(item)
+        if number is None:
+            number = self.item_numbers[item] = len(self.items)
+            self.items.append(item)
+        return number
+
+    # 今までのオブジェクトをバッファに移す(以後は返したオブジェクトを使う。読み書きはすべてバッファに行く)
+    def bind_battle(self, battle: Battle) -> 'StateBattle':
+        self.battle = StateBattle(self, battle)
+        self.has_battle = 1
+        return self.battle
+
+    def bind_inventory(self, inventory: Inventory) -> 'StateInventory':
+        if inventory.rows * inventory.cols > MAX_CELLS:
+            raise ValueError('inventory is larger than MAX_CELLS')
+        self.inventory = StateInventory(self, inventory.rows, inventory.cols)
+        for item, (x, y, rotation) in inventory.placements.items():
+            self.inventory.add_item(item, (x, y), rotation)
+        self.has_inventory = 1
+        return self.inventory
+
+    def item_grid(self) -> np.ndarray:
+        """(rows, cols)のスロット番号(-1は空き)"""
+        return self.grid[:self.rows * self.cols].reshape(self.rows, self.cols)
+
+class CardList():
+    """Pileの中身をCardのリストとして見せる(GameEntityのdeck/hand/discard_pileの代わり)"""
+    __slots__ = ('state', 'pile')
+
+    def __init__(self, state: GameState, pile: Pile) -> None:
+        self.state = state
+        self.pile = pile
+
+    def __len__(self) -> int:
+        return len(self.pile)
+
+    def __iter__(self):
+        cards = self.state.cards
+        return (cards[card_id] for card_id in self.pile.ids().tolist())
+
+    def __getitem__(self, index):
+        ids = self.pile.ids()[index]
+        if isinstance(index, slice):
+            return [self.state.cards[card_id] for card_id in ids.tolist()]
+        return self.state.cards[int(ids)]
+
+    def __setitem__(self, index: int, card: Card) -> None:
+        self.pile.ids()[index] = self.state.card_id(card)
+
+    def __add__(self, other) -> List[Card]:
+        return list(self) + list(other)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+    def append(self, card: Card) -> None:
+        self.pile.push(self.state.card_id(card))
+
+    def extend(self, cards) -> None:
+        for card in list(cards):
+            self.append(card)
+
+    def pop(self, index: int = -1) -> Card:
+        return self.state.cards[self.pile.pop(index)]
+
+class PileField():
+    """GameStateのPileをCardListとして読み書きする属性(代入すると中身を置き換える)"""
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return CardList(instance.state, getattr(instance.state, self.name))
+
+    def __set__(self, instance, cards) -> None:
+        state = instance.state
+        ids = cards.pile.ids() if isinstance(cards, CardList) else [state.card_id(card) for card in cards]
+        getattr(state, self.name).set(ids)
+
+class ActionField():
+    """敵の予告行動をactionsの番号としてバッファに持つ"""
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        index = instance.state.enemy_action
+        return None if index == EMPTY else instance.actions[index]
+
+    def __set__(self, instance, action) -> None:
+        instance.state.enemy_action = EMPTY if action is None else instance.actions.index(action)
+
+class StatePlayer(GameEntity):
+    """HP・エネルギー・ブロックと山札・手札・捨て札をGameStateのバッファに持つプレイヤー"""
+    __slots__ = ('state', 'scalars')
+    max_hp = Field(SCALARS.index('player_max_hp'))
+    hp = Field(SCALARS.index('player_hp'))
+    max_energy = Field(SCALARS.index('player_max_energy'))
+    energy = Field(SCALARS.index('player_energy'))
+    block = Field(SCALARS.index('player_block'))
+    deck = PileField('deck')
+    hand = PileField('hand')
+    discard_pile = PileField('discard')
+
+    def __init__(self, state: GameState, player: GameEntity) -> None:
+        self.state = state
+        self.scalars = state.scalars
+        for name in GameEntity.__slots__:
+            setattr(self, name, getattr(player, name))
+
+class StateEnemy(Enemy):
+    """HP・ブロック・予告行動をGameStateのバッファに持つ敵"""
+    __slots__ = ('state', 'scalars')
+    max_hp = Field(SCALARS.index('enemy_max_hp'))
+    hp = Field(SCALARS.index('enemy_hp'))
+    block = Field(SCALARS.index('enemy_block'))
+    current_action = ActionField()
+
+    def __init__(self, state: GameState, enemy: Enemy) -> None:
+        self.state = state
+        self.scalars = state.scalars
+        for name in GameEntity.__slots__ + Enemy.__slots__:
+            setattr(self, name, getattr(enemy, name))
+
+class StateBattle(Battle):
+    """ターン数と両者の状態がGameStateのバッファにあるBattle(restoreするとそのまま戻る)"""
+    turn = Field(SCALARS.index('turn'))
+
+    def __init__(self, state: GameState, battle: Battle) -> None:
+        self.scalars = state.scalars
+        super().__init__(StatePlayer(state, battle.player), StateEnemy(state, battle.enemy))
+        self.turn = battle.turn
+        self.message = battle.message
+        self.message_timer = battle.message_timer
+
+class PlacementView(Mapping):
+    """スロットの表をInventory.placementsと同じ {item: (x, y, 回転)} として見せる"""
+    def __init__(self, state: GameState) -> None:
+        self.state = state
+
+    def slot(self, item: Item) -> int:
+        number = self.state.item_numbers.get(item)
+        if number is None:
+            return EMPTY
+        slots = np.flatnonzero(self.state.placements[:, 3] == number)
+        return int(slots[0]) if len(slots) else EMPTY
+
+    def __getitem__(self, item: Item) -> Tuple[int, int, int]:
+        slot = self.slot(item)
+        if slot == EMPTY:
+            raise KeyError(item)
+        return tuple(self.state.placements[slot, :3].tolist())
+
+    def __contains__(self, item) -> bool:
+        return self.slot(item) != EMPTY
+
+    def __iter__(self):
+        placements, items = self.state.placements, self.state.items
+        return (items[number] for number in placements[placements[:, 0] != EMPTY, 3].tolist())
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.state.placements[:, 0] != EMPTY))
+
+class StateInventory(Inventory):
+    """マス目と置いた位置をGameStateのバッファに持つInventory(restoreするとそのまま戻る)
+    占有のビットボードや配列はバッファのマス目から毎回作る"""
+    def __init__(self, state: GameState, rows: int, cols: int) -> None:
+        self.state = state
+        self.cell_size = 40
+        self.placements = PlacementView(state)
+        state.rows, state.cols = rows, cols
+        self.clear()
+
+    @property
+    def rows(self) -> int:
+        return self.state.rows
+
+    @property
+    def cols(self) -> int:
+        return self.state.cols
+
+    @property
+    def occupancy(self) -> np.ndarray:
+        return self.state.item_grid() != EMPTY
+
+    @property
+    def bitboard(self) -> int:
+        # マス(x, y)がビットy * cols + x(行ごとに並べた順)
+        return int.from_bytes(np.packbits(self.occupancy.ravel(), bitorder='little').tobytes(), 'little')
+
+    @property
+    def grid(self) -> List[List[Optional[Item]]]:
+        items, numbers = self.state.items, self.state.placements[:, 3].tolist()
+        return [[None if slot == EMPTY else items[numbers[slot]] for slot in row]
+                for row in self.state.item_grid().tolist()]
+
+    def item_at(self, position) -> Optional[Item]:
+        x, y = position
+        if 0 <= x < self.cols and 0 <= y < self.rows:
+            slot = int(self.state.grid[y * self.cols + x])
+            if slot != EMPTY:
+                return self.state.items[int(self.state.placements[slot, 3])]
+        return None
+
+    def add_item(self, item, position, rotation=0) -> bool:
+        if item in self.placements or not self.can_place(item, position, rotation):
+            return False
+        free = np.flatnonzero(self.state.placements[:, 0] == EMPTY)
+        if len(free) == 0:
+            raise IndexError('too many items')
+        slot = int(free[0])
+        x, y = position
+        self.state.placements[slot] = (x, y, rotation, self.state.item_number(item))
+        for cx, cy in item.shape(rotation).cells:
+            self.state.grid[(y + cy) * self.cols + x + cx] = slot
+        return True
+
+    def remove_item(self, item) -> Tuple[int, int, int]:
+        slot = self.placements.slot(item)
+        if slot == EMPTY:
+            raise KeyError(item)
+        placement = tuple(self.state.placements[slot, :3].tolist())
+        self.state.grid[self.state.grid == slot] = EMPTY
+        self.state.placements[slot] = EMPTY
+        return placement
+
+    def clear(self):
+        self.state.grid[:] = EMPTY
+        self.state.placements[:] = EMPTY
+
+class RollbackBuffer():
+    """最近capacityフレーム分のスナップショットを確保済みの配列に持つ"""
+    def __init__(self, state: GameState, capacity: int = 128) -> None:
+        self.state = state
+        self.frames = np.zeros((capacity, len(state.data)), dtype=state.data.dtype)
+        self.numbers = np.full(capacity, -1, dtype=np.int64)  # スロットに入っているフレーム番号
+
+    def save(self, frame: int) -> None:
+        slot = frame % len(self.frames)
+        np.copyto(self.frames[slot], self.state.data)
+        self.numbers[slot] = frame
+
+    def load(self, frame: int) -> bool:
+        """frameの状態に戻す。もう上書きされていたらFalse"""
+        slot = frame % len(self.frames)
+        if self.numbers[slot] != frame:
+            return False
+        np.copyto(self.state.data, self.frames[slot])
+        return True
+
+def benchmark(cycles: int = 10000) -> Dict[str, float]:
+    """GameManager.snapshot() → 1手進める → GameManager.restore() を1サイクルとして測る"""
+    import copy
+    import os
+    import time
+    import pygame
+    from .battle import Battle, Enemy, create_player
+    from .constants import BLUE, GREEN, RED, SCENE_LIST
+    from .game_manager import GameManager
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    game_manager = GameManager(pygame.display.set_mode((80, 60)), SCENE_LIST)
+    battle = Battle(create_player(), Enemy('Slime', 40, [{'name': 'Tackle', 'damage': 6}]))
+    inventory = Inventory(10, 10)
+    for i, (size, color) in enumerate([((1, 2), RED), ((2, 2), GREEN), ((1, 3), BLUE), ((1, 1), RED)]):
+        inventory.add_item(Item(f'Item{i}', size, color, {'attack': i}), (i * 2, 0))
+    game_manager.start_battle(battle)
+    game_manager.battle.start_battle()
+    game_manager.set_inventory(inventory)
+    state = game_manager.game_state
+    rollback = RollbackBuffer(state)
+
+    results = {'state_bytes': state.nbytes}
+    start = time.perf_counter()
+    for _ in range(cycles):
+        saved = game_manager.snapshot()
+        game_manager.battle.play_card(0)
+        game_manager.restore(saved)
+    results['snapshot_restore_per_s'] = cycles / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for frame in range(cycles):
+        rollback.save(frame)
+        game_manager.battle.play_card(0)
+        rollback.load(frame)
+    results['rollback_buffer_per_s'] = cycles / (time.perf_counter() - start)
+    # 比較: 今までのオブジェクトを丸ごとdeepcopyする
+    count = max(1, cycles // 20)
+    start = time.perf_counter()
+    for _ in range(count):
+        saved = copy.deepcopy((battle, inventory))
+    results['deepcopy_per_s'] = count / (time.perf_counter() - start)
+    return results
+
+def test():
+    from .battle import Battle, Enemy, create_player
+    from .constants import RED, GREEN
+    state = GameState(seed=42)
+    battle = Battle(create_player(rng=state.rng),
+                    Enemy('Slime', 40, [{'name': 'Tackle', 'damage': 6}, {'name': 'Slam', 'damage': 11}], rng=state.rng))
+    battle.start_battle()
+    inventory = Inventory(4, 4)
+    sword = Item('Sword', (1, 2), RED, {'attack': 5})
+    shield = Item('Shield', (2, 2), GREEN, {'defense': 3})
+    inventory.add_item(sword, (0, 0))
+    inventory.add_item(shield, (1, 0))
+    battle = state.bind_battle(battle)
+    inventory = state.bind_inventory(inventory)
+    saved = state.snapshot()
+
+    # 1ターン進めて、インベントリも動かしてから巻き戻す(restoreだけで両方戻る)
+    before = ([card.name for card in battle.player.hand], battle.enemy.current_action['name'], state.rng.random())
+    state.restore(saved)
+    battle.play_card(0)
+    battle.end_player_turn()
+    inventory.move_item(sword, (3, 2))
+    print(f'after turn: hp {battle.player.hp}/{battle.enemy.hp}, turn {battle.turn}, sword {inventory.placements[sword]}')
+    state.restore(saved)
+    after = ([card.name for card in battle.player.hand], battle.enemy.current_action['name'], state.rng.random())
+    print(f'restored: hp {battle.player.hp}/{battle.enemy.hp}, turn {battle.turn}, sword {inventory.placements[sword]}, '
+          f'same hand/intent/rng: {before == after}')
+    print(state.item_grid())
+    # 同時に置くのは1個でも、入れ替えながらMAX_ITEMSより多くの種類を保存できる
+    shop = state.bind_inventory(Inventory(4, 4))
+    saved = []
+    for i in range(MAX_ITEMS * 2):
+        for item in shop.items():
+            shop.remove_item(item)
+        shop.add_item(Item(f'Potion{i}', (1, 1), RED, {}), (i % 4, i % 3))
+        saved.append(state.snapshot())
+    state.restore(saved[3])
+    print(f'{len(state.items)} items registered, snapshot 3 restored: '
+          f'{[(item.name, placement) for item, placement in shop.placements.items()]}')
+    results = benchmark()
+    print(f"state {results['state_bytes']} bytes: GameManager snapshot+play+restore "
+          f"{results['snapshot_restore_per_s']:,.0f}/s (10k/s: {results['snapshot_restore_per_s'] >= 10000}), "
+          f"rollback buffer {results['rollback_buffer_per_s']:,.0f}/s, deepcopy {results['deepcopy_per_s']:,.0f}/s")
+
+if __name__ == '__main__':
+    test()
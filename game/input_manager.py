@@ -1,9 +1,22 @@
 import pygame
 
+MOUSE_EVENTS = (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)
+
 class InputManager():
     def __init__(self, scenes):
         print('InputManager initialize')
         self.scenes = scenes
+        self.ui_managers = []  # マウス入力を渡すUIManager(ホバー・クリック判定はそちらで行う)
+        self.key_handlers = {}  # シーンと関係なく押されたら呼ぶ関数(デバッグ表示の切り替えなど)
+
+    def add_ui(self, ui_manager):
+        self.ui_managers.append(ui_manager)
+
+    def remove_ui(self, ui_manager):
+        self.ui_managers.remove(ui_manager)
+
+    def add_key_handler(self, key, handler):
+        self.key_handlers[key] = handler
 
     def handle_event(self)->list:
         self.events_happened = []
@@ -12,7 +25,12 @@ class InputManager():
                     self.events_happened = ['quit']
                     break
                 if event.type == pygame.KEYDOWN:
+                    if event.key in self.key_handlers:
+                        self.key_handlers[event.key]()
                     self.handle_event_scene(event)
+                if event.type in MOUSE_EVENTS:
+                    for ui_manager in self.ui_managers:
+                        ui_manager.handle_event(event)
         return self.events_happened
     
     def handle_event_scene(self, event)->None:
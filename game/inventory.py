@@ -0,0 +1,226 @@
+"""
+inventory.py - バックパック(マス目インベントリ)
+
+アイテムの形は複数マス・回転ありのポリオミノで、マス目の占有状態は
+int のビットボード(行ごとにcols個のビット)で持つ。
+置けるか/重なるかの判定はビット演算1回で済む。
+「このアイテムを置ける場所すべて」はNumPyの占有配列をずらして重ねる
+ベクトル演算1回で求める(ショップでのドラッグ中に毎フレーム全マスを光らせるため)。
+"""
+
+import numpy as np
+from functools import lru_cache
+import pygame
+from typing import Dict, Iterable, List, Optional, Tuple
+from .constants import BLACK, GREEN, RED
+
+Cells = Tuple[Tuple[int, int], ...]
+
+def normalize(cells: Iterable[Tuple[int, int]]) -> Cells:
+    cells = list(cells)
+    min_x = min(x for x, _ in cells)
+    min_y = min(y for _, y in cells)
+    return tuple(sorted((x - min_x, y - min_y) for x, y in cells))
+
+def rotate(cells: Cells) -> Cells:
+    """時計回りに90度回転"""
+    height = max(y for _, y in cells) + 1
+    return normalize((height - 1 - y, x) for x, y in cells)
+
+def rotations(cells: Cells) -> List[Cells]:
+    shapes = []
+    shape = normalize(cells)
+    for _ in range(4):
+        if shape not in shapes:
+            shapes.append(shape)
+        shape = rotate(shape)
+    return shapes
+
+def rectangle(size: Tuple[int, int]) -> Cells:
+    return tuple((x, y) for y in range(size[1]) for x in range(size[0]))
+
+class Shape():
+    __slots__ = ('cells', 'width', 'height', 'masks')
+
+    def __init__(self, cells: Cells) -> None:
+        self.cells = normalize(cells)
+        self.width = max(x for x, _ in self.cells) + 1
+        self.height = max(y for _, y in self.cells) + 1
+        self.masks: Dict[int, int] = {}
+
+    def mask(self, cols: int) -> int:
+        """原点に置いたときのビットマスク(1行 = colsビット)"""
+        mask = self.masks.get(cols)
+        if mask is None:
+            mask = 0
+            for x, y in self.cells:
+                mask |= 1 << (y * cols + x)
+            self.masks[cols] = mask
+        return mask
+
+@lru_cache(maxsize=None)
+def shape_rotations(cells: Cells) -> Tuple[Shape, ...]:
+    """同じ形のアイテムは回転ごとのShape(とマスクのキャッシュ)を共有する"""
+    return tuple(Shape(shape) for shape in rotations(cells))
+
+class Item():
+    #アイテムの定義(性能と形)。置いた位置などの状態はInventoryが持つ
+    __slots__ = ('name', 'size', 'color', 'effect', 'tags', 'synergy', 'trigger', 'shapes')
+
+    def __init__(self, name, size, color, effect, cells=None, tags=(), synergy=None, trigger=None):
+        self.name = name
+        self.size = size  # size is a tuple (width, height)
+        self.color = color
+        self.effect = effect  # Effects on stats like attack, defense, etc.
+        self.tags = frozenset(tags) | {name}
+        # 隣接ボーナス: {隣のアイテムのタグ: {'attack': 1, ...}} (隣接1個ごとに加算)
+        self.synergy = synergy if synergy else {}
+        self.trigger = trigger  # オートバトルでの発動効果(auto_battle.Trigger)
+        # cellsを省略したらsizeの長方形
+        self.shapes = shape_rotations(normalize(cells) if cells else rectangle(size))
+
+    def shape(self, rotation: int = 0) -> Shape:
+        return self.shapes[rotation % len(self.shapes)]
+
+class Inventory():
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.cell_size = 40  # Each grid cell is 40x40 pixels
+        self.bitboard = 0
+        self.occupancy = np.zeros((rows, cols), dtype=bool)
+        self.grid: List[List[Optional[Item]]] = [[None for _ in range(cols)] for _ in range(rows)]
+        self.placements: Dict[Item, Tuple[int, int, int]] = {}  # item -> (x, y, rotation)
+
+    def full_mask(self) -> int:
+        return (1 << (self.rows * self.cols)) - 1
+
+    def placed_mask(self, item: Item, position: Tuple[int, int], rotation: int = 0) -> Optional[int]:
+        """置いたときのビットマスク。はみ出すならNone"""
+        x, y = position
+        shape = item.shape(rotation)
+        if x < 0 or y < 0 or x + shape.width > self.cols or y + shape.height > self.rows:
+            return None
+        return shape.mask(self.cols) << (y * self.cols + x)
+
+    def can_place(self, item: Item, position: Tuple[int, int], rotation: int = 0, ignore: Optional[Item] = None) -> bool:
+        mask = self.placed_mask(item, position, rotation)
+        if mask is None:
+            return False
+        board = self.bitboard
+        if ignore is not None and ignore in self.placements:
+            board &= ~self.item_mask(ignore)
+        return not (board & mask)
+
+    def item_mask(self, item: Item) -> int:
+        x, y, rotation = self.placements[item]
+        return self.placed_mask(item, (x, y), rotation)
+
+    def cells_of(self, item: Item) -> List[Tuple[int, int]]:
+        x, y, rotation = self.placements[item]
+        return [(x + dx, y + dy) for dx, dy in item.shape(rotation).cells]
+
+    def add_item(self, item, position, rotation=0) -> bool:
+        if item in self.placements or not self.can_place(item, position, rotation):
+            return False
+        self.placements[item] = (position[0], position[1], rotation)
+        self.bitboard |= self.item_mask(item)
+        for x, y in self.cells_of(item):
+            self.grid[y][x] = item
+            self.occupancy[y, x] = True
+        return True
+
+    def remove_item(self, item) -> Tuple[int, int, int]:
+        for x, y in self.cells_of(item):
+            self.grid[y][x] = None
+            self.occupancy[y, x] = False
+        self.bitboard &= ~self.item_mask(item)
+        return self.placements.pop(item)
+
+    def move_item(self, item, position, rotation=0) -> bool:
+        if not self.can_place(item, position, rotation, ignore=item):
+            return False
+        self.remove_item(item)
+        return self.add_item(item, position, rotation)
+
+    def neighbours(self, item: Item) -> List[Item]:
+        """上下左右で接しているアイテム"""
+        found = []
+        for x, y in self.cells_of(item):
+            for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                other = self.item_at((nx, ny))
+                if other is not None and other is not item and other not in found:
+                    found.append(other)
+        return found
+
+    def item_at(self, position) -> Optional[Item]:
+        x, y = position
+        if 0 <= x < self.cols and 0 <= y < self.rows:
+            return self.grid[y][x]
+        return None
+
+    def items(self) -> List[Item]:
+        return list(self.placements)
+
+    def valid_placements(self, item: Item, rotation: int = 0, ignore: Optional[Item] = None) -> np.ndarray:
+        """置ける左上座標をTrueにした(rows, cols)のbool配列"""
+        occupancy = self.occupancy
+        if ignore is not None and ignore in self.placements:
+            occupancy = occupancy.copy()
+            for x, y in self.cells_of(ignore):
+                occupancy[y, x] = False
+        shape = item.shape(rotation)
+        fits = np.zeros((self.rows, self.cols), dtype=bool)
+        h = self.rows - shape.height + 1
+        w = self.cols - shape.width + 1
+        if h <= 0 or w <= 0:
+            return fits
+        blocked = np.zeros((h, w), dtype=bool)
+        for dx, dy in shape.cells:
+            blocked |= occupancy[dy:dy + h, dx:dx + w]
+        fits[:h, :w] = ~blocked
+        return fits
+
+    def fit_map(self, item: Item, ignore: Optional[Item] = None) -> np.ndarray:
+        """どれかの回転で置ける左上座標(全回転の論理和)"""
+        fits = np.zeros((self.rows, self.cols), dtype=bool)
+        for rotation in range(len(item.shapes)):
+            fits |= self.valid_placements(item, rotation, ignore)
+        return fits
+
+    def draw(self, surface, x_offset, y_offset, highlight: Optional[np.ndarray] = None):
+        size = self.cell_size
+        if highlight is not None:
+            for y, x in zip(*np.nonzero(highlight)):
+                pygame.draw.rect(surface, GREEN, (x_offset + x * size, y_offset + y * size, size, size))
+        for row in range(self.rows):
+            for col in range(self.cols):
+                rect = pygame.Rect(x_offset + col * size, y_offset + row * size, size, size)
+                item = self.grid[row][col]
+                if item is not None:
+                    pygame.draw.rect(surface, item.color, rect)
+                pygame.draw.rect(surface, BLACK, rect, 1)
+
+    def clear(self):
+        self.bitboard = 0
+        self.occupancy[:] = False
+        self.grid = [[None for _ in range(self.cols)] for _ in range(self.rows)]
+        self.placements.clear()
+
+def test():
+    import time
+    inventory = Inventory(4, 4)
+    sword = Item("Sword", (1, 2), RED, {'attack': 5})
+    shield = Item("Shield", (2, 2), GREEN, {'defense': 3})
+    hook = Item("Hook", (2, 3), RED, {'attack': 2}, cells=((0, 0), (1, 0), (0, 1), (0, 2)))
+    print(inventory.add_item(sword, (0, 0)), inventory.add_item(shield, (2, 0)), inventory.add_item(hook, (1, 0)))
+    print(len(hook.shapes), inventory.fit_map(hook).astype(int))
+
+    inventory = Inventory(10, 10)
+    start = time.perf_counter()
+    for _ in range(1000):
+        inventory.fit_map(hook)
+    print(f'fit_map x1000 (10x10, {len(hook.shapes)} rotations): {(time.perf_counter() - start) * 1000:.1f}ms')
+
+if __name__ == '__main__':
+    test()
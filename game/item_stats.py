@@ -0,0 +1,119 @@
+"""
+item_stats.py - 装備アイテムによるステータスの差分集計
+
+アイテムごとの寄与(自分の効果 + 隣接ボーナス)をキャッシュしておき、
+追加・移動・削除のときは影響を受けるアイテム(本人と前後の隣接アイテム)だけ
+寄与を計算し直して合計に差分を足す。
+ステータスは毎回「基礎値 + 合計」から作るので、戦闘を何度始めても二重に加算されない。
+"""
+
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
+from .inventory import Inventory, Item
+
+class StatAggregator():
+    def __init__(self, inventory: Inventory, base: Dict[str, int]) -> None:
+        self.inventory = inventory
+        self.base = dict(base)
+        self.contributions: Dict[Item, Counter] = {}
+        self.totals: Counter = Counter()
+        self.cached_stats: Optional[Dict[str, int]] = None
+        self.recomputed = 0
+        self.refresh(inventory.items())
+
+    def contribution(self, item: Item) -> Counter:
+        result = Counter(item.effect)
+        if item.synergy:
+            for neighbour in self.inventory.neighbours(item):
+                for tag, bonus in item.synergy.items():
+                    if tag in neighbour.tags:
+                        result.update(bonus)
+        return result
+
+    def refresh(self, items: Iterable[Item]) -> None:
+        for item in items:
+            if item not in self.inventory.placements:
+                continue
+            self.recomputed += 1
+            new = self.contribution(item)
+            old = self.contributions.get(item)
+            if old is not None:
+                self.totals.subtract(old)
+            self.totals.update(new)
+            self.contributions[item] = new
+        self.cached_stats = None
+
+    def add_item(self, item: Item, position: Tuple[int, int], rotation: int = 0) -> bool:
+        if not self.inventory.add_item(item, position, rotation):
+            return False
+        self.refresh([item] + self.inventory.neighbours(item))
+        return True
+
+    def remove_item(self, item: Item) -> Tuple[int, int, int]:
+        neighbours = self.inventory.neighbours(item)
+        placement = self.inventory.remove_item(item)
+        self.totals.subtract(self.contributions.pop(item))
+        self.refresh(neighbours)
+        return placement
+
+    def move_item(self, item: Item, position: Tuple[int, int], rotation: int = 0) -> bool:
+        old_neighbours = self.inventory.neighbours(item)
+        if not self.inventory.move_item(item, position, rotation):
+            return False
+        self.refresh([item] + old_neighbours + self.inventory.neighbours(item))
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        if self.cached_stats is None:
+            stats = dict(self.base)
+            for name, value in self.totals.items():
+                stats[name] = stats.get(name, 0) + value
+            self.cached_stats = stats
+        return self.cached_stats
+
+    def apply_to(self, character) -> None:
+        """キャラクターのステータスを 基礎値 + アイテム で上書きする(累積しない)"""
+        for name, value in self.stats().items():
+            setattr(character, name, value)
+
+def test():
+    import random
+    import time
+    from .constants import RED, GREEN, BLUE
+
+    inventory = Inventory(4, 4)
+    aggregator = StatAggregator(inventory, {'attack': 10, 'defense': 5})
+    sword = Item("Sword", (1, 2), RED, {'attack': 5})
+    shield = Item("Shield", (2, 2), GREEN, {'defense': 3})
+    whetstone = Item("Whetstone", (1, 1), BLUE, {}, synergy={'Sword': {'attack': 2}})
+    aggregator.add_item(sword, (0, 0))
+    aggregator.add_item(shield, (2, 0))
+    aggregator.add_item(whetstone, (1, 0))
+    print(aggregator.stats())
+    aggregator.move_item(whetstone, (3, 3))
+    print(aggregator.stats())
+
+    inventory = Inventory(10, 10)
+    aggregator = StatAggregator(inventory, {'attack': 10, 'defense': 5})
+    items = []
+    for y in range(10):
+        for x in range(10):
+            item = Item(f"Gem{x}{y}", (1, 1), BLUE, {'attack': 1}, tags=('gem',), synergy={'gem': {'defense': 1}})
+            aggregator.add_item(item, (x, y))
+            items.append(item)
+    aggregator.remove_item(items.pop(55))
+    hole = (5, 5)
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for _ in range(1000):
+        # 空きマスにアイテムを1つドラッグする
+        item = rng.choice(items)
+        x, y, _ = inventory.placements[item]
+        aggregator.move_item(item, hole)
+        hole = (x, y)
+        aggregator.stats()
+    elapsed = time.perf_counter() - start
+    print(f'1000 drag events on full 10x10: {elapsed * 1000:.2f}ms, recomputed {aggregator.recomputed}, stats {aggregator.stats()}')
+
+if __name__ == '__main__':
+    test()
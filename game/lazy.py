@@ -0,0 +1,66 @@
+"""
+lazy.py - 起動を速くするための遅延読み込み
+
+- Deferred: クラスの属性として書くと、最初に使われたときにモジュールをimportして作る。
+  作った値はインスタンスの__dict__に入るので、2回目からは普通の属性と同じ速さ
+- warmup(): 指定した属性を別スレッドで先に作っておく(最初のフレームを出した後の空き時間に)
+"""
+
+import importlib
+import threading
+from typing import Any, Iterable
+
+class Deferred():
+    def __init__(self, module: str, name: str, construct: bool = True, package: str = 'game') -> None:
+        self.module = module      # '.save_load_manager' のような相対名も使える
+        self.name = name          # モジュールの中の名前
+        self.construct = construct  # Trueなら呼び出した結果(インスタンス)、Falseならそのまま
+        self.package = package
+        self.lock = threading.Lock()
+        self.attribute = ''
+
+    def __set_name__(self, owner, attribute: str) -> None:
+        self.attribute = attribute
+
+    def __get__(self, instance, owner=None) -> Any:
+        if instance is None:
+            return self
+        with self.lock:
+            # 別スレッド(warmup)が先に作っていたらそれを使う
+            if self.attribute in instance.__dict__:
+                return instance.__dict__[self.attribute]
+            value = getattr(importlib.import_module(self.module, self.package), self.name)
+            if self.construct:
+                value = value()
+            instance.__dict__[self.attribute] = value
+        return value
+
+def is_loaded(instance, attribute: str) -> bool:
+    return attribute in instance.__dict__
+
+def warmup(instance, attributes: Iterable[str]) -> threading.Thread:
+    """attributesを順番に作るスレッドを立ち上げる"""
+    def run() -> None:
+        for attribute in attributes:
+            getattr(instance, attribute)
+    thread = threading.Thread(target=run, name='warmup', daemon=True)
+    thread.start()
+    return thread
+
+def test():
+    import time
+
+    class Example():
+        cards = Deferred('.card', 'STARTER_CARDS', construct=False)
+        save = Deferred('.save_load_manager', 'SaveLoadManager')
+
+    example = Example()
+    print(is_loaded(example, 'cards'), example.cards[0], is_loaded(example, 'cards'))
+    thread = warmup(example, ['save'])
+    start = time.perf_counter()
+    save = example.save
+    thread.join()
+    print(type(save).__name__, save is example.save, f'{(time.perf_counter() - start) * 1000:.2f}ms')
+
+if __name__ == '__main__':
+    test()
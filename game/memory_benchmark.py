@@ -0,0 +1,124 @@
+"""
+memory_benchmark.py - ドメインオブジェクト1個あたりのメモリ
+
+カード・アイテム・エンティティ・シーンをcount個(既定で100万)作り、tracemallocで測った
+確保量をcountで割って1個あたりのバイト数を出す(入れておくリストの8バイト/個も含む)。
+「before」は__slots__を使う前の書き方(インスタンスごとの__dict__、アイテムごとのShape、
+デッキのカードを1枚ずつ作る)をここで再現したもの。
+
+    python -m game.memory_benchmark --count 1000000
+"""
+
+import argparse
+import gc
+import sys
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from .auto_battle import Trigger
+from .battle import GameEntity
+from .card import STARTER_CARDS, Card
+from .ecs import Block, Energy, Health, World
+from .inventory import Item, Shape, rectangle, rotations
+from .scene_manager import SceneManager
+
+class LegacyCard():
+    def __init__(self, name, cost, damage, block):
+        self.name = name
+        self.cost = cost
+        self.damage = damage
+        self.block = block
+
+class LegacyItem():
+    def __init__(self, name, size, color, effect, cells=None, tags=(), synergy=None, trigger=None):
+        self.name = name
+        self.size = size
+        self.color = color
+        self.effect = effect
+        self.tags = frozenset(tags) | {name}
+        self.synergy = synergy if synergy else {}
+        self.trigger = trigger
+        self.shapes = [Shape(shape) for shape in rotations(cells if cells else rectangle(size))]
+
+class LegacyEntity():
+    def __init__(self, name, max_hp, max_energy, base_block=0):
+        self.name = name
+        self.max_hp = max_hp
+        self.hp = max_hp
+        self.max_energy = max_energy
+        self.energy = max_energy
+        self.block = base_block
+        self.deck = []
+        self.hand = []
+        self.discard_pile = []
+        self.rng = None
+
+@dataclass
+class LegacyScene():
+    name: str
+    color: tuple
+
+def measure(build: Callable[[int], List], count: int) -> float:
+    """build(count)が確保したバイト数 / count"""
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    objects = build(count)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    gc.collect()
+    return (after - before) / count
+
+def item_builder(item_class) -> Callable[[int], List]:
+    # 色・効果・形は同じでも、アイテムはそれぞれ別の定義として作る(ショップで並ぶアイテムと同じ)
+    sizes = [(1, 1), (1, 2), (2, 2), (1, 3)]
+    trigger = Trigger(1.0, damage=1)
+    return lambda count: [item_class(f'Item{i % 100}', sizes[i % 4], (200, 0, 0), {}, trigger=trigger)
+                          for i in range(count)]
+
+def ecs_builder(count: int) -> List:
+    world = World()
+    world.create_many(count, Health, Energy, Block)
+    return [world]
+
+CASES = {
+    # 名前: (before, after)
+    'card': (lambda count: [LegacyCard(*STARTER_CARDS[i % 3]) for i in range(count)],
+             lambda count: [Card(*STARTER_CARDS[i % 3]) for i in range(count)]),
+    # デッキの中のカード: 前は1枚ずつ作っていた。今は同じ定義への参照
+    'deck card': (lambda count: [LegacyCard(*STARTER_CARDS[i % 3]) for i in range(count)],
+                  lambda count: [cards[i % 3] for cards in ([Card(*data) for data in STARTER_CARDS],)
+                                 for i in range(count)]),
+    'item': (item_builder(LegacyItem), item_builder(Item)),
+    'entity': (lambda count: [LegacyEntity('Enemy', 40, 0) for _ in range(count)],
+               lambda count: [GameEntity('Enemy', 40, 0) for _ in range(count)]),
+    'entity (ecs)': (lambda count: [LegacyEntity('Enemy', 40, 0) for _ in range(count)], ecs_builder),
+    'scene': (lambda count: [LegacyScene('HOME', (0, 0, 0)) for _ in range(count)],
+              lambda count: [SceneManager.Scene('HOME', (0, 0, 0)) for _ in range(count)]),
+}
+
+def run(count: int = 1000000, cases: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+    report = {}
+    for name in cases or CASES:
+        before, after = CASES[name]
+        report[name] = {'before': measure(before, count), 'after': measure(after, count)}
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='bytes per domain object before and after slotting')
+    parser.add_argument('--count', type=int, default=1000000)
+    parser.add_argument('cases', nargs='*', help=f'subset of {", ".join(CASES)}')
+    args = parser.parse_args(argv)
+    report = run(args.count, args.cases)
+    print(f"{'object':<14} {'before B':>10} {'after B':>10} {'saved':>7}   ({args.count} instances)")
+    for name, result in report.items():
+        print(f"{name:<14} {result['before']:>10.1f} {result['after']:>10.1f} "
+              f"{(1 - result['after'] / result['before']) * 100:>6.0f}%")
+    return 0
+
+def test():
+    main(['--count', '20000'])
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""
+opponent_pool.py - 非同期対戦の相手プール(ゴーストビルド)
+
+プレイヤーのビルド(ステータス + バックパックの中身 + 基地の状態)をラウンドとレートごとに保存し、
+対戦相手として同じラウンド・近いレートのビルドを1つ選ぶ。
+
+- 保存先はsqlite3のファイル。ビルドはzlib圧縮したJSONで、全件をメモリに載せない
+- (round, bucket, rand)の索引があり、乱数rから「rand >= r の最初の1件」を引くので
+  何百万件あっても抽選はO(log n)
+- テスト用にHTTPで同じ機能を提供するローカルサーバ(serve)とクライアント(RemoteOpponentPool)がある
+"""
+
+import json
+import random
+import sqlite3
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+from urllib.request import Request, urlopen
+
+BUCKET_WIDTH = 100  # レートの区切り
+MAX_WIDEN = 5       # 見つからないときに広げるバケット数
+
+def snapshot_build(character, inventory, player_id: str = '', base=None) -> Dict[str, Any]:
+    """キャラクターとインベントリ(と基地のbase_state.BaseState)からビルドのスナップショットを作る"""
+    items = []
+    for item, (x, y, rotation) in inventory.placements.items():
+        trigger = item.trigger
+        items.append({
+            'name': item.name, 'cells': item.shape(0).cells, 'color': item.color, 'effect': item.effect,
+            'pos': (x, y, rotation),
+            'trigger': None if trigger is None else
+            (trigger.cooldown, trigger.damage, trigger.heal, trigger.block, trigger.start),
+        })
+    return {
+        'player': player_id,
+        'character': {'name': character.name, 'hp': character.max_hp, 'attack': character.attack,
+                      'defense': character.defense, 'speed': character.speed},
+        'bag': (inventory.rows, inventory.cols),
+        'items': items,
+        # 基地は施設のあるタイルだけ (tile_x, tile_y, kind, hp, max_hp) で持つ
+        'base': None if base is None else {
+            'size': (base.width, base.height), 'round': base.round_number,
+            'facilities': [(x, y, kind, hp, max_hp) for (x, y), (kind, hp, max_hp) in base.facilities()]},
+    }
+
+def restore_build(build: Dict[str, Any]):
+    """スナップショットから(Character, Inventory)を作り直す"""
+    from .auto_battle import Character, Trigger
+    from .inventory import Inventory, Item
+    data = build['character']
+    character = Character(data['name'], data['hp'], data['attack'], data['defense'], data['speed'])
+    inventory = Inventory(*build['bag'])
+    for data in build['items']:
+        trigger = None if data['trigger'] is None else Trigger(*data['trigger'])
+        cells = tuple(tuple(cell) for cell in data['cells'])
+        item = Item(data['name'], (1, 1), tuple(data['color']), data['effect'], cells=cells, trigger=trigger)
+        x, y, rotation = data['pos']
+        inventory.add_item(item, (x, y), rotation)
+    return character, inventory
+
+def restore_base(build: Dict[str, Any]):
+    """スナップショットの基地(base_state.BaseState)。基地を持たないビルドはNone"""
+    from .base_state import BaseState
+    data = build.get('base')
+    if data is None:
+        return None
+    delta = {(x, y): (kind, hp, max_hp) for x, y, kind, hp, max_hp in data['facilities']}
+    return BaseState.empty(*data['size']).apply(delta, round_number=data['round'])
+
+def encode(build: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(build, separators=(',', ':')).encode('utf-8'))
+
+def decode(blob: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+class OpponentPool():
+    def __init__(self, path: str = ':memory:', seed: Optional[int] = None) -> None:
+        self.path = path
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS builds ('
+                        'id INTEGER PRIMARY KEY, round INTEGER, bucket INTEGER, rating INTEGER, '
+                        'rand REAL, player TEXT, data BLOB)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS builds_lookup ON builds (round, bucket, rand)')
+        self.db.commit()
+
+    def add_build(self, round_number: int, rating: int, build: Dict[str, Any]) -> int:
+        return self.add_builds([(round_number, rating, build)])[0]
+
+    def add_builds(self, builds: Iterable[Tuple[int, int, Dict[str, Any]]]) -> List[int]:
+        """まとめて1トランザクションで保存する"""
+        with self.lock:
+            cursor = self.db.cursor()
+            ids = []
+            for round_number, rating, build in builds:
+                cursor.execute('INSERT INTO builds (round, bucket, rating, rand, player, data) VALUES (?, ?, ?, ?, ?, ?)',
+                               (round_number, rating // BUCKET_WIDTH, rating, self.rng.random(),
+                                build.get('player', ''), encode(build)))
+                ids.append(cursor.lastrowid)
+            self.db.commit()
+        return ids
+
+    def sample_row(self, round_number: int, bucket: int, exclude: Optional[str]) -> Optional[Tuple]:
+        r = self.rng.random()
+        player = '' if exclude is None else 'AND player != ? '
+        excluded = () if exclude is None else (exclude,)
+        # rand >= r の最初の1件、なければ先頭に戻る(索引を引くだけなのでO(log n))
+        for query, value in (('rand >= ? ORDER BY rand', r), ('rand < ? ORDER BY rand', r)):
+            row = self.db.execute(
+                f'SELECT id, rating, data FROM builds WHERE round = ? AND bucket = ? {player}AND {query} LIMIT 1',
+                (round_number, bucket, *excluded, value)).fetchone()
+            if row is not None:
+                return row
+        return None
+
+    def sample(self, round_number: int, rating: int, exclude: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """同じラウンドで近いレートのビルドを1つ選ぶ。excludeを渡すとそのプレイヤーのビルドは除く"""
+        bucket = rating // BUCKET_WIDTH
+        with self.lock:
+            for widen in range(MAX_WIDEN + 1):
+                buckets = [bucket] if widen == 0 else [bucket - widen, bucket + widen]
+                self.rng.shuffle(buckets)
+                for candidate in buckets:
+                    row = self.sample_row(round_number, candidate, exclude)
+                    if row is not None:
+                        build = decode(row[2])
+                        build['id'] = row[0]
+                        build['rating'] = row[1]
+                        return build
+        return None
+
+    def count(self, round_number: Optional[int] = None) -> int:
+        with self.lock:
+            if round_number is None:
+                return self.db.execute('SELECT COUNT(*) FROM builds').fetchone()[0]
+            return self.db.execute('SELECT COUNT(*) FROM builds WHERE round = ?', (round_number,)).fetchone()[0]
+
+    def close(self) -> None:
+        self.db.close()
+
+#---- テスト用のローカルHTTPサービス ----
+def make_handler(pool: OpponentPool):
+    class PoolHandler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, body: Any) -> None:
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if urlparse(self.path).path != '/builds':
+                return self.send_json(404, {'error': 'not found'})
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            build_id = pool.add_build(int(body['round']), int(body['rating']), body['build'])
+            self.send_json(200, {'id': build_id})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/opponent':
+                return self.send_json(404, {'error': 'not found'})
+            query = parse_qs(url.query)
+            build = pool.sample(int(query['round'][0]), int(query['rating'][0]), query.get('exclude', [None])[0])
+            if build is None:
+                return self.send_json(404, {'error': 'no opponent'})
+            self.send_json(200, build)
+
+        def log_message(self, format, *args):
+            pass
+
+    return PoolHandler
+
+def serve(pool: OpponentPool, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """別スレッドでサーバを立ち上げる。server.server_address[1]が実際のポート"""
+    server = ThreadingHTTPServer((host, port), make_handler(pool))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class RemoteOpponentPool():
+    def __init__(self, url: str, timeout: float = 5.0) -> None:
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def add_build(self, round_number: int, rating: int, build: Dict[str, Any]) -> int:
+        data = json.dumps({'round': round_number, 'rating': rating, 'build': build}).encode('utf-8')
+        request = Request(f'{self.url}/builds', data=data, headers={'Content-Type': 'application/json'})
+        with urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())['id']
+
+    def sample(self, round_number: int, rating: int, exclude: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        query = {'round': round_number, 'rating': rating}
+        if exclude is not None:
+            query['exclude'] = exclude
+        try:
+            with urlopen(f'{self.url}/opponent?{urlencode(query)}', timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except OSError:
+            return None
+
+def test():
+    import os
+    import tempfile
+    import time
+    import numpy as np
+    from .auto_battle import AutoBattle, Character, Trigger
+    from .base_map import BaseMap, CORE, WALL
+    from .base_state import capture
+    from .inventory import Inventory, Item
+    from .constants import RED
+
+    inventory = Inventory(4, 4)
+    inventory.add_item(Item("Dagger", (1, 2), RED, {'attack': 2}, trigger=Trigger(0.7, damage=3)), (0, 0))
+    base_map = BaseMap(16, 12)
+    base_map.add_facility(CORE, 12, 6)
+    wall = base_map.add_facility(WALL, 10, 6)
+    base_map.apply_damage(np.array([wall]), np.array([50.0]))
+    build = snapshot_build(Character("Player", 100, 10, 5, 10), inventory, 'player1', capture(base_map, round_number=3))
+
+    with tempfile.TemporaryDirectory() as directory:
+        pool = OpponentPool(os.path.join(directory, 'pool.db'), seed=0)
+        rng = random.Random(0)
+        start = time.perf_counter()
+        for chunk in range(10):
+            pool.add_builds((rng.randint(1, 10), rng.randint(0, 3000), dict(build, player=f'p{chunk}_{i}'))
+                            for i in range(10000))
+        print(f'stored {pool.count()} builds in {time.perf_counter() - start:.2f}s '
+              f'({os.path.getsize(os.path.join(directory, "pool.db")) / pool.count():.0f} bytes/build)')
+
+        start = time.perf_counter()
+        for _ in range(1000):
+            pool.sample(rng.randint(1, 10), rng.randint(0, 3000), 'player1')
+        print(f'1000 samples: {(time.perf_counter() - start) * 1000:.1f}ms')
+
+        server = serve(pool)
+        remote = RemoteOpponentPool(f'http://127.0.0.1:{server.server_address[1]}')
+        remote.add_build(11, 1500, build)
+        opponent = remote.sample(11, 1550, exclude='someone')
+        character, ghost_inventory = restore_build(opponent)
+        battle = AutoBattle(Character("Player", 100, 10, 5, 10), character, inventory.items(), ghost_inventory.items())
+        print(f'remote opponent {opponent["id"]} rating {opponent["rating"]}: {battle.resolve()}')
+        print(f'no opponent for self: {remote.sample(11, 1500, exclude="player1")}')
+        base = restore_base(opponent)
+        print(f'ghost base round {base.round_number}: {base.facilities()}')
+        # player idのないビルドも、excludeを渡さなければ選ばれる / 特殊文字のidも送れる
+        pool.add_build(12, 1500, dict(build, player=''))
+        remote.add_build(13, 1500, dict(build, player='a&b=c d'))
+        print(f"anonymous build: {pool.sample(12, 1500) is not None}, "
+              f"encoded exclude: {remote.sample(13, 1500, exclude='a&b=c d')} / "
+              f"{remote.sample(13, 1500, exclude='a')['player']}")
+        server.shutdown()
+        pool.close()
+
+if __name__ == '__main__':
+    test()
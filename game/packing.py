@@ -0,0 +1,248 @@
+"""
+packing.py - バックパックの自動詰め込み
+
+fit_all:      全アイテムを入れる配置を探す
+best_layout:  入りきらないときに価値(例: 攻撃力)の合計が最大になる配置を探す
+
+どちらもビットボード上の分枝限定法で、まず貪欲法で暫定解を作ってから
+時間予算の中で探索する。時間切れのときは見つかった中で一番良い解を返す。
+価値はアイテムごとの足し算で、隣接ボーナスは考慮しない(必要なら結果をStatAggregatorで評価する)。
+"""
+
+import time
+from typing import Callable, List, Optional, Tuple
+from .inventory import Inventory, Item
+
+Placement = Tuple[int, int, int, int]  # (mask, x, y, rotation)
+
+class PackResult():
+    def __init__(self, placements, score, complete, optimal, nodes, elapsed):
+        self.placements: List[Tuple[Item, int, int, int]] = placements  # (item, x, y, rotation)
+        self.score = score
+        self.complete = complete  # 全アイテムが入ったか
+        self.optimal = optimal    # 探索を最後まで終えたか
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    def apply(self, inventory: Inventory) -> None:
+        inventory.clear()
+        for item, x, y, rotation in self.placements:
+            inventory.add_item(item, (x, y), rotation)
+
+def item_area(item: Item) -> int:
+    return len(item.shape(0).cells)
+
+def placement_options(item: Item, rows: int, cols: int) -> List[Placement]:
+    options = []
+    for rotation, shape in enumerate(item.shapes):
+        base = shape.mask(cols)
+        for y in range(rows - shape.height + 1):
+            for x in range(cols - shape.width + 1):
+                options.append((base << (y * cols + x), x, y, rotation))
+    return options
+
+class PackingSolver():
+    def __init__(self, rows: int, cols: int, items: List[Item], value: Optional[Callable[[Item], float]] = None,
+                 time_budget: float = 0.05, blocked: int = 0) -> None:
+        self.rows = rows
+        self.cols = cols
+        self.items = items
+        self.value = value if value is not None else item_area
+        self.time_budget = time_budget
+        self.blocked = blocked  # 最初から使えないマスのビットボード
+        self.options = [placement_options(item, rows, cols) for item in items]
+        self.areas = [item_area(item) for item in items]
+        self.values = [self.value(item) for item in items]
+        self.nodes = 0
+        self.deadline = 0.0
+        self.timed_out = False
+
+    def free_cells(self, board: int) -> int:
+        return self.rows * self.cols - bin(board).count('1')
+
+    def result(self, chosen: List[Tuple[int, Placement]], optimal: bool, start: float) -> PackResult:
+        placements = [(self.items[i], x, y, rotation) for i, (_, x, y, rotation) in chosen]
+        score = sum(self.values[i] for i, _ in chosen)
+        return PackResult(placements, score, len(chosen) == len(self.items), optimal,
+                          self.nodes, time.perf_counter() - start)
+
+    def check_time(self) -> bool:
+        self.nodes += 1
+        if self.nodes & 255 == 0 and time.perf_counter() > self.deadline:
+            self.timed_out = True
+        return self.timed_out
+
+    #---- 貪欲法 ----
+    def greedy(self) -> List[Tuple[int, Placement]]:
+        board = self.blocked
+        chosen = []
+        order = sorted(range(len(self.items)), key=lambda i: (-self.values[i] / self.areas[i], -self.areas[i]))
+        for i in order:
+            for option in self.options[i]:
+                if not board & option[0]:
+                    board |= option[0]
+                    chosen.append((i, option))
+                    break
+        return chosen
+
+    #---- 全部入れる ----
+    def fit_all(self) -> PackResult:
+        start = time.perf_counter()
+        self.deadline = start + self.time_budget
+        self.nodes = 0
+        self.timed_out = False
+        greedy = self.greedy()
+        if len(greedy) == len(self.items):
+            return self.result(greedy, True, start)
+        if sum(self.areas) > self.free_cells(self.blocked):
+            return self.result(greedy, True, start)  # 面積的に無理
+        found = self.search_fit(self.blocked, list(range(len(self.items))), [])
+        if found is not None:
+            return self.result(found, True, start)
+        return self.result(greedy, not self.timed_out, start)
+
+    def search_fit(self, board: int, remaining: List[int], chosen: List[Tuple[int, Placement]]):
+        if not remaining:
+            return list(chosen)
+        if self.check_time():
+            return None
+        # 置ける場所が一番少ないアイテムから決める(0か所なら枝刈り)
+        best_index = None
+        best_options = None
+        for index in remaining:
+            options = [option for option in self.options[index] if not board & option[0]]
+            if not options:
+                return None
+            if best_options is None or len(options) < len(best_options):
+                best_index = index
+                best_options = options
+        rest = [index for index in remaining if index != best_index]
+        for option in best_options:
+            chosen.append((best_index, option))
+            found = self.search_fit(board | option[0], rest, chosen)
+            chosen.pop()
+            if found is not None or self.timed_out:
+                return found
+        return None
+
+    #---- 価値最大 ----
+    def best_layout(self) -> PackResult:
+        start = time.perf_counter()
+        self.deadline = start + self.time_budget
+        self.nodes = 0
+        self.timed_out = False
+        self.best = self.greedy()
+        self.best_score = sum(self.values[i] for i, _ in self.best)
+        # 面積あたりの価値が高い順。同じアイテムは隣に並べる(対称な配置を省くため)
+        keys = [(tuple(shape.cells for shape in item.shapes), self.values[i]) for i, item in enumerate(self.items)]
+        self.order = sorted(range(len(self.items)), key=lambda i: (-self.values[i] / self.areas[i], keys[i]))
+        self.same_as_previous = [k > 0 and keys[self.order[k]] == keys[self.order[k - 1]]
+                                 for k in range(len(self.order))]
+        self.search_best(self.blocked, 0, 0.0, [], -1)
+        return self.result(self.best, not self.timed_out, start)
+
+    def upper_bound(self, k: int, free: int) -> float:
+        """残りのマスに価値の高い順で詰めた(端数は割合で入れた)ときの価値"""
+        bound = 0.0
+        for index in self.order[k:]:
+            area = self.areas[index]
+            if area <= free:
+                bound += self.values[index]
+                free -= area
+            else:
+                return bound + self.values[index] * free / area
+        return bound
+
+    def search_best(self, board: int, k: int, score: float, chosen: List[Tuple[int, Placement]],
+                    previous: int) -> None:
+        """previous: 1つ前のアイテムを置いた候補の番号(置かなかったら-1)"""
+        if score > self.best_score:
+            self.best_score = score
+            self.best = list(chosen)
+        if k == len(self.order) or self.check_time():
+            return
+        free = self.free_cells(board)
+        if score + self.upper_bound(k, free) <= self.best_score:
+            return
+        index = self.order[k]
+        same = self.same_as_previous[k]
+        # 同じアイテムが続くときは、前のものより後ろの候補にだけ置く(前を置かなかったら今回も置かない)
+        if self.areas[index] <= free and not (same and previous < 0):
+            first = previous + 1 if same else 0
+            options = self.options[index]
+            for n in range(first, len(options)):
+                mask = options[n][0]
+                if not board & mask:
+                    chosen.append((index, options[n]))
+                    self.search_best(board | mask, k + 1, score + self.values[index], chosen, n)
+                    chosen.pop()
+                    if self.timed_out:
+                        return
+        # このアイテムを入れない場合
+        self.search_best(board, k + 1, score, chosen, -1)
+
+def fit_all(inventory: Inventory, items: List[Item], time_budget: float = 0.05) -> PackResult:
+    """itemsを全部inventoryに入れる配置を探す(inventoryは変更しない)"""
+    return PackingSolver(inventory.rows, inventory.cols, items, time_budget=time_budget).fit_all()
+
+def best_layout(inventory: Inventory, items: List[Item], value: Callable[[Item], float],
+                time_budget: float = 0.05) -> PackResult:
+    """value(item)の合計が最大になる配置を探す(inventoryは変更しない)"""
+    return PackingSolver(inventory.rows, inventory.cols, items, value, time_budget).best_layout()
+
+SHAPES = [
+    ((0, 0),),
+    ((0, 0), (1, 0)),
+    ((0, 0), (1, 0), (2, 0)),
+    ((0, 0), (1, 0), (0, 1), (1, 1)),
+    ((0, 0), (0, 1), (1, 1)),
+    ((0, 0), (1, 0), (2, 0), (1, 1)),
+    ((0, 0), (0, 1), (0, 2), (1, 2)),
+    ((1, 0), (2, 0), (0, 1), (1, 1)),
+]
+
+def random_items(rng, size: int, fill: float) -> List[Item]:
+    """面積の合計がマス数のfill倍くらいになるランダムなアイテム"""
+    items = []
+    area = 0
+    while area < size * size * fill:
+        cells = rng.choice(SHAPES)
+        items.append(Item(f"Item{len(items)}", (1, 1), (200, 200, 200), {'attack': rng.randint(1, 9)}, cells=cells))
+        area += len(cells)
+    return items
+
+def benchmark(trials: int = 5, time_budget: float = 0.05) -> None:
+    """4x4〜9x9のバッグでランダムなアイテムを詰める時間を測る
+    score/boundは分数ナップサックの上界に対する割合(100%なら最適と分かる)"""
+    import random
+    rng = random.Random(0)
+    attack = lambda item: item.effect['attack']
+    print(f"{'bag':>5} {'fit_all ms':>11} {'placed':>7} {'best_layout ms':>15} {'optimal':>8} {'score/bound':>12}")
+    for size in range(4, 10):
+        fit_time = best_time = ratio = 0.0
+        placed = optimal = 0
+        for _ in range(trials):
+            inventory = Inventory(size, size)
+            result = fit_all(inventory, random_items(rng, size, 0.8), time_budget)
+            fit_time += result.elapsed
+            placed += result.complete
+            solver = PackingSolver(size, size, random_items(rng, size, 1.3), attack, time_budget)
+            result = solver.best_layout()
+            best_time += result.elapsed
+            optimal += result.optimal
+            ratio += result.score / solver.upper_bound(0, size * size)
+        print(f"{size}x{size:<3} {fit_time / trials * 1000:>11.2f} {placed:>5}/{trials} "
+              f"{best_time / trials * 1000:>15.2f} {optimal:>6}/{trials} {ratio / trials * 100:>11.1f}%")
+
+def test():
+    from .constants import RED, GREEN
+    inventory = Inventory(4, 4)
+    items = [Item("Sword", (1, 2), RED, {'attack': 5}), Item("Shield", (2, 2), GREEN, {'defense': 3}),
+             Item("Bow", (1, 3), RED, {'attack': 4}), Item("Gem", (1, 1), GREEN, {'attack': 1})]
+    result = fit_all(inventory, items)
+    result.apply(inventory)
+    print(result.complete, [(item.name, x, y, r) for item, x, y, r in result.placements])
+    benchmark()
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,195 @@
+"""
+parallax.py - スクロールする多重背景(パララックス)
+
+毎フレーム空と地面の画像をタイルごとに全部blitし直す代わりに、
+- 各レイヤーは最初に「画面幅 + 画像1枚分」の横長の帯(strip)を1回だけ作っておき、
+  スクロールは帯の中の切り出し位置(offset % 画像の幅)を変えて1回blitするだけにする
+- 全レイヤーを重ねた結果(composite)を持っておく。切り出し位置が変わったレイヤーの
+  縦の範囲だけを描き直し、動いていない範囲はcompositeからコピーする
+  - 動いている範囲は画面に直接描く(compositeに描いてからコピーすると2回分かかる)
+  - 止まった範囲は、古くなっていれば1回だけcompositeに重ね直す
+"""
+
+import pygame
+from typing import List, Optional, Tuple
+
+Span = Tuple[int, int]  # 行の範囲 [top, bottom)
+
+def merge_spans(spans: List[Span]) -> List[Span]:
+    merged: List[Span] = []
+    for top, bottom in sorted(spans):
+        if top >= bottom:
+            continue
+        if merged and top <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], bottom))
+        else:
+            merged.append((top, bottom))
+    return merged
+
+def subtract_spans(spans: List[Span], removed: List[Span]) -> List[Span]:
+    result = []
+    for top, bottom in spans:
+        for cut_top, cut_bottom in removed:
+            if cut_bottom <= top or bottom <= cut_top:
+                continue
+            if top < cut_top:
+                result.append((top, cut_top))
+            top = max(top, cut_bottom)
+            if top >= bottom:
+                break
+        if top < bottom:
+            result.append((top, bottom))
+    return result
+
+def intersect_spans(a: List[Span], b: List[Span]) -> List[Span]:
+    return [(max(t1, t2), min(b1, b2)) for t1, b1 in a for t2, b2 in b if max(t1, t2) < min(b1, b2)]
+
+class ParallaxLayer():
+    def __init__(self, image: pygame.Surface, speed: float, y: int = 0, repeat: bool = True) -> None:
+        self.image = image
+        self.speed = speed    # scroll(dx)に対する移動量の倍率(遠いほど小さい)
+        self.y = y
+        self.repeat = repeat
+        self.offset = 0.0
+        self.strip: Optional[pygame.Surface] = None
+        self.last_shift = -1  # 前のフレームの切り出し位置
+
+    def span(self) -> Span:
+        return self.y, self.y + self.image.get_height()
+
+    def build(self, width: int) -> None:
+        """画面幅 + 画像1枚分の帯を作る(最初と画面サイズが変わったときだけ)"""
+        tile = self.image.get_width()
+        count = (width // tile + 2) if self.repeat else 1
+        strip = pygame.Surface((tile * count, self.image.get_height()), self.image.get_flags() & pygame.SRCALPHA)
+        if pygame.display.get_surface() is not None:
+            strip = strip.convert_alpha() if self.image.get_flags() & pygame.SRCALPHA else strip.convert()
+        strip.blits([(self.image, (tile * i, 0)) for i in range(count)], doreturn=False)
+        self.strip = strip
+        self.last_shift = -1
+
+    def shift(self) -> int:
+        if not self.repeat:
+            return 0
+        return int(self.offset) % self.image.get_width()
+
+class ParallaxBackground():
+    def __init__(self, size: Tuple[int, int], layers: List[ParallaxLayer], fill=(0, 0, 0)) -> None:
+        self.size = size
+        self.layers = layers  # 奥から手前の順
+        self.fill = fill
+        self.composite = pygame.Surface(size)
+        if pygame.display.get_surface() is not None:
+            self.composite = self.composite.convert()
+        for layer in layers:
+            layer.build(size[0])
+        self.stale: List[Span] = [(0, size[1])]  # compositeが古くなっている行
+        self.recomposited = 0  # compositeに重ね直した範囲の数(統計)
+
+    def scroll(self, dx: float) -> None:
+        for layer in self.layers:
+            layer.offset += dx * layer.speed
+
+    def compose(self, target: pygame.Surface, span: Span, position: Tuple[int, int]) -> None:
+        """spanの行に全レイヤーを奥から順に描く"""
+        width = self.size[0]
+        x, y = position
+        clip = target.get_clip()
+        band = pygame.Rect(x, y + span[0], width, span[1] - span[0])
+        target.set_clip(band.clip(clip))
+        target.fill(self.fill, band)
+        for layer in self.layers:
+            top, bottom = layer.span()
+            if top < span[1] and span[0] < bottom:
+                target.blit(layer.strip, (x, y + layer.y), pygame.Rect(layer.shift(), 0, width, bottom - top))
+        target.set_clip(clip)
+
+    def draw(self, surface: pygame.Surface, position: Tuple[int, int] = (0, 0)) -> List[pygame.Rect]:
+        """背景を描き、動いた範囲(display.updateに渡せる)を返す"""
+        width, height = self.size
+        screen = [(0, height)]
+        moving = []
+        for layer in self.layers:
+            shift = layer.shift()
+            if shift != layer.last_shift:
+                moving.append(layer.span())
+                layer.last_shift = shift
+        moving = intersect_spans(merge_spans(moving), screen)
+        still = subtract_spans(screen, moving)
+        # 止まっている範囲で古いところだけcompositeを作り直す
+        for span in intersect_spans(self.stale, still):
+            self.compose(self.composite, span, (0, 0))
+            self.recomposited += 1
+        self.stale = merge_spans(subtract_spans(self.stale, still) + moving)
+        x, y = position
+        for top, bottom in still:
+            surface.blit(self.composite, (x, y + top), pygame.Rect(0, top, width, bottom - top))
+        for span in moving:
+            self.compose(surface, span, position)
+        return [pygame.Rect(x, y + top, width, bottom - top) for top, bottom in moving]
+
+def benchmark(frames: int = 120) -> None:
+    """毎フレーム全部描く場合と、compositeを使う場合の比較"""
+    import time
+    print(f"{'screen':>10} {'full redraw ms':>15} {'all scrolling ms':>17} {'ground only ms':>15} {'static ms':>10}")
+    for width, height in ((800, 400), (1920, 1080)):
+        sky = pygame.Surface((800, int(height * 0.75)))
+        sky.fill((94, 129, 162))
+        hills = pygame.Surface((400, height // 4), pygame.SRCALPHA)
+        pygame.draw.ellipse(hills, (60, 120, 60), hills.get_rect())
+        ground = pygame.Surface((64, height // 4))
+        ground.fill((120, 90, 40))
+        surface = pygame.Surface((width, height))
+
+        # 元の書き方: 毎フレーム全レイヤーを画像1枚ずつblitする
+        offsets = [0.0, 0.0, 0.0]
+        start = time.perf_counter()
+        for _ in range(frames):
+            offsets = [offsets[0] + 1, offsets[1] + 3, offsets[2] + 6]
+            for image, offset, y in ((sky, offsets[0], 0), (hills, offsets[1], height // 2),
+                                     (ground, offsets[2], height * 3 // 4)):
+                tile = image.get_width()
+                x = -(int(offset) % tile)
+                while x < width:
+                    surface.blit(image, (x, y))
+                    x += tile
+        full = (time.perf_counter() - start) / frames
+
+        background = ParallaxBackground((width, height), [
+            ParallaxLayer(sky, 1 / 6), ParallaxLayer(hills, 0.5, height // 2), ParallaxLayer(ground, 1.0, height * 3 // 4)])
+        start = time.perf_counter()
+        for _ in range(frames):
+            background.scroll(6)
+            background.draw(surface)
+        cached = (time.perf_counter() - start) / frames
+        # 空と丘が止まっていて地面だけ動く場合(pixel_runと同じ)
+        background.layers[0].speed = background.layers[1].speed = 0.0
+        start = time.perf_counter()
+        for _ in range(frames):
+            background.scroll(6)
+            background.draw(surface)
+        ground_only = (time.perf_counter() - start) / frames
+        start = time.perf_counter()
+        for _ in range(frames):
+            background.draw(surface)
+        static = (time.perf_counter() - start) / frames
+        print(f'{width}x{height:<5} {full * 1000:>15.3f} {cached * 1000:>17.3f} {ground_only * 1000:>15.3f} '
+              f'{static * 1000:>10.3f}')
+
+def test():
+    pygame.init()
+    sky = pygame.Surface((100, 300))
+    sky.fill((94, 129, 162))
+    ground = pygame.Surface((50, 100))
+    ground.fill((120, 90, 40))
+    pygame.draw.line(ground, (0, 0, 0), (0, 0), (0, 99))
+    background = ParallaxBackground((800, 400), [ParallaxLayer(sky, 0.2), ParallaxLayer(ground, 1.0, 300)])
+    surface = pygame.Surface((800, 400))
+    print(background.draw(surface))
+    background.scroll(10)
+    print(background.draw(surface), surface.get_at((40, 350)), surface.get_at((0, 350)))
+    print(background.draw(surface), background.recomposited, background.stale)
+    benchmark()
+
+if __name__ == '__main__':
+    test()
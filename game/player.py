@@ -1,6 +1,8 @@
 import pygame
 
 class Player():
+    __slots__ = ('hp', 'mp')
+
     def __init__(self, hp, mp):
         self.hp = hp
         self.mp = mp
@@ -0,0 +1,234 @@
+"""
+profiler.py - フレーム時間の計測とオーバーレイ表示
+
+- Profiler.scope(name): withで囲んだ区間の時間を測る(handle_event, update, draw, presentなど)
+  無効のときは何もしない共有オブジェクトを返すだけなので、呼び出し側はほぼ0コスト
+- フレームごとの合計と区間ごとの時間をリングバッファ(NumPy配列)に貯め、p50/p95/p99を出す
+- export_chrome_trace(): chrome://tracing や Perfetto で開けるJSONに書き出す
+- PerformanceOverlay: フレーム時間のグラフと区間ごとのパーセンタイルを画面に描く(F3などで切り替え)
+"""
+
+import json
+import os
+import threading
+import time
+import numpy as np
+import pygame
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+from .text_cache import render_text
+
+class NullScope():
+    """無効のときのscope。何もしない"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+NULL_SCOPE = NullScope()
+
+class Scope():
+    def __init__(self, profiler: 'Profiler', name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.profiler.record(self.name, self.start, time.perf_counter())
+
+class RingBuffer():
+    def __init__(self, capacity: int) -> None:
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.index = 0
+        self.count = 0
+
+    def push(self, value: float) -> None:
+        self.values[self.index] = value
+        self.index = (self.index + 1) % len(self.values)
+        self.count = min(self.count + 1, len(self.values))
+
+    def ordered(self) -> np.ndarray:
+        """古い順に並べた値"""
+        if self.count < len(self.values):
+            return self.values[:self.count]
+        return np.concatenate([self.values[self.index:], self.values[:self.index]])
+
+class Profiler():
+    def __init__(self, capacity: int = 600, enabled: bool = False, max_events: int = 200000) -> None:
+        self.capacity = capacity
+        self.enabled = enabled
+        self.max_events = max_events
+        self.frames = RingBuffer(capacity)   # フレーム全体の時間(秒)
+        self.sections: Dict[str, RingBuffer] = {}
+        self.current: Dict[str, float] = {}  # 今のフレームの区間ごとの合計
+        self.frame_start: Optional[float] = None
+        self.origin = time.perf_counter()
+        # Chrome trace用の記録 (name, 開始秒, 終了秒, スレッド)
+        self.events: List[Tuple[str, float, float, int]] = []
+
+    def scope(self, name: str):
+        if not self.enabled:
+            return NULL_SCOPE
+        return Scope(self, name)
+
+    def profile(self, name: Optional[str] = None) -> Callable:
+        """関数を丸ごと測るデコレータ(サブシステムが自分で付ける用)"""
+        def decorator(function: Callable) -> Callable:
+            label = name or function.__qualname__
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(label, start, time.perf_counter())
+            return wrapper
+        return decorator
+
+    def record(self, name: str, start: float, end: float) -> None:
+        self.current[name] = self.current.get(name, 0.0) + (end - start)
+        if len(self.events) < self.max_events:
+            self.events.append((name, start, end, threading.get_ident()))
+
+    def begin_frame(self) -> None:
+        if self.enabled:
+            self.frame_start = time.perf_counter()
+
+    def end_frame(self) -> None:
+        if not self.enabled or self.frame_start is None:
+            return
+        end = time.perf_counter()
+        self.frames.push(end - self.frame_start)
+        if len(self.events) < self.max_events:
+            self.events.append(('frame', self.frame_start, end, threading.get_ident()))
+        for name, elapsed in self.current.items():
+            buffer = self.sections.get(name)
+            if buffer is None:
+                buffer = self.sections[name] = RingBuffer(self.capacity)
+            buffer.push(elapsed)
+        self.current = {}
+        self.frame_start = None
+
+    def set_enabled(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self.frame_start = None
+        self.current = {}
+
+    def percentiles(self, name: Optional[str] = None, points=(50, 95, 99)) -> Dict[int, float]:
+        """ミリ秒のパーセンタイル。nameを省くとフレーム全体"""
+        buffer = self.frames if name is None else self.sections.get(name)
+        if buffer is None or buffer.count == 0:
+            return {point: 0.0 for point in points}
+        values = np.percentile(buffer.ordered(), points) * 1000
+        return dict(zip(points, values.tolist()))
+
+    def summary(self) -> Dict[str, Dict[int, float]]:
+        result = {'frame': self.percentiles()}
+        for name in self.sections:
+            result[name] = self.percentiles(name)
+        return result
+
+    def export_chrome_trace(self, path: str) -> None:
+        pid = os.getpid()
+        events = [{'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                   'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6}
+                  for name, start, end, tid in self.events]
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+    def clear(self) -> None:
+        self.frames = RingBuffer(self.capacity)
+        self.sections = {}
+        self.current = {}
+        self.events = []
+
+#ゲーム全体で共有するプロファイラ(最初は無効)
+profiler = Profiler()
+
+class PerformanceOverlay():
+    def __init__(self, profiler: Profiler, font: pygame.font.Font, rect: pygame.Rect,
+                 budget_ms: float = 1000 / 60) -> None:
+        self.profiler = profiler
+        self.font = font
+        self.rect = rect
+        self.budget_ms = budget_ms  # グラフに引く目安の線(1フレームの予算)
+        self.visible = False
+        self.background = pygame.Surface(rect.size, pygame.SRCALPHA)
+        self.background.fill((0, 0, 0, 160))
+
+    def toggle(self) -> None:
+        """表示を切り替える。計測も表示中だけ有効にする"""
+        self.visible = not self.visible
+        self.profiler.set_enabled(self.visible)
+
+    def draw(self, surface: pygame.Surface) -> None:
+        if not self.visible:
+            return
+        rect = self.rect
+        surface.blit(self.background, rect)
+        values = self.profiler.frames.ordered()[-rect.width:] * 1000
+        scale = rect.height / (self.budget_ms * 2)
+        budget_y = rect.bottom - int(self.budget_ms * scale)
+        pygame.draw.line(surface, (255, 255, 0), (rect.left, budget_y), (rect.right - 1, budget_y))
+        if len(values) > 1:
+            ys = rect.bottom - 1 - np.minimum(values * scale, rect.height - 1).astype(np.int32)
+            xs = rect.right - len(values) + np.arange(len(values))
+            pygame.draw.lines(surface, (0, 255, 0), False, np.stack([xs, ys], axis=1).tolist())
+        y = rect.top + 2
+        for name, points in self.profiler.summary().items():
+            text = f'{name:<12} p50 {points[50]:5.2f}  p95 {points[95]:5.2f}  p99 {points[99]:5.2f} ms'
+            surface.blit(render_text(self.font, text, (255, 255, 255)), (rect.left + 4, y))
+            y += self.font.get_linesize()
+
+def test():
+    import tempfile
+    pygame.init()
+    local = Profiler(capacity=120)
+
+    @local.profile('physics')
+    def physics():
+        sum(range(2000))
+
+    # 無効のときのコスト
+    start = time.perf_counter()
+    for _ in range(100000):
+        with local.scope('update'):
+            pass
+    disabled = (time.perf_counter() - start) / 100000
+
+    local.set_enabled(True)
+    start = time.perf_counter()
+    for _ in range(100000):
+        with local.scope('update'):
+            pass
+    enabled = (time.perf_counter() - start) / 100000
+    local.clear()
+
+    surface = pygame.Surface((800, 600))
+    overlay = PerformanceOverlay(local, pygame.font.Font(None, 18), pygame.Rect(0, 0, 360, 120))
+    overlay.toggle()
+    for _ in range(200):
+        local.begin_frame()
+        with local.scope('update'):
+            physics()
+        with local.scope('draw'):
+            surface.fill((0, 0, 0))
+            overlay.draw(surface)
+        local.end_frame()
+    print(f'scope cost: disabled {disabled * 1e9:.0f}ns, enabled {enabled * 1e9:.0f}ns')
+    print({name: {point: round(value, 3) for point, value in points.items()} for name, points in local.summary().items()})
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'trace.json')
+        local.export_chrome_trace(path)
+        with open(path) as file:
+            trace = json.load(file)
+        print(f"{len(trace['traceEvents'])} trace events, first: {trace['traceEvents'][0]['name']}")
+
+if __name__ == '__main__':
+    test()
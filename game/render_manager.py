@@ -17,6 +17,9 @@ class RenderManager():
     def clear(self):
         self.screen.fill(BLACK)
 
+    def present(self):
+        pygame.display.flip()
+
 def test():
     print('a')
 
@@ -0,0 +1,53 @@
+import os
+import pygame
+from typing import Dict, Optional, Tuple
+
+#リポジトリ直下のassetsフォルダ
+ASSET_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+
+class ResourceManager():
+    def __init__(self, asset_dir: str = ASSET_DIR) -> None:
+        self.asset_dir = asset_dir
+        # (path, size)ごとに1回だけ読み込み・拡大縮小・マスク生成をする
+        self.images: Dict[Tuple[str, Optional[Tuple[int, int]]], pygame.Surface] = {}
+        self.masks: Dict[Tuple[str, Optional[Tuple[int, int]]], pygame.mask.Mask] = {}
+
+    def path(self, name: str) -> str:
+        return name if os.path.isabs(name) else os.path.join(self.asset_dir, name)
+
+    def load_image(self, name: str, size: Optional[Tuple[int, int]] = None) -> pygame.Surface:
+        key = (name, tuple(size) if size else None)
+        image = self.images.get(key)
+        if image is None:
+            if size:
+                image = pygame.transform.scale(self.load_image(name), size)
+            else:
+                image = pygame.image.load(self.path(name))
+                if pygame.display.get_surface() is not None:
+                    image = image.convert_alpha()
+            self.images[key] = image
+        return image
+
+    def get_mask(self, name: str, size: Optional[Tuple[int, int]] = None) -> pygame.mask.Mask:
+        key = (name, tuple(size) if size else None)
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = pygame.mask.from_surface(self.load_image(name, size))
+            self.masks[key] = mask
+        return mask
+
+    def clear(self) -> None:
+        self.images.clear()
+        self.masks.clear()
+
+#ゲーム全体で共有するリソース
+resources = ResourceManager()
+
+def test():
+    pygame.init()
+    mask1 = resources.get_mask('buttons/start_button0.png', (100, 200))
+    mask2 = resources.get_mask('buttons/start_button0.png', (100, 200))
+    print(mask1 is mask2, mask1.get_size(), len(resources.images))
+
+if __name__ == '__main__':
+    test()
@@ -3,7 +3,7 @@ from dataclasses import dataclass
 from .constants import SCENE_LIST
 
 class SceneManager():
-    @dataclass
+    @dataclass(frozen=True, slots=True)
     class Scene():
         name: str
         color: tuple
@@ -0,0 +1,186 @@
+"""
+scheduler.py - シミュレーション時間で動くタイマー
+
+pygame.time.set_timerは実時間でSDLのイベントキューにイベントを積むので、
+ヘッドレスのシミュレーションやリプレイでは同じタイミングで発火しない。
+Schedulerは自分で持つ時刻(advance()で進める)だけを見て、(時刻, 連番)のヒープから
+期限の来たタイマーを順番に呼ぶ。同じ時刻のタイマーは登録順に呼ぶので結果は決定的。
+
+- after(delay, callback):   1回だけ
+- every(interval, callback): 繰り返し(発火時刻 + intervalで積み直すのでずれが溜まらない)
+- timer.cancel():           取り消し(ヒープからはすぐ消さず、取り出したときに捨てる)
+- 登録はO(log n)。取り消しが溜まったらヒープを作り直す
+- FixedTimestep: 実際のフレーム時間を固定の刻みに分けてupdateとadvanceを呼ぶ
+"""
+
+import heapq
+from typing import Any, Callable, List, Optional, Tuple
+
+class Timer():
+    def __init__(self, scheduler: 'Scheduler', time: float, interval: Optional[float], callback: Callable,
+                 args: Tuple[Any, ...], count: Optional[int]) -> None:
+        self.scheduler = scheduler
+        self.time = time          # 次に発火する時刻
+        self.interval = interval  # Noneなら1回だけ
+        self.callback = callback
+        self.args = args
+        self.remaining = count    # 繰り返しの残り回数(Noneなら無限)
+        self.active = True
+
+    def cancel(self) -> None:
+        self.scheduler.cancel(self)
+
+class Scheduler():
+    def __init__(self, time: float = 0.0) -> None:
+        self.time = time
+        self.queue: List[Tuple[float, int, Timer]] = []
+        self.seq = 0
+        self.cancelled = 0  # ヒープに残っている取り消し済みの数
+        self.fired = 0
+
+    def push(self, timer: Timer) -> None:
+        heapq.heappush(self.queue, (timer.time, self.seq, timer))
+        self.seq += 1
+
+    def after(self, delay: float, callback: Callable, *args) -> Timer:
+        timer = Timer(self, self.time + delay, None, callback, args, None)
+        self.push(timer)
+        return timer
+
+    def every(self, interval: float, callback: Callable, *args, start: Optional[float] = None,
+              count: Optional[int] = None) -> Timer:
+        """interval秒ごとに呼ぶ。最初はstart秒後(省略するとinterval秒後)、count回で終わる"""
+        if interval <= 0:
+            raise ValueError('interval must be positive')
+        timer = Timer(self, self.time + (interval if start is None else start), interval, callback, args, count)
+        self.push(timer)
+        return timer
+
+    def cancel(self, timer: Timer) -> None:
+        if not timer.active:
+            return
+        timer.active = False
+        self.cancelled += 1
+        if self.cancelled > 64 and self.cancelled * 2 > len(self.queue):
+            # run_untilの途中(コールバックの中)でも同じリストを使い続けられるように、その場で詰める
+            self.queue[:] = [entry for entry in self.queue if entry[2].active]
+            heapq.heapify(self.queue)
+            self.cancelled = 0
+
+    def next_time(self) -> Optional[float]:
+        while self.queue and not self.queue[0][2].active:
+            heapq.heappop(self.queue)
+            self.cancelled -= 1
+        return self.queue[0][0] if self.queue else None
+
+    def __len__(self) -> int:
+        return len(self.queue) - self.cancelled
+
+    def run_until(self, time: float) -> int:
+        """time以前のタイマーを時刻順に全部呼ぶ。呼んだ数を返す"""
+        fired = 0
+        queue = self.queue
+        while queue and queue[0][0] <= time:
+            when, _, timer = heapq.heappop(queue)
+            if not timer.active:
+                self.cancelled -= 1
+                continue
+            # コールバックの中のafter()は発火した時刻から数える
+            self.time = when
+            if timer.interval is not None and (timer.remaining is None or timer.remaining > 1):
+                if timer.remaining is not None:
+                    timer.remaining -= 1
+                timer.time = when + timer.interval
+                self.push(timer)
+            else:
+                timer.active = False
+            timer.callback(*timer.args)
+            fired += 1
+        self.time = max(self.time, time)
+        self.fired += fired
+        return fired
+
+    def advance(self, dt: float) -> int:
+        return self.run_until(self.time + dt)
+
+    def clear(self) -> None:
+        for _, _, timer in self.queue:
+            timer.active = False
+        self.queue.clear()
+        self.cancelled = 0
+
+class FixedTimestep():
+    """可変のフレーム時間を固定の刻みstepに分ける。遅れすぎたらmax_stepsで打ち切る"""
+    def __init__(self, scheduler: Scheduler, step: float = 1 / 60, max_steps: int = 5) -> None:
+        self.scheduler = scheduler
+        self.step = step
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+
+    def tick(self, dt: float, update: Optional[Callable[[float], None]] = None) -> int:
+        self.accumulator += dt
+        steps = 0
+        while self.accumulator >= self.step and steps < self.max_steps:
+            if update is not None:
+                update(self.step)
+            self.scheduler.advance(self.step)
+            self.accumulator -= self.step
+            steps += 1
+        if steps == self.max_steps:
+            self.accumulator = min(self.accumulator, self.step)
+        return steps
+
+def test():
+    import random
+    import time
+
+    scheduler = Scheduler()
+    log = []
+    spawn = scheduler.every(1.5, log.append, 'spawn')
+    scheduler.every(0.4, log.append, 'snail', count=3)
+    scheduler.after(1.0, lambda: scheduler.after(0.5, log.append, 'chained'))
+    scheduler.after(2.0, spawn.cancel)
+    clock = FixedTimestep(scheduler)
+    for _ in range(60 * 4):
+        clock.tick(1 / 60)
+    print(f't={scheduler.time:.2f}', log, len(scheduler))
+
+    # コールバックの中で大量に取り消してヒープを詰め直しても、繰り返しのタイマーは正しく動く
+    scheduler = Scheduler()
+    ticks = []
+    shots = [scheduler.after(1.0, lambda: None) for _ in range(100)]
+    scheduler.every(0.3, lambda: ticks.append(scheduler.time))
+    scheduler.after(0.5, lambda: [timer.cancel() for timer in shots[:80]])
+    scheduler.run_until(1.0)
+    ticks.clear()
+    scheduler.run_until(3.0)
+    print(f'cancel 80 in a callback: {len(ticks)} ticks in (1, 3], cancelled {scheduler.cancelled}, '
+          f'{len(scheduler.queue)} in queue')
+
+    def run(seed: int) -> List[int]:
+        rng = random.Random(seed)
+        scheduler = Scheduler()
+        order = []
+        timers = [scheduler.after(rng.uniform(0, 10), order.append, i) for i in range(100000)]
+        for timer in timers[::3]:
+            timer.cancel()
+        for i in range(1000):
+            scheduler.every(rng.uniform(0.1, 1.0), order.append, -i)
+        for _ in range(600):
+            scheduler.advance(1 / 60)
+        return order
+
+    start = time.perf_counter()
+    scheduler = Scheduler()
+    rng = random.Random(0)
+    for i in range(100000):
+        scheduler.after(rng.uniform(0, 10), None)
+    insert = time.perf_counter() - start
+    start = time.perf_counter()
+    first = run(0)
+    elapsed = time.perf_counter() - start
+    print(f'100k inserts: {insert * 1000:.1f}ms, 100k timers + 1k repeating over 600 steps: {elapsed * 1000:.1f}ms, '
+          f'{len(first)} callbacks, deterministic: {first == run(0)}')
+
+if __name__ == '__main__':
+    test()
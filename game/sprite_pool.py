@@ -0,0 +1,165 @@
+"""
+sprite_pool.py - 使い捨てスプライト(障害物・弾など)のオブジェクトプール
+
+毎回newしてkill()すると、画像の読み込みとGCが毎フレーム走る。
+SpritePoolは使い終わったスプライトを取っておき、acquire()でreset()し直して再利用する。
+
+- PooledSprite: プールで使うスプライトの基底クラス。reset()で状態を作り直し、kill()の代わりにrelease()で返す
+- load_frames(): アニメーションのフレームのリストを1回だけ作り、全インスタンスで共有する
+- SpritePool.stats(): 作った数・再利用した数・使用中・待機中などの統計
+- Projectile: バトル画面の弾などに使える、まっすぐ飛んで寿命か画面外で戻るスプライト
+"""
+
+import pygame
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from .resource_manager import ResourceManager, resources
+
+class PooledSprite(pygame.sprite.Sprite):
+    def __init__(self) -> None:
+        super().__init__()
+        self.pool: Optional['SpritePool'] = None
+        self.in_use = False
+
+    def reset(self, *args, **kwargs) -> None:
+        """acquire()のたびに呼ばれる。__init__の代わりに状態をすべてここで設定する(サブクラスで拡張する)"""
+        pass
+
+    def release(self) -> None:
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            self.kill()
+
+class SpritePool():
+    def __init__(self, factory: Callable[[], PooledSprite], *groups: pygame.sprite.AbstractGroup,
+                 prewarm: int = 0, max_free: Optional[int] = None) -> None:
+        self.factory = factory
+        self.groups = groups  # acquire()したスプライトを入れるグループ
+        self.max_free = max_free
+        self.free: List[PooledSprite] = []
+        self.created = 0
+        self.reused = 0
+        self.released = 0
+        self.discarded = 0
+        self.active = 0
+        self.peak = 0
+        for _ in range(prewarm):
+            self.free.append(self.create())
+
+    def create(self) -> PooledSprite:
+        sprite = self.factory()
+        sprite.pool = self
+        self.created += 1
+        return sprite
+
+    def acquire(self, *args, **kwargs) -> PooledSprite:
+        if self.free:
+            sprite = self.free.pop()
+            self.reused += 1
+        else:
+            sprite = self.create()
+        sprite.reset(*args, **kwargs)
+        sprite.in_use = True
+        sprite.add(*self.groups)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        return sprite
+
+    def release(self, sprite: PooledSprite) -> None:
+        if not sprite.in_use:
+            return  # 二重に返しても1回分だけ
+        sprite.in_use = False
+        sprite.kill()
+        self.active -= 1
+        self.released += 1
+        if self.max_free is not None and len(self.free) >= self.max_free:
+            self.discarded += 1
+            return
+        self.free.append(sprite)
+
+    def release_all(self) -> None:
+        for group in self.groups:
+            for sprite in group.sprites():
+                if isinstance(sprite, PooledSprite) and sprite.pool is self:
+                    self.release(sprite)
+
+    def stats(self) -> Dict[str, int]:
+        return {'created': self.created, 'reused': self.reused, 'released': self.released,
+                'discarded': self.discarded, 'active': self.active, 'free': len(self.free), 'peak': self.peak}
+
+#---- フレームの共有 ----
+frame_lists: Dict[Tuple[Tuple[str, ...], Optional[Tuple[int, int]]], List[pygame.Surface]] = {}
+
+def load_frames(names: Sequence[str], size: Optional[Tuple[int, int]] = None,
+                resource_manager: ResourceManager = resources) -> List[pygame.Surface]:
+    """同じ画像の並びには同じリストを返す(インスタンスごとに読み込まない)"""
+    key = (tuple(names), tuple(size) if size else None)
+    frames = frame_lists.get(key)
+    if frames is None:
+        frames = [resource_manager.load_image(name, size) for name in names]
+        frame_lists[key] = frames
+    return frames
+
+class Projectile(PooledSprite):
+    """まっすぐ飛ぶ弾。lifetime秒たつかboundsの外に出たらプールに戻る"""
+    def reset(self, frames: List[pygame.Surface], pos: Tuple[float, float], velocity: Tuple[float, float],
+              lifetime: float = 2.0, bounds: Optional[pygame.Rect] = None, frame_time: float = 0.1,
+              damage: int = 0) -> None:
+        self.frames = frames
+        self.frame = 0.0
+        self.frame_time = frame_time
+        self.image = frames[0]
+        self.x, self.y = pos
+        self.vx, self.vy = velocity
+        self.lifetime = lifetime
+        self.bounds = bounds
+        self.damage = damage
+        self.rect = self.image.get_rect(center=(int(self.x), int(self.y)))
+
+    def update(self, dt: float) -> None:
+        self.lifetime -= dt
+        self.x += self.vx * dt
+        self.y += self.vy * dt
+        self.rect.center = (int(self.x), int(self.y))
+        if len(self.frames) > 1:
+            self.frame = (self.frame + dt / self.frame_time) % len(self.frames)
+            self.image = self.frames[int(self.frame)]
+        if self.lifetime <= 0 or (self.bounds is not None and not self.bounds.colliderect(self.rect)):
+            self.release()
+
+def test():
+    import random
+    import time
+    from .constants import SCREEN_WIDTH, SCREEN_HEIGHT
+    pygame.init()
+    rng = random.Random(0)
+    frames = [pygame.Surface((8, 8), pygame.SRCALPHA) for _ in range(2)]
+    bounds = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+
+    def run(spawn) -> float:
+        group = pygame.sprite.Group()
+        start = time.perf_counter()
+        for _ in range(600):
+            for _ in range(20):
+                spawn(group, (rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT)),
+                      (rng.uniform(-300, 300), rng.uniform(-300, 300)))
+            group.update(1 / 60)
+        return time.perf_counter() - start
+
+    def spawn_new(group, pos, velocity):
+        projectile = Projectile()
+        projectile.reset([pygame.Surface((8, 8), pygame.SRCALPHA) for _ in range(2)], pos, velocity, 1.0, bounds)
+        group.add(projectile)
+
+    pools = {}
+    def spawn_pooled(group, pos, velocity):
+        if group not in pools:
+            pools[group] = SpritePool(Projectile, group, prewarm=64)
+        pools[group].acquire(frames, pos, velocity, 1.0, bounds)
+
+    print(f'600 frames x 20 projectiles, new each time: {run(spawn_new) * 1000:.1f}ms')
+    print(f'600 frames x 20 projectiles, pooled:        {run(spawn_pooled) * 1000:.1f}ms')
+    print(next(iter(pools.values())).stats())
+
+if __name__ == '__main__':
+    test()
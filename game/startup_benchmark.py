@@ -0,0 +1,117 @@
+"""
+startup_benchmark.py - 起動時間のベンチマーク
+
+新しいPythonプロセスで測る(同じプロセスだとimport済みのモジュールが効いてしまうため)。
+- import time: python -X importtime の出力から、importにかかった時間の合計と重いモジュール
+- time to first frame: main.pyと同じ順番(pygame.init → set_mode → 1回目のflip)で
+  最初のフレームを出すまでの時間と、GameManagerを作り終えて操作できるまでの時間、
+  warmupスレッドが遅延サブシステムを作り終えるまでの時間
+どれも何回か測って中央値を出す。
+
+    python -m game.startup_benchmark --runs 5 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORTTIME = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)')
+
+# main.pyの起動部分と同じ順番。結果はJSONで1行出す
+FIRST_FRAME = '''
+import time
+start = time.perf_counter()
+import json, pygame
+from game.constants import SCREEN_WIDTH, SCREEN_HEIGHT, SCENE_LIST, TITLE
+pygame.mixer.pre_init(44100, -16, 2)
+pygame.init()
+screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+pygame.display.set_caption(TITLE)
+screen.fill((0, 0, 0))
+pygame.display.flip()
+first_frame = time.perf_counter() - start
+from game.game_manager import GameManager
+from game.profiler import profiler
+game_manager = GameManager(screen, SCENE_LIST)
+ready = time.perf_counter() - start
+game_manager.warmup().join()
+warm = time.perf_counter() - start
+print(json.dumps({'first_frame_ms': first_frame * 1000, 'ready_ms': ready * 1000, 'warm_ms': warm * 1000}))
+'''
+
+def environment() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault('SDL_VIDEODRIVER', 'dummy')
+    env.setdefault('SDL_AUDIODRIVER', 'dummy')
+    env['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+    return env
+
+def import_times(statement: str = 'import game.game_manager') -> Dict:
+    """-X importtimeの結果。cumulativeはそのモジュールが読み込んだものも含む(マイクロ秒)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], cwd=ROOT,
+                            env=environment(), capture_output=True, text=True, check=True)
+    modules = []
+    total = 0
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        if match is None:
+            continue
+        own, cumulative, indent, name = match.groups()
+        modules.append((name, int(own), int(cumulative)))
+        if len(indent) == 1:  # 一番外側のimportだけ足すと合計になる
+            total += int(cumulative)
+    return {'total_ms': total / 1000, 'modules': modules}
+
+def first_frame() -> Dict[str, float]:
+    result = subprocess.run([sys.executable, '-c', FIRST_FRAME], cwd=ROOT, env=environment(),
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def run(runs: int = 5, top: int = 10) -> Dict:
+    report: Dict = {'import': {}, 'startup': {}}
+    for statement in ('import game', 'import game.game_manager', 'import game.profiler'):
+        samples = [import_times(statement) for _ in range(runs)]
+        modules = samples[-1]['modules']
+        report['import'][statement] = {
+            'total_ms': statistics.median(sample['total_ms'] for sample in samples),
+            'slowest': [(name, cumulative / 1000) for name, _, cumulative in
+                        sorted(modules, key=lambda module: -module[2])[:top]],
+        }
+    samples = [first_frame() for _ in range(runs)]
+    for key in samples[0]:
+        report['startup'][key] = statistics.median(sample[key] for sample in samples)
+    report['meta'] = {'runs': runs, 'python': sys.version.split()[0]}
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='startup time benchmark (import time and time to first frame)')
+    parser.add_argument('--runs', type=int, default=5, help='processes per measurement (median is reported)')
+    parser.add_argument('--top', type=int, default=10, help='slowest modules to list')
+    parser.add_argument('--output', help='write the report JSON here')
+    args = parser.parse_args(argv)
+
+    report = run(args.runs, args.top)
+    for statement, result in report['import'].items():
+        print(f"{statement:<28} {result['total_ms']:>8.1f} ms")
+        for name, milliseconds in result['slowest'][:5]:
+            print(f'    {name:<40} {milliseconds:>8.1f} ms')
+    for key, milliseconds in report['startup'].items():
+        print(f'{key:<28} {milliseconds:>8.1f} ms')
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 0
+
+def test():
+    report = run(runs=2, top=3)
+    print({statement: round(result['total_ms'], 1) for statement, result in report['import'].items()})
+    print({key: round(value, 1) for key, value in report['startup'].items()})
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+text_cache.py - 文字描画(Font.render)のキャッシュ
+
+Font.renderは毎フレーム呼ぶと重いので、(font, 文字列, 色, antialias)をキーに
+描画済みSurfaceをLRUで保持する。
+Labelは表示する値をgetterで受け取り、値が変わったときだけ描画し直す。
+"""
+
+import pygame
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+class TextCache():
+    def __init__(self, max_entries: int = 512) -> None:
+        self.surfaces: 'OrderedDict[Tuple, pygame.Surface]' = OrderedDict()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font: pygame.font.Font, text: str, color: Tuple[int, ...],
+               antialias: bool = True) -> pygame.Surface:
+        key = (font, text, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self) -> None:
+        self.surfaces.clear()
+
+    def __len__(self) -> int:
+        return len(self.surfaces)
+
+#ゲーム全体で共有するキャッシュ
+TEXT_CACHE = TextCache()
+
+def render_text(font: pygame.font.Font, text: str, color: Tuple[int, ...],
+                antialias: bool = True) -> pygame.Surface:
+    return TEXT_CACHE.render(font, text, color, antialias)
+
+class Label():
+    def __init__(self, font: pygame.font.Font, getter: Callable[[], Any], color: Tuple[int, ...],
+                 pos: Tuple[int, int], fmt: str = '{}', anchor: str = 'topleft',
+                 antialias: bool = True, cache: Optional[TextCache] = None) -> None:
+        self.font = font
+        self.getter = getter
+        self.color = color
+        self.pos = pos
+        self.fmt = fmt
+        self.anchor = anchor  # rectの属性名 ('topleft', 'center', 'midtop' など)
+        self.antialias = antialias
+        self.cache = cache if cache is not None else TEXT_CACHE
+        self.value = object()  # 最初のupdateで必ず描画されるように
+        self.surface: Optional[pygame.Surface] = None
+        self.rect: Optional[pygame.Rect] = None
+        self.renders = 0
+
+    def update(self) -> bool:
+        """値が変わっていたら描画し直す。描画し直したらTrue"""
+        value = self.getter()
+        if value == self.value:
+            return False
+        self.value = value
+        text = self.fmt.format(*value) if isinstance(value, tuple) else self.fmt.format(value)
+        if text:
+            self.surface = self.cache.render(self.font, text, self.color, self.antialias)
+            self.rect = self.surface.get_rect(**{self.anchor: self.pos})
+        else:
+            self.surface = None
+            self.rect = None
+        self.renders += 1
+        return True
+
+    def draw(self, surface: pygame.Surface) -> None:
+        self.update()
+        if self.surface is not None:
+            surface.blit(self.surface, self.rect)
+
+def test():
+    import time
+    pygame.init()
+    font = pygame.font.Font(None, 36)
+    screen = pygame.Surface((800, 600))
+    hp = [100]
+    label = Label(font, lambda: (hp[0], 100), (255, 255, 255), (20, 20), fmt='HP: {}/{}')
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        screen.blit(font.render(f'HP: {hp[0]}/100', True, (255, 255, 255)), (20, 20))
+    render_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(1000):
+        if i % 100 == 0:
+            hp[0] -= 1
+        label.draw(screen)
+    label_time = time.perf_counter() - start
+    print(f'Font.render x1000: {render_time * 1000:.2f}ms, Label x1000: {label_time * 1000:.2f}ms ({label.renders} renders)')
+    print(f'cache: {len(TEXT_CACHE)} entries, hits {TEXT_CACHE.hits}, misses {TEXT_CACHE.misses}')
+
+if __name__ == '__main__':
+    test()
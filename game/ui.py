@@ -0,0 +1,293 @@
+"""
+ui.py - 保持型(retained mode)のUIウィジェットツリー
+
+ウィジェットは毎フレーム作り直さずに保持しておき、絶対座標は無効化されるまでキャッシュする。
+クリック判定は一様グリッドの空間インデックスで行うので、カーソル下のセルにある
+ウィジェットだけを調べればよい(ショップやインベントリのように数百スロットあっても軽い)。
+ホバー/押下の状態はUIManagerがまとめて管理する。
+"""
+
+import pygame
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from .constants import GRAY, WHITE
+from .text_cache import render_text
+from .resource_manager import ResourceManager, resources
+
+class Widget():
+    def __init__(self, rect, on_click: Optional[Callable[['Widget'], None]] = None) -> None:
+        self.local_rect = pygame.Rect(rect)  # 親からの相対座標
+        self.on_click = on_click
+        self.parent: Optional[Widget] = None
+        self.children: List[Widget] = []
+        self.manager: Optional[UIManager] = None
+        self.visible = True
+        self.enabled = True
+        self.hovered = False
+        self.pressed = False
+        self.order = 0  # 描画順(大きいほど手前)
+        self._rect: Optional[pygame.Rect] = None
+
+    @property
+    def rect(self) -> pygame.Rect:
+        if self._rect is None:
+            if self.parent is None:
+                self._rect = self.local_rect.copy()
+            else:
+                self._rect = self.local_rect.move(self.parent.rect.topleft)
+        return self._rect
+
+    def add(self, child: 'Widget') -> 'Widget':
+        child.parent = self
+        self.children.append(child)
+        child.attach(self.manager)
+        return child
+
+    def remove(self, child: 'Widget') -> None:
+        self.children.remove(child)
+        child.detach()
+        child.parent = None
+
+    def clear(self) -> None:
+        for child in self.children.copy():
+            self.remove(child)
+
+    def attach(self, manager: Optional['UIManager']) -> None:
+        self.manager = manager
+        for child in self.children:
+            child.attach(manager)
+        self.invalidate()
+        if manager is not None:
+            manager.structure_dirty = True
+
+    def detach(self) -> None:
+        if self.manager is not None:
+            self.manager.forget(self)
+        self.manager = None
+        for child in self.children:
+            child.detach()
+
+    def move_to(self, pos: Tuple[int, int]) -> None:
+        self.local_rect.topleft = pos
+        self.invalidate()
+
+    def set_visible(self, visible: bool) -> None:
+        self.visible = visible
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """自分と子孫のキャッシュした座標を捨てて、空間インデックスの更新を予約する"""
+        self.clear_layout()
+        if self.manager is not None:
+            self.manager.dirty.add(self)
+
+    def clear_layout(self) -> None:
+        self._rect = None
+        for child in self.children:
+            child.clear_layout()
+
+    def contains(self, pos: Tuple[int, int]) -> bool:
+        return self.rect.collidepoint(pos)
+
+    def is_shown(self) -> bool:
+        widget = self
+        while widget is not None:
+            if not widget.visible:
+                return False
+            widget = widget.parent
+        return True
+
+    def draw(self, surface: pygame.Surface) -> None:
+        if not self.visible:
+            return
+        self.draw_self(surface)
+        for child in self.children:
+            child.draw(surface)
+
+    def draw_self(self, surface: pygame.Surface) -> None:
+        pass
+
+class Button(Widget):
+    def __init__(self, rect, text: str, font: pygame.font.Font, color=GRAY, text_color=WHITE,
+                 on_click: Optional[Callable[[Widget], None]] = None) -> None:
+        super().__init__(rect, on_click)
+        self.text = text
+        self.font = font
+        self.color = color
+        self.text_color = text_color
+        self.hover_color = tuple(min(255, c + 40) for c in color)
+
+    def draw_self(self, surface: pygame.Surface) -> None:
+        pygame.draw.rect(surface, self.hover_color if self.hovered else self.color, self.rect)
+        text_surface = render_text(self.font, self.text, self.text_color)
+        surface.blit(text_surface, text_surface.get_rect(center=self.rect.center))
+
+class ImageButton(Widget):
+    """画像ボタン。透明部分はクリックできない(マスクで判定)"""
+    def __init__(self, center: Tuple[int, int], image_default: str, image_hover: str, size: Tuple[int, int],
+                 on_click: Optional[Callable[[Widget], None]] = None,
+                 resource_manager: Optional[ResourceManager] = None) -> None:
+        resource_manager = resource_manager if resource_manager is not None else resources
+        # 画像とマスクは(画像, サイズ)ごとに共有される
+        self.image_default = resource_manager.load_image(image_default, size)
+        self.image_hover = resource_manager.load_image(image_hover, size)
+        self.mask = resource_manager.get_mask(image_default, size)
+        super().__init__(self.image_default.get_rect(center=center), on_click)
+
+    def contains(self, pos: Tuple[int, int]) -> bool:
+        rect = self.rect
+        if not rect.collidepoint(pos):
+            return False
+        return bool(self.mask.get_at((pos[0] - rect.x, pos[1] - rect.y)))
+
+    def draw_self(self, surface: pygame.Surface) -> None:
+        surface.blit(self.image_hover if self.hovered else self.image_default, self.rect)
+
+class SpatialGrid():
+    def __init__(self, cell_size: int = 64) -> None:
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], Set[Widget]] = {}
+        self.widget_cells: Dict[Widget, List[Tuple[int, int]]] = {}
+
+    def insert(self, widget: Widget, rect: pygame.Rect) -> None:
+        self.remove(widget)
+        if rect.width <= 0 or rect.height <= 0:
+            return
+        size = self.cell_size
+        keys = [(cx, cy)
+                for cx in range(rect.left // size, (rect.right - 1) // size + 1)
+                for cy in range(rect.top // size, (rect.bottom - 1) // size + 1)]
+        for key in keys:
+            self.cells.setdefault(key, set()).add(widget)
+        self.widget_cells[widget] = keys
+
+    def remove(self, widget: Widget) -> None:
+        for key in self.widget_cells.pop(widget, ()):
+            cell = self.cells[key]
+            cell.discard(widget)
+            if not cell:
+                del self.cells[key]
+
+    def query_point(self, pos: Tuple[int, int]) -> Set[Widget]:
+        key = (pos[0] // self.cell_size, pos[1] // self.cell_size)
+        return self.cells.get(key, set())
+
+class UIManager():
+    def __init__(self, size: Tuple[int, int], cell_size: int = 64) -> None:
+        self.grid = SpatialGrid(cell_size)
+        self.dirty: Set[Widget] = set()
+        self.structure_dirty = True
+        self.hovered: Optional[Widget] = None
+        self.pressed: Optional[Widget] = None
+        self.root = Widget((0, 0, size[0], size[1]))
+        self.root.attach(self)
+
+    def forget(self, widget: Widget) -> None:
+        self.grid.remove(widget)
+        self.dirty.discard(widget)
+        if self.hovered is widget:
+            self.hovered = None
+        if self.pressed is widget:
+            self.pressed = None
+        self.structure_dirty = True
+
+    def refresh(self) -> None:
+        """無効化されたウィジェットだけ空間インデックスを更新する"""
+        if self.structure_dirty:
+            self.structure_dirty = False
+            order = 0
+            stack = [self.root]
+            while stack:
+                widget = stack.pop()
+                widget.order = order
+                order += 1
+                stack.extend(reversed(widget.children))
+        while self.dirty:
+            stack = [self.dirty.pop()]
+            while stack:
+                widget = stack.pop()
+                self.dirty.discard(widget)
+                if widget.on_click is not None and widget.is_shown():
+                    self.grid.insert(widget, widget.rect)
+                else:
+                    self.grid.remove(widget)
+                stack.extend(widget.children)
+
+    def hit_test(self, pos: Tuple[int, int]) -> Optional[Widget]:
+        self.refresh()
+        hit = None
+        for widget in self.grid.query_point(pos):
+            if widget.enabled and widget.contains(pos):
+                if hit is None or widget.order > hit.order:
+                    hit = widget
+        return hit
+
+    def set_hovered(self, widget: Optional[Widget]) -> None:
+        if widget is self.hovered:
+            return
+        if self.hovered is not None:
+            self.hovered.hovered = False
+        self.hovered = widget
+        if widget is not None:
+            widget.hovered = True
+
+    def handle_event(self, event: pygame.event.Event) -> Optional[Widget]:
+        """クリックされたウィジェットがあれば返す(on_clickも呼ぶ)
+        ホバーはMOUSEMOTIONのときだけ、クリックはイベント自身のposで判定する"""
+        if event.type == pygame.MOUSEMOTION:
+            self.set_hovered(self.hit_test(event.pos))
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            widget = self.hit_test(event.pos)
+            self.set_hovered(widget)
+            self.pressed = widget
+            if widget is not None:
+                widget.pressed = True
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            widget = self.hit_test(event.pos)
+            pressed = self.pressed
+            self.pressed = None
+            if pressed is not None:
+                pressed.pressed = False
+            if widget is not None and widget is pressed:
+                widget.on_click(widget)
+                return widget
+        return None
+
+    def draw(self, surface: pygame.Surface) -> None:
+        self.root.draw(surface)
+
+def click(manager: UIManager, pos: Tuple[int, int]) -> Optional[Widget]:
+    """押して離すまでをまとめて送る(テストやbotの入力用)"""
+    manager.handle_event(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=1))
+    return manager.handle_event(pygame.event.Event(pygame.MOUSEBUTTONUP, pos=pos, button=1))
+
+def test():
+    import time
+    pygame.init()
+    font = pygame.font.Font(None, 24)
+    manager = UIManager((800, 600))
+    clicked = []
+    panel = manager.root.add(Widget((50, 50, 700, 500)))
+    for row in range(20):
+        for col in range(25):
+            panel.add(Button((col * 28, row * 25, 26, 23), '', font,
+                             on_click=lambda w, n=row * 25 + col: clicked.append(n)))
+    print(f'hit: {click(manager, (50 + 28 * 3 + 5, 50 + 25 * 2 + 5)) is not None}, clicked {clicked}')
+
+    start = time.perf_counter()
+    for i in range(10000):
+        manager.hit_test((50 + i % 700, 50 + i % 500))
+    print(f'10000 hit tests over {len(panel.children)} widgets: {(time.perf_counter() - start) * 1000:.1f}ms')
+
+    panel.move_to((0, 0))
+    print(f'after move: {click(manager, (28 * 3 + 5, 25 * 2 + 5)) is not None}, clicked {clicked}')
+
+    start_button = manager.root.add(ImageButton((150, 250), 'buttons/start_button0.png', 'buttons/start_button1.png',
+                                                (100, 200), on_click=lambda w: clicked.append('start')))
+    exit_button = manager.root.add(ImageButton((150, 450), 'buttons/exit_button0.png', 'buttons/exit_button1.png',
+                                               (100, 200), on_click=lambda w: clicked.append('exit')))
+    panel.set_visible(False)
+    print(f'image button center: {click(manager, (150, 250)) is start_button}, '
+          f'corner: {click(manager, exit_button.rect.topleft) is exit_button}, clicked {clicked}')
+
+if __name__ == '__main__':
+    test()
@@ -1,38 +1,75 @@
+import time
+start_time = time.perf_counter()
+import os
 import pygame
 import sys
-from game import GameManager, SceneManager, InputManager, RenderManager
 from game.constants import SCREEN_WIDTH, SCREEN_HEIGHT, FPS, TITLE, SCENE_LIST
 
 class Game:
     def __init__(self):
+        # ミキサーもここ(メインスレッド)で初期化する。AudioManagerはwarmupスレッドで作られる
+        pygame.mixer.pre_init(44100, -16, 2)
         pygame.init()
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         self.scene_list = SCENE_LIST
         pygame.display.set_caption(TITLE)
+        # まずウィンドウを出してから、残りを読み込む
+        self.screen.fill((0, 0, 0))
+        pygame.display.flip()
+        first_frame = time.perf_counter()
+        from game.game_manager import GameManager
+        from game.profiler import profiler, PerformanceOverlay
+        self.profiler = profiler
         self.clock = pygame.time.Clock()
         self.game_manager = GameManager(self.screen, self.scene_list)
+        # 起動の区間もtraceに残す(最初のフレームまでと、操作できるようになるまで)
+        profiler.record('first_frame', start_time, first_frame)
+        profiler.record('startup', start_time, time.perf_counter())
+        # PROFILE_TRACE=trace.json のように書き出し先を指定したら、最初から最後まで計測してChrome traceを保存する
+        self.trace_path = os.environ.get('PROFILE_TRACE')
+        if self.trace_path:
+            profiler.set_enabled(True)
+        self.warmup_thread = self.game_manager.warmup()
+        # F3でフレーム時間のオーバーレイを表示(表示中だけ計測する)
+        self.overlay = PerformanceOverlay(profiler, pygame.font.Font(None, 18), pygame.Rect(0, 0, 360, 120), 1000 / FPS)
+        self.game_manager.input_manager.add_key_handler(pygame.K_F3, self.toggle_overlay)
+
+    def toggle_overlay(self):
+        self.overlay.toggle()
+        if self.trace_path:  # traceを取っているときはオーバーレイを消しても計測を続ける
+            self.profiler.set_enabled(True)
 
     def run(self):
+        profiler = self.profiler
         running = True
         while running:
+            profiler.begin_frame()
             # イベント処理
-            self.game_manager.handle_event()
+            with profiler.scope('handle_event'):
+                self.game_manager.handle_event()
 
             # ゲーム状態の更新
-            self.game_manager.update()
+            with profiler.scope('update'):
+                self.game_manager.update()
 
             #quitか確認
             if self.game_manager.running == False:
                 running = False
 
             # 画面描画
-            self.screen.fill((0, 0, 0))  # 画面を黒でクリア
-            self.game_manager.draw()
-            pygame.display.flip()
+            with profiler.scope('draw'):
+                self.screen.fill((0, 0, 0))  # 画面を黒でクリア
+                self.game_manager.draw()
+                self.overlay.draw(self.screen)
+            with profiler.scope('present'):
+                self.game_manager.present()
+            profiler.end_frame()
 
-            # フレームレートの制御
+            # フレームレートの制御(待ち時間はフレーム時間に含めない)
             self.clock.tick(FPS)
 
+        if self.trace_path and profiler.events:
+            profiler.export_chrome_trace(self.trace_path)
         pygame.quit()
         sys.exit()
 
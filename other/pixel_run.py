@@ -3,11 +3,29 @@
 Created on Tue Sep 10 12:52:48 2024
 
 @author: rikuto.yamada
+
+リポジトリのルートで python -m other.pixel_run として起動する(gameパッケージを使うため)。
+画像・音・フォントは今までどおり作業ディレクトリのgraphics/, audio/, font/から読む。
 """
 
 import pygame
 from sys import exit
 from random import randint, choice
+from game.sprite_pool import SpritePool, load_frames
+from game.entity_store import EntityGroup, EntitySprite, EntityStore
+from game.resource_manager import ResourceManager
+from game.collision import CollisionSystem
+from game.scheduler import Scheduler
+from game.parallax import ParallaxBackground, ParallaxLayer
+from game.audio_manager import AudioManager
+
+#画像はgraphics/からの相対パス。フレームのリストは全障害物で共有する
+runner_resources = ResourceManager('.')
+OBSTACLE_FRAMES = {'fly': ['graphics/fly/fly1.png', 'graphics/fly/fly2.png'],
+                   'snail': ['graphics/snail/snail1.png', 'graphics/snail/snail2.png']}
+#障害物の位置とアニメーションは配列でまとめて更新する
+obstacle_store = EntityStore()
+obstacle_frame_sets = {}
 
 class Player(pygame.sprite.Sprite):
     def __init__(self):
@@ -20,14 +38,12 @@ class Player(pygame.sprite.Sprite):
         self.image = self.player_walk[self.player_index]
         self.rect = self.image.get_rect(midbottom = (80,300))
         self.gravity = 0
-        self.jump_sound = pygame.mixer.Sound('audio/jump.mp3')
-        self.jump_sound.set_volume(0.5)
         
     def player_input(self):
         keys = pygame.key.get_pressed()
         if keys[pygame.K_SPACE] and self.rect.bottom >= 300:
             self.gravity = -20
-            self.jump_sound.play()
+            audio.play('jump')
             
     def apply_gravity(self):
         self.gravity += 1
@@ -48,47 +64,25 @@ class Player(pygame.sprite.Sprite):
         self.apply_gravity()
         self.animation_state()
           
-class Obstacle(pygame.sprite.Sprite):
-    def __init__(self,type):
-        super().__init__()
-        
-        if type == 'fly':
-            fly_frame1 = pygame.image.load('graphics/fly/fly1.png').convert_alpha()
-            fly_frame2 = pygame.image.load('graphics/fly/fly2.png').convert_alpha()
-            self.frames = [fly_frame1, fly_frame2]
-            y_pos = 210
-        else:
-            snail_frame1 = pygame.image.load('graphics/snail/snail1.png').convert_alpha()
-            snail_frame2 = pygame.image.load('graphics/snail/snail2.png').convert_alpha()
-            self.frames = [snail_frame1, snail_frame2]
-            y_pos = 300
-            
+class Obstacle(EntitySprite):
+    #プールから使い回すので、画像の読み込みはせず状態だけ作り直す
+    def reset(self,type):
+        if type not in obstacle_frame_sets:
+            frames = load_frames(OBSTACLE_FRAMES[type], resource_manager = runner_resources)
+            obstacle_frame_sets[type] = obstacle_store.register_frames(frames)
+        frame_set = obstacle_frame_sets[type]
+        width, height = obstacle_store.frames[obstacle_store.set_start[frame_set]].get_size()
+        y_pos = 210 if type == 'fly' else 300
+        speed = -8 if type == 'fly' else -6
         self.type = type
-        self.index = 0
-        self.image = self.frames[self.index]
-        self.rect = self.image.get_rect(midbottom = (randint(900,1100), y_pos))
-    
-        
-    def animation_state(self):
-        self.index += 0.1
-        if self.index >= len(self.frames):self.index = 0
-        self.image = self.frames[int(self.index)]
-        
-    def movement(self):
-        if self.type == 'fly':
-            self.rect.x -= 8
-        else:
-            self.rect.x -= 6
-        
-    def destroy(self):
-        if self.rect.x <= -100:
-            self.kill()
+        super().reset(obstacle_store, frame_set, randint(900,1100) - width // 2, y_pos - height,
+                      vx = speed, phase_speed = 0.1)
 
-        
-    def update(self):
-        self.animation_state()
-        self.movement()
-        self.destroy()
+def obstacle_update():
+    #移動とアニメーションは全障害物まとめて1回。画面の左に出たものはプールに戻す
+    obstacle_store.update()
+    for obstacle in obstacle_store.owners_of(obstacle_store.outside(-100, float('inf'))):
+        obstacle.release()
         
 def display_score():
     current_time = int(pygame.time.get_ticks()/1000) - start_time
@@ -114,15 +108,12 @@ def obstacle_movement(obstacle_list):
         return []
     
 def collisions(player, obstacle):
-    if obstacle:
-        for obstacle_rect in obstacle:
-            if player.colliderect(obstacle_rect):
-                return False
-    return True
+    #collidelistはC側で全矩形を調べる(Pythonのループより速い)
+    return player.collidelist(obstacle) == -1
 
 def collision_sprite():
-    if pygame.sprite.spritecollide(player.sprite, obstacle_group, False):
-        obstacle_group.empty()
+    if collision_system.collide_sprite(player.sprite, obstacle_group):
+        obstacle_pool.release_all()
         return False
     else:
         return True
@@ -146,14 +137,21 @@ clock = pygame.time.Clock()
 test_font = pygame.font.Font('font/Pixeltype.ttf', 50) #font type, font size
 game_active = False
 start_time = 0
+#効果音は1回だけデコードして共有。ジャンプ音は押しっぱなしでも0.25秒に1回、同時に1つまで
+audio = AudioManager(channels = 8, asset_dir = '.')
+audio.load('jump', 'audio/jump.mp3', volume = 0.5, min_interval = 0.25, max_instances = 1)
 
 player = pygame.sprite.GroupSingle()
 player.add(Player())
 
-obstacle_group = pygame.sprite.Group()
+obstacle_group = EntityGroup(obstacle_store)
+obstacle_pool = SpritePool(Obstacle, obstacle_group, prewarm = 8)
+collision_system = CollisionSystem()
 
 sky_surf = pygame.image.load('graphics/Sky.png').convert()
 ground_surf = pygame.image.load('graphics/ground.png').convert()
+#空は少しだけ、地面は障害物(snail)と同じ速さで流す
+background = ParallaxBackground((800,400), [ParallaxLayer(sky_surf, 0.1), ParallaxLayer(ground_surf, 1.0, 300)])
 
 #obstacles
 snail_frame1 = pygame.image.load('graphics/snail/snail1.png').convert_alpha()
@@ -192,17 +190,26 @@ game_message = test_font.render('Press space to run', False,(111,196,169))
 game_message_rect = game_message.get_rect(center = (400,320))
 
 score = 0
-bg_music = pygame.mixer.Sound('audio/music.wav')
-bg_music.set_volume(0.3)
-bg_music.play(loops = -1)
+audio.play_music('audio/music.wav', volume = 0.3)
+
+#Timer(ゲーム中のフレームだけ1/60秒ずつ進むので、実時間やイベントキューに左右されない)
+def spawn_obstacle():
+    obstacle_pool.acquire(choice(['fly','snail','snail','snail']))
+
+def snail_animation():
+    global snail_index, snail_surf
+    snail_index = 1 - snail_index
+    snail_surf = snail_frames[snail_index]
+
+def fly_animation():
+    global fly_index, fly_surf
+    fly_index = 1 - fly_index
+    fly_surf = fly_frames[fly_index]
 
-#Timer
-obstacle_timer = pygame.USEREVENT + 1
-pygame.time.set_timer(obstacle_timer,1500)
-snail_animation_timer = pygame.USEREVENT +2
-pygame.time.set_timer(snail_animation_timer,400)
-fly_animation_timer = pygame.USEREVENT + 3
-pygame.time.set_timer(fly_animation_timer,150)
+scheduler = Scheduler()
+scheduler.every(1.5, spawn_obstacle)
+scheduler.every(0.4, snail_animation)
+scheduler.every(0.15, fly_animation)
 
 while True:
     for event in pygame.event.get():
@@ -222,37 +229,18 @@ while True:
                 game_active = True
                 start_time = int(pygame.time.get_ticks()/1000)
                 
-        if game_active:
-            if event.type == obstacle_timer:
-                obstacle_group.add(Obstacle(choice(['fly','snail','snail','snail'])))
-                
-            if event.type == snail_animation_timer:
-                if snail_index == 0: snail_index = 1
-                else: snail_index = 0
-                snail_surf = snail_frames[snail_index]
-                
-            if event.type == fly_animation_timer:
-                if fly_index == 0:
-                    fly_index = 1
-                else:
-                    fly_index = 0
-                fly_surf = fly_frames[fly_index]
-                    
-                    
-                
-            
-                
     if game_active:
+        scheduler.advance(1 / 60)
         #screen.blit(test_surface,(0,350)) #structure,(coordinate)
-        screen.blit(sky_surf,(0,0))
-        screen.blit(ground_surf,(0,300))
+        background.scroll(6)
+        background.draw(screen)
         score = display_score()
         
         player.draw(screen)
         player.update()
         
         obstacle_group.draw(screen)
-        obstacle_group.update()
+        obstacle_update()
         
         #obstacle_movement
         obstacle_rect_list = obstacle_movement(obstacle_rect_list)